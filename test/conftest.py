@@ -0,0 +1,18 @@
+import pytest
+
+from txtpy.fabric import Fabric
+
+from corpus import makeCorpus, FEATURES
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory):
+    # the location of the dataset; tests must not modify it
+
+    return makeCorpus(tmp_path_factory.mktemp("corpus"))
+
+
+@pytest.fixture(scope="session")
+def api(corpus):
+    TF = Fabric(locations=corpus, silent="deep")
+    return TF.load(FEATURES, silent="deep")
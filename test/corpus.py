@@ -0,0 +1,178 @@
+import random
+
+from txtpy.fabric import Fabric
+from txtpy.convert.walker import CV
+
+# A small synthetic dataset, made with Fabric.save:
+# words in phrases (some of them gapped), sentences, chapters and a book.
+
+WORDS = 600
+
+META = {
+    "": dict(source="synthetic"),
+    "otype": dict(valueType="str"),
+    "oslots": dict(valueType="str"),
+    "otext": {
+        "sectionTypes": "book,chapter",
+        "sectionFeatures": "book,chapter",
+        "fmt:text-orig-full": "{lex} ",
+    },
+    "sp": dict(valueType="str"),
+    "lex": dict(valueType="str"),
+    "num": dict(valueType="int"),
+    "book": dict(valueType="str"),
+    "chapter": dict(valueType="int"),
+    "mother": dict(valueType="str"),
+    "rel": dict(valueType="str", edgeValues=True),
+}
+
+FEATURES = "sp lex num mother rel"
+
+
+def makeCorpus(location, nWords=WORDS, seed=1):
+    rng = random.Random(seed)
+    otype = {}
+    oslots = {}
+    sp = {}
+    lex = {}
+    num = {}
+    book = {}
+    chapter = {}
+    for w in range(1, nWords + 1):
+        otype[w] = "word"
+        sp[w] = rng.choice(["verb", "noun", "adj", "prep", "art"])
+        lex[w] = f"L{rng.randrange(60)}"
+        num[w] = rng.randrange(10)
+    n = nWords
+
+    def add(nType, slots):
+        nonlocal n
+        n += 1
+        otype[n] = nType
+        oslots[n] = set(slots)
+        return n
+
+    book[add("book", range(1, nWords + 1))] = "Gen"
+    for c in range(0, nWords, 100):
+        ch = add("chapter", range(c + 1, min(nWords, c + 100) + 1))
+        book[ch] = "Gen"
+        chapter[ch] = c // 100 + 1
+
+    # node types occupy contiguous ranges of nodes, as in real datasets
+    sentences = []
+    phrases = []
+    w = 1
+    while w <= nWords:
+        e = min(nWords, w + rng.randrange(5, 25) - 1)
+        sentences.append(range(w, e + 1))
+        p = w
+        while p <= e:
+            pe = min(e, p + rng.randrange(1, 5) - 1)
+            slots = list(range(p, pe + 1))
+            if len(slots) >= 3 and rng.random() < 0.2:
+                slots.pop(1)
+            phrases.append((slots, rng.choice(["NP", "VP", "PP"])))
+            p = pe + 1
+        w = e + 1
+    for slots in sentences:
+        num[add("sentence", slots)] = len(slots)
+    for (slots, value) in phrases:
+        sp[add("phrase", slots)] = value
+
+    mother = {}
+    rel = {}
+    for k in range(100):
+        a = rng.randrange(1, n + 1)
+        b = rng.randrange(1, n + 1)
+        mother.setdefault(a, set()).add(b)
+        rel.setdefault(a, {})[b] = rng.choice(["x", "y", "z"])
+
+    TF = Fabric(locations=str(location), silent=True)
+    good = TF.save(
+        nodeFeatures=dict(
+            otype=otype, sp=sp, lex=lex, num=num, book=book, chapter=chapter
+        ),
+        edgeFeatures=dict(oslots=oslots, mother=mother, rel=rel),
+        metaData=META,
+        silent=True,
+    )
+    assert good
+    return str(location)
+
+
+# A conversion with CV.walk, with gapped and resumed nodes, edges
+# and unlinked nodes.
+
+
+def director(cv, nChapters=2, words=60, fail=False, dangling=False):
+    rng = random.Random(7)
+    book = cv.node("book")
+    cv.feature(book, book="B1")
+    for c in range(1, nChapters + 1):
+        ch = cv.node("chapter")
+        cv.feature(ch, chapter=c, book="B1")
+        s = None
+        ph = None
+        for w in range(words):
+            if w % 17 == 0:
+                if s:
+                    cv.terminate(s)
+                s = cv.node("sentence")
+                cv.feature(s, num=w)
+            if w % 4 == 0:
+                if ph:
+                    cv.terminate(ph)
+                ph = cv.node("phrase")
+                cv.feature(ph, sp=rng.choice(["NP", "VP"]))
+                if w % 24 == 0:
+                    # unlinked
+                    unlinked = cv.node("phrase")
+                    cv.terminate(unlinked)
+            slot = cv.slot()
+            cv.feature(slot, lex=f"L{rng.randrange(20)}", num=rng.randrange(9))
+            if dangling and c == 1 and w == 0:
+                # an edge to an unlinked node
+                cv.edge(slot, unlinked, rel="x")
+            if w % 11 == 0:
+                cv.edge(slot, ph, rel="x" if w % 2 else "y")
+            if w % 13 == 0:
+                cv.terminate(ph)
+                gap = cv.slot()
+                cv.feature(gap, lex="gap", num=0)
+                cv.resume(ph)
+            if fail and c == nChapters and w == words // 2:
+                raise RuntimeError("the director fails")
+        for n in (ph, s):
+            if n:
+                cv.terminate(n)
+        cv.terminate(ch)
+    cv.terminate(book)
+
+
+CONVERT_META = dict(
+    book=dict(), chapter=dict(), num=dict(), sp=dict(), lex=dict(), rel=dict()
+)
+
+CONVERT_OTEXT = {
+    "sectionTypes": "book,chapter",
+    "sectionFeatures": "book,chapter",
+    "fmt:text-orig-full": "{lex} ",
+}
+
+
+def convert(location, fail=False, dangling=False, **kwargs):
+    # returns the CV object and the outcome of walk()
+
+    TF = Fabric(locations=str(location), silent=True)
+    cv = CV(TF, silent=True)
+    good = cv.walk(
+        lambda cv: director(cv, fail=fail, dangling=dangling),
+        "word",
+        otext=CONVERT_OTEXT,
+        generic=dict(source="test"),
+        intFeatures={"chapter", "num"},
+        featureMeta=CONVERT_META,
+        warn=False,
+        **kwargs,
+    )
+    return (cv, good)
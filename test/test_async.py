@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from txtpy.fabric import Fabric
+
+TEMPLATE = """
+phrase sp=NP
+  word sp=noun
+"""
+
+
+class GatedExecutor(ThreadPoolExecutor):
+    # every job after the first two (the start and the first batch)
+    # waits for the gate when it is done, so that the executor is still busy
+    # with it for a while
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.jobs = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def submit(self, fn, *args, **kwargs):
+        self.jobs += 1
+        if self.jobs <= 2:
+            return super().submit(fn, *args, **kwargs)
+
+        def gated():
+            result = fn(*args, **kwargs)
+            self.entered.set()
+            self.gate.wait(10)
+            return result
+
+        return super().submit(gated)
+
+
+async def collect(S, template, **kwargs):
+    results = []
+    async for theseResults in S.asearch(template, **kwargs):
+        results.extend(theseResults)
+    return results
+
+
+def test_asearch_as_search(api):
+    results = asyncio.run(collect(api.S, TEMPLATE, batch=7))
+    assert results
+    assert sorted(results) == sorted(api.S.search(TEMPLATE))
+    assert asyncio.run(api.S.acount(TEMPLATE)) == len(results)
+
+
+def test_asearch_bad_template(api):
+    with pytest.raises(ValueError, match="nosuchtype"):
+        asyncio.run(collect(api.S, "nosuchtype\n"))
+
+
+def test_asearch_cancelled(corpus):
+    # features stay pinned until the executor has finished the batch
+    # that was underway when the consumer got cancelled
+
+    TF = Fabric(locations=corpus, silent="deep")
+    # sp is not requested, so it is loaded lazily
+    api = TF.load("lex", silent="deep", lazy=True)
+    residency = TF.residency
+    executor = GatedExecutor()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        first = asyncio.Event()
+        batches = []
+
+        async def consume():
+            async for theseResults in api.S.asearch(
+                TEMPLATE, batch=1, executor=executor
+            ):
+                batches.append(theseResults)
+                first.set()
+
+        task = asyncio.create_task(consume())
+        await first.wait()
+        await loop.run_in_executor(None, executor.entered.wait, 10)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert "sp" in residency.inUse
+
+        executor.gate.set()
+        for i in range(100):
+            if not residency.inUse:
+                break
+            await asyncio.sleep(0.01)
+        assert not residency.inUse
+        return batches
+
+    try:
+        assert asyncio.run(main())
+    finally:
+        executor.gate.set()
+        executor.shutdown()
@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+# atoms spun by means of the value index, against a filter over all nodes
+
+ATOMS = (
+    ("word sp=verb num>7", lambda v: v("sp") == "verb" and v("num") > 7),
+    ("word sp#verb num<3", lambda v: v("sp") != "verb" and v("num") < 3),
+    ("word sp~^n lex", lambda v: re.search("^n", v("sp")) and v("lex") is not None),
+    (
+        "word lex=L3|L4 sp=noun",
+        lambda v: v("lex") in {"L3", "L4"} and v("sp") == "noun",
+    ),
+    ("phrase sp#NP|PP", lambda v: v("sp") not in {"NP", "PP"}),
+    ("phrase sp*", lambda v: True),
+    ("phrase num# sp=VP", lambda v: v("num") is None and v("sp") == "VP"),
+    ("sentence num>12", lambda v: v("num") is not None and v("num") > 12),
+    ("sentence num<9", lambda v: v("num") is None or v("num") < 9),
+)
+
+
+def filtered(api, nodes, test):
+    F = api.F
+
+    def atom(n):
+        return test(lambda ft: getattr(F, ft).v(n))
+
+    return sorted((n,) for n in nodes if atom(n))
+
+
+@pytest.mark.parametrize("template,test", ATOMS)
+def test_atoms_as_filter(api, template, test):
+    nType = template.split()[0]
+    expected = filtered(api, api.F.otype.s(nType), test)
+    assert expected
+    assert sorted(api.S.search(template)) == expected
+
+
+@pytest.mark.parametrize("template,test", ATOMS)
+def test_atoms_in_set(api, template, test):
+    nType = template.split()[0]
+    nodes = set(api.F.otype.s(nType)[::3])
+    setTemplate = "mine" + template[len(nType) :]
+    expected = filtered(api, nodes, test)
+    assert sorted(api.S.search(setTemplate, sets=dict(mine=nodes))) == expected
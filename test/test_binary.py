@@ -0,0 +1,115 @@
+import os
+import threading
+
+import pytest
+
+import txtpy.core.data as dataModule
+from txtpy.core.data import Data, StreamedData, readBin, writeBin
+from txtpy.core.helpers import tempPath
+from txtpy.core.timestamp import Timestamp
+
+
+def silentTm():
+    tmObj = Timestamp()
+    tmObj.setSilent("deep")
+    return tmObj
+
+
+def test_temp_paths_are_unique():
+    paths = [tempPath("/x/sp.tfx")]
+
+    def add():
+        paths.append(tempPath("/x/sp.tfx"))
+
+    thread = threading.Thread(target=add)
+    thread.start()
+    thread.join()
+    assert len(set(paths)) == 2
+    assert all(p.startswith("/x/sp.tfx.") and p.endswith(".tmp") for p in paths)
+
+
+def test_concurrent_writers(tmp_path):
+    # writers of the same binary do not share a temporary file,
+    # every time the binary is complete
+
+    binPath = str(tmp_path / "sp.tfx")
+    versions = [{n: f"v{k}" for n in range(1, 2000)} for k in range(4)]
+    errors = []
+
+    def write(data):
+        try:
+            for i in range(10):
+                writeBin(binPath, "node", data, "str", False)
+                assert dict(readBin(binPath)) in versions
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(v,)) for v in versions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert os.listdir(tmp_path) == ["sp.tfx"]
+
+
+def test_failed_binary_leaves_no_temp_file(tmp_path, monkeypatch):
+    binPath = str(tmp_path / "sp.tfx")
+    writeBin(binPath, "node", {1: "a"}, "str", False)
+
+    def failingWrite(path, *args, **kwargs):
+        with open(path, "wb") as fh:
+            fh.write(b"half")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(dataModule, "writeMapped", failingWrite)
+    with pytest.raises(OSError):
+        writeBin(binPath, "node", {1: "b"}, "str", False)
+    assert os.listdir(tmp_path) == ["sp.tfx"]
+    assert dict(readBin(binPath)) == {1: "a"}
+
+
+def test_failed_feature_file_leaves_no_temp_file(tmp_path):
+    path = str(tmp_path / "sp.tf")
+    metaData = dict(valueType="str")
+    assert Data(path, silentTm(), data={1: "a"}, metaData=metaData).save()
+
+    class Failing(dict):
+        def items(self):
+            raise RuntimeError("cannot deliver")
+
+        def __iter__(self):
+            raise RuntimeError("cannot deliver")
+
+    with pytest.raises(RuntimeError):
+        Data(path, silentTm(), data=Failing({1: "b"}), metaData=metaData).save(
+            overwrite=True
+        )
+    assert os.listdir(tmp_path) == ["sp.tf"]
+    fObj = Data(path, silentTm())
+    assert fObj.load()
+    assert fObj.data[1] == "a"
+
+
+def test_oslots_with_missing_nodes_not_cached(tmp_path):
+    # the binary is given up without an error, and without leftovers
+    tmObj = silentTm()
+    errors = []
+    tmObj.error = lambda msg, **kwargs: errors.append(msg)
+
+    def items():
+        yield (4, ((1, 2),))
+        yield (6, ((3, 3),))
+
+    path = str(tmp_path / "oslots.tf")
+    data = Data(
+        path,
+        tmObj,
+        data=(StreamedData(items, ranged=True), 3, 6),
+        isEdge=True,
+        metaData=dict(valueType="str"),
+    )
+    assert data.save(cache=True)
+    assert errors == []
+    assert not os.path.exists(data.binPath)
+    assert os.listdir(data.binDir) == []
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from txtpy.advanced.highlight import getPassageHighlights
+from txtpy.advanced.search import runSearch, search
+from txtpy.search.searchexe import SearchExe
+
+TEMPLATE = """
+p:phrase
+  w:word
+  v:word
+w .lex. v
+w < v
+"""
+
+
+def test_run_search_features_of_its_own_query(api, monkeypatch):
+    # the features of the query come from its own search,
+    # not from whatever search S.exe holds
+
+    monkeypatch.setattr(api.S, "exe", SearchExe(api, "sentence"))
+    app = SimpleNamespace(api=api, sets=None)
+    (queryResults, messages, features) = runSearch(app, TEMPLATE)
+    assert not messages
+    assert queryResults
+    assert features == ((0, ()), (1, ("lex",)), (2, ("lex",)))
+    assert runSearch(app, TEMPLATE) == (queryResults, messages, features)
+
+
+def appOf(api):
+    TF = api.TF
+    setups = []
+    app = SimpleNamespace(
+        api=api,
+        sets=None,
+        info=TF.info,
+        isSilent=TF.isSilent,
+        setSilent=TF.setSilent,
+        displaySetup=lambda **kwargs: setups.append(kwargs),
+    )
+    return (app, setups)
+
+
+def test_app_search(api):
+    (app, setups) = appOf(api)
+    results = search(app, TEMPLATE, silent=True)
+    assert results == sorted(api.S.search(TEMPLATE), key=api.N.sortKeyTuple)
+    assert setups == [
+        dict(tupleFeatures=((0, ()), (1, ("lex",)), (2, ("lex",))))
+    ]
+    assert search(app, TEMPLATE, silent=True, sort=False) == list(
+        api.S.search(TEMPLATE)
+    )
+    assert search(app, TEMPLATE, silent=True, limit=5) == results[0:5]
+    # the canonical order comes from the search, sorted from its first node
+    assert api.S.exe.sort and api.S.exe.planRoot == 0
+
+
+def test_app_search_with_sort_key(api):
+    (app, setups) = appOf(api)
+
+    def key(r):
+        return (-r[0], r[1:])
+
+    results = search(app, TEMPLATE, silent=True, sort=key)
+    assert results == sorted(api.S.search(TEMPLATE), key=key)
+    assert search(app, TEMPLATE, silent=True, sort=key, limit=5) == results[0:5]
+
+
+def test_cache_argument_is_accepted(api):
+    (app, setups) = appOf(api)
+    expected = runSearch(app, TEMPLATE)
+    assert runSearch(app, TEMPLATE, {}) == expected
+    book = api.F.otype.s("book")[0]
+    highlights = getPassageHighlights(app, book, TEMPLATE, {})
+    assert highlights
+    assert highlights == getPassageHighlights(app, book, TEMPLATE)
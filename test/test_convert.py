@@ -0,0 +1,199 @@
+import functools
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from txtpy.fabric import Fabric
+from txtpy.convert.walker import CV
+from txtpy.core.data import Data, StreamedData
+from txtpy.core.helpers import rangesFromSet
+from txtpy.parameters import PACK_VERSION
+
+from corpus import convert
+
+
+def loadedFrom(location, features, monkeypatch):
+    # loads the features and tells for each feature whether it came
+    # from its binary (B) or from its .tf file (T)
+
+    sources = {}
+    readBin = Data._readDataBin
+    readTf = Data._readDataTf
+
+    def _readDataBin(self):
+        sources.setdefault(self.fileName, "B")
+        return readBin(self)
+
+    def _readDataTf(self, *args):
+        sources[self.fileName] = "T"
+        return readTf(self, *args)
+
+    monkeypatch.setattr(Data, "_readDataBin", _readDataBin)
+    monkeypatch.setattr(Data, "_readDataTf", _readDataTf)
+    TF = Fabric(locations=str(location), silent="deep")
+    api = TF.load(features, silent="deep")
+    return (api, sources)
+
+
+def test_convert_then_load_oslots_from_binary(tmp_path, monkeypatch):
+    (cv, good) = convert(tmp_path)
+    assert good
+    assert os.path.exists(f"{tmp_path}/.tf/{PACK_VERSION}/oslots.tfx")
+
+    (api, sources) = loadedFrom(tmp_path, "sp lex", monkeypatch)
+    assert sources["oslots"] == "B"
+    assert sources["otype"] == "B"
+
+    # the oslots handed to save are ranges of slots, in node order
+    (oslots, maxSlot, maxNode) = cv.edgeFeatures["oslots"]
+    assert type(oslots) is StreamedData and oslots.ranged
+    E = api.E
+    nodes = []
+    for (n, ranges) in oslots.items():
+        nodes.append(n)
+        slots = tuple(s for (b, e) in ranges for s in range(b, e + 1))
+        assert tuple(E.oslots.s(n)) == slots
+    assert nodes == list(range(maxSlot + 1, maxNode + 1))
+
+
+def test_spilled_oslots_from_binary(tmp_path, monkeypatch):
+    (cv, good) = convert(tmp_path / "data", spill=str(tmp_path / "spill"))
+    assert good
+    (api, sources) = loadedFrom(tmp_path / "data", "sp lex", monkeypatch)
+    assert sources["oslots"] == "B"
+
+
+def tfFiles(location):
+    # the contents of the .tf files, without the date of writing
+
+    return {
+        name: [
+            line
+            for line in open(os.path.join(location, name), encoding="utf8")
+            if not line.startswith("@dateWritten")
+        ]
+        for name in sorted(os.listdir(location))
+        if name.endswith(".tf") and os.path.isfile(os.path.join(location, name))
+    }
+
+
+def test_spilled_as_in_memory(tmp_path):
+    (cv, good) = convert(tmp_path / "memory")
+    assert good
+    (cv, good) = convert(tmp_path / "spilled", spill=str(tmp_path / "spill"))
+    assert good
+    expected = tfFiles(tmp_path / "memory")
+    assert "oslots.tf" in expected and "rel.tf" in expected
+    assert tfFiles(tmp_path / "spilled") == expected
+
+
+def beforeBySets(slotsA, slotsB):
+    # the canonical order as CV compared nodes before it had sort keys
+
+    if slotsA == slotsB:
+        return 0
+    aWithoutB = slotsA - slotsB
+    if not aWithoutB:
+        return 1
+    bWithoutA = slotsB - slotsA
+    if not bWithoutA:
+        return -1
+    return -1 if min(aWithoutB) < min(bWithoutA) else 1
+
+
+def test_canonical_key_as_comparator():
+    rng = random.Random(3)
+    maxSlot = 60
+    slotSets = {}
+    for seq in range(1, 400):
+        b = rng.randrange(1, maxSlot)
+        slots = set(range(b, min(maxSlot, b + rng.randrange(1, 12)) + 1))
+        if len(slots) > 2 and rng.random() < 0.3:
+            slots.discard(rng.choice(sorted(slots)[1:-1]))
+        slotSets[seq] = slots
+    # some nodes with the same slots, their order must be kept
+    slotSets[400] = set(slotSets[7])
+    slotSets[401] = set(slotSets[7])
+
+    cv = SimpleNamespace(
+        maxSlot=maxSlot,
+        oslots={
+            ("phrase", seq): [x for r in rangesFromSet(slots) for x in r]
+            for (seq, slots) in slotSets.items()
+        },
+    )
+    key = CV._canonical(cv, "phrase")
+    byKey = sorted(slotSets, key=key)
+    bySets = sorted(
+        slotSets,
+        key=functools.cmp_to_key(lambda a, b: beforeBySets(slotSets[a], slotSets[b])),
+    )
+    assert byKey == bySets
+
+
+def spillDirs(location):
+    return [name for name in os.listdir(location) if name.startswith("cv-")]
+
+
+def test_spill_is_removed(tmp_path):
+    spill = tmp_path / "spill"
+
+    (cv, good) = convert(tmp_path / "data", spill=str(spill))
+    assert good
+    assert spillDirs(spill) == []
+
+    (cv, good) = convert(tmp_path / "data2", spill=str(spill), generateTf=False)
+    assert good
+    assert spillDirs(spill) == []
+
+
+def test_spill_is_removed_after_failure(tmp_path):
+    spill = tmp_path / "spill"
+    with pytest.raises(RuntimeError):
+        convert(tmp_path / "data", fail=True, spill=str(spill))
+    assert spillDirs(spill) == []
+
+
+def test_spill_without_linked(tmp_path, monkeypatch):
+    # the slots are not at hand when spilling, the director cannot use them
+
+    spill = tmp_path / "spill"
+    terminate = CV.terminate
+
+    def terminateLinked(cv, node):
+        cv.linked(node)
+        terminate(cv, node)
+
+    monkeypatch.setattr(CV, "terminate", terminateLinked)
+    with pytest.raises(RuntimeError, match="linked"):
+        convert(tmp_path / "data", spill=str(spill))
+    assert spillDirs(spill) == []
+    (cv, good) = convert(tmp_path / "data2")
+    assert good
+
+
+def test_dangling_edge_in_both_modes(tmp_path, monkeypatch):
+    # an edge to an unlinked node is reported, whether spilled or not
+
+    reported = []
+    showErrors = CV._showErrors
+
+    def _showErrors(cv):
+        reported.extend(
+            (kind, msg) for (kind, msgs) in cv.errors.items() for msg in msgs
+        )
+        return showErrors(cv)
+
+    monkeypatch.setattr(CV, "_showErrors", _showErrors)
+    outcomes = {}
+    for (mode, spill) in (("memory", False), ("spilled", str(tmp_path / "spill"))):
+        reported.clear()
+        (cv, good) = convert(tmp_path / mode, dangling=True, spill=spill)
+        assert not good
+        outcomes[mode] = list(reported)
+    assert outcomes["memory"] == outcomes["spilled"]
+    ((kind, msg),) = outcomes["memory"]
+    assert kind == "Edge feature: illegal node"
+    assert msg.startswith("\"rel\": to-node  ('phrase', ")
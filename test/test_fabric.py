@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import pytest
+
+import txtpy.fabric as fabricModule
+from txtpy.core.prepare import stats
+from txtpy.fabric import Fabric
+
+from corpus import FEATURES
+
+CALLS = "calls"
+
+
+def copyCorpus(corpus, dest):
+    # a copy of the dataset without its binaries,
+    # so that the precomputed features are stale
+
+    shutil.copytree(corpus, dest, ignore=shutil.ignore_patterns(".tf"))
+    return str(dest)
+
+
+def brokenStats(info, error, *args):
+    # a precompute function with a bug;
+    # it runs in a worker process, so it counts its calls in a file
+
+    with open(os.environ["TXTPY_TEST_CALLS"], "a") as fh:
+        fh.write("x")
+    raise ValueError("bug in stats")
+
+
+def withBrokenStats():
+    return tuple(
+        (dep2, fName, brokenStats if method is stats else method, dependencies)
+        for (dep2, fName, method, dependencies) in fabricModule.PRECOMPUTE
+    )
+
+
+def test_precompute_pool(corpus, tmp_path):
+    location = copyCorpus(corpus, tmp_path / "data")
+    TF = Fabric(locations=location, silent="deep", workers=2)
+    api = TF.load(FEATURES, silent="deep")
+    assert api is not None
+    reference = Fabric(locations=corpus, silent="deep").load(FEATURES, silent="deep")
+    assert list(api.C.order.data) == list(reference.C.order.data)
+    for n in range(1, api.F.otype.maxNode + 1):
+        assert tuple(api.L.u(n)) == tuple(reference.L.u(n))
+        assert tuple(api.L.d(n)) == tuple(reference.L.d(n))
+
+
+def test_precompute_errors_are_raised(corpus, tmp_path, monkeypatch):
+    # a bug in a precompute function surfaces, and the function runs only once
+
+    location = copyCorpus(corpus, tmp_path / "data")
+    calls = tmp_path / CALLS
+    monkeypatch.setenv("TXTPY_TEST_CALLS", str(calls))
+    monkeypatch.setattr(fabricModule, "PRECOMPUTE", withBrokenStats())
+    TF = Fabric(locations=location, silent="deep", workers=2)
+    with pytest.raises(ValueError, match="bug in stats"):
+        TF.load(FEATURES, silent="deep")
+    assert calls.read_text() == "x"
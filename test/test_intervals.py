@@ -0,0 +1,44 @@
+import pytest
+
+# the slot relations that use the slot interval index, against their definition
+
+RELATIONS = {
+    "==": lambda x, y: x == y,
+    "&&": lambda x, y: bool(x & y),
+    "##": lambda x, y: x != y,
+    "||": lambda x, y: not (x & y),
+}
+
+TYPES = (
+    ("phrase", "sentence"),
+    ("sentence", "phrase"),
+    ("phrase", "phrase"),
+    ("word", "phrase"),
+    ("phrase", "word"),
+)
+
+
+@pytest.mark.parametrize("rel", sorted(RELATIONS))
+def test_slot_relations(api, rel):
+    F = api.F
+    E = api.E
+
+    def slots(n):
+        return frozenset(E.oslots.s(n)) if F.otype.v(n) != "word" else frozenset((n,))
+
+    test = RELATIONS[rel]
+    found = False
+    for (fType, tType) in TYPES:
+        # ## between slots and other nodes does not use the index
+        if rel == "##" and "word" in (fType, tType):
+            continue
+        expected = sorted(
+            (n, m)
+            for n in F.otype.s(fType)
+            for m in F.otype.s(tType)
+            if test(slots(n), slots(m))
+        )
+        found = found or bool(expected)
+        results = api.S.search(f"a:{fType}\nb:{tType}\na {rel} b")
+        assert sorted(results) == expected, (fType, tType)
+    assert found
@@ -0,0 +1,52 @@
+from txtpy.fabric import Fabric
+from txtpy.core.lazy import LazyFeature
+from txtpy.core.nodefeature import NodeFeature
+
+from corpus import FEATURES
+
+TEMPLATE = """
+phrase sp=NP
+  word sp=noun num<5
+"""
+
+
+def lazyApi(corpus, features=FEATURES, resident=None):
+    TF = Fabric(locations=corpus, silent="deep")
+    return (TF, TF.load(features, silent="deep", lazy=True, resident=resident))
+
+
+def test_lazy_as_eager(corpus, api):
+    (TF, lazy) = lazyApi(corpus)
+    assert type(lazy.F.__dict__["sp"]) is LazyFeature
+    assert not TF.features["sp"].dataLoaded
+    nodes = range(1, lazy.F.otype.maxNode + 1)
+    assert [lazy.F.sp.v(n) for n in nodes] == [api.F.sp.v(n) for n in nodes]
+    assert TF.features["sp"].dataLoaded
+    assert type(lazy.Fs("num")) is NodeFeature
+    assert [lazy.E.mother.f(n) for n in nodes] == [api.E.mother.f(n) for n in nodes]
+    assert sorted(lazy.S.search(TEMPLATE)) == sorted(api.S.search(TEMPLATE))
+
+
+def test_lazy_resident(corpus, api):
+    (TF, lazy) = lazyApi(corpus, resident=1)
+    features = TF.features
+    phrase = api.F.otype.s("phrase")[0]
+    assert lazy.F.sp.v(phrase) == api.F.sp.v(phrase)
+    assert lazy.F.num.v(3) == api.F.num.v(3)
+    assert features["num"].dataLoaded and not features["sp"].dataLoaded
+    # an unloaded feature is loaded again when it is touched
+    assert lazy.F.sp.v(phrase) == api.F.sp.v(phrase)
+    assert features["sp"].dataLoaded and not features["num"].dataLoaded
+    assert list(TF.residency.resident) == ["sp"]
+
+
+def test_lazy_only_requested(corpus, api):
+    (TF, lazy) = lazyApi(corpus, features="num")
+    F = lazy.F
+    assert type(F.__dict__["num"]) is LazyFeature
+    assert not TF.features["num"].dataLoaded
+    assert "sp" not in F.__dict__ and "mother" not in lazy.E.__dict__
+    # the features that a search needs get proxies as well
+    assert sorted(lazy.S.search(TEMPLATE)) == sorted(api.S.search(TEMPLATE))
+    assert type(F.__dict__["sp"]) is LazyFeature
+    assert "mother" not in lazy.E.__dict__
@@ -0,0 +1,40 @@
+import pytest
+
+from txtpy.core.mapped import MappedNodeData, compactNodeData
+from txtpy.core.nodefeature import NodeFeature
+
+DATA = (
+    ({1: 3, 2: 0, 3: 7, 5: 3, 6: 1}, "int"),
+    ({2: 4, 900: 4, 70000: 1}, "int"),
+    ({n: ("NP", "VP", "PP")[n % 3] for n in range(1, 50)}, "str"),
+)
+
+
+@pytest.mark.parametrize("data,dataType", DATA)
+def test_compact_as_dict(data, dataType):
+    compact = compactNodeData(data, dataType)
+    assert type(compact) is MappedNodeData
+    assert len(compact) == len(data)
+    assert dict(compact.items()) == data
+    assert list(compact) == sorted(data)
+    for n in range(max(data) + 2):
+        assert (n in compact) == (n in data)
+        assert compact.get(n, None) == data.get(n, None)
+    for val in set(data.values()):
+        expected = [n for n in sorted(data) if data[n] == val]
+        assert list(compact.nodesByValue()[val]) == expected
+        assert list(compact.nodesIn(val, 2, 40)) == [
+            n for n in expected if 2 <= n <= 40
+        ]
+
+
+def test_value_index_as_dict(api):
+    for feat in ("sp", "lex", "num"):
+        fObj = getattr(api.F, feat)
+        assert type(fObj.data) is MappedNodeData
+        plain = NodeFeature(api, fObj.meta, dict(fObj.data.items()))
+        for val in {v for (n, v) in plain.items()}:
+            assert fObj.s(val) == plain.s(val)
+        assert fObj.freqList() == plain.freqList()
+        for nodeTypes in ({"word"}, {"phrase", "sentence"}):
+            assert fObj.freqList(nodeTypes) == plain.freqList(nodeTypes)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+TEMPLATE = """
+sentence
+  phrase
+    w:word sp=noun
+  v:word sp=verb
+w < v
+"""
+
+SHALLOW = """
+phrase
+  word sp=noun
+"""
+
+
+def stitchFiles(location):
+    return [name for name in os.listdir(location) if name.startswith("tf-stitch-")]
+
+
+def test_parallel_as_sequential(api):
+    S = api.S
+    expected = sorted(S.search(TEMPLATE))
+    assert expected
+    assert sorted(S.search(TEMPLATE, workers=2)) == expected
+    assert list(S.search(TEMPLATE, workers=2, sort=True)) == list(
+        S.search(TEMPLATE, sort=True)
+    )
+    for shallow in (True, 2):
+        expected = S.search(SHALLOW, shallow=shallow)
+        assert expected
+        assert S.search(SHALLOW, shallow=shallow, workers=2) == expected
+
+
+def test_pool_is_kept(api):
+    S = api.S
+    list(S.search(TEMPLATE, workers=2))
+    pool = S.pool
+    list(S.search(SHALLOW, workers=2))
+    assert S.pool is pool
+    list(S.search(SHALLOW, workers=3))
+    assert S.pool is not pool and S.pool.workers == 3
+
+
+def test_parallel_closed_early(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    S = api.S
+    results = S.search(TEMPLATE, workers=2)
+    first = [next(results) for i in range(3)]
+    assert stitchFiles(tmp_path)
+    results.close()
+    assert stitchFiles(tmp_path) == []
+    assert set(first) <= set(S.search(TEMPLATE))
+    # the pool can do the next search, the skipped shards are no problem
+    assert sorted(S.search(TEMPLATE, workers=2)) == sorted(S.search(TEMPLATE))
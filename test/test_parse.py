@@ -0,0 +1,17 @@
+import pytest
+
+from txtpy.bench import DataByLine, fingerprint, readFeature, writeFeature
+from txtpy.core.data import Data
+
+
+@pytest.mark.parametrize("kind", ("str", "int", "edge"))
+def test_read_as_before(tmp_path, kind):
+    # the ranges give the data that reading line by line gave
+    path = str(tmp_path / f"{kind}.tf")
+    writeFeature(path, kind, 3000)
+    (elapsed, before) = readFeature(DataByLine, path)
+    assert before
+    for workers in (1, 2):
+        (elapsed, data) = readFeature(Data, path, workers)
+        assert dict(data.items()) == before
+        assert fingerprint(data) == fingerprint(before)
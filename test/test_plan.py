@@ -0,0 +1,85 @@
+import collections
+
+import pytest
+
+from txtpy.search.searchexe import SearchExe
+from txtpy.search.spin import _statSpread
+from txtpy.search.stitch import STRATEGY
+
+TEMPLATES = (
+    """
+chapter
+  sentence num>10
+    phrase sp=NP
+      word sp=noun
+""",
+    """
+s:sentence
+p:phrase sp=VP
+w:word sp=verb
+s [[ p
+p [[ w
+s [[ w
+""",
+    """
+p:phrase
+  w:word
+  v:word
+w .lex. v
+w < v
+""",
+)
+
+
+def studied(api, template, strategy=None):
+    exe = SearchExe(api, template, silent=True, _msgCache=[])
+    exe.study(strategy=strategy)
+    assert exe.good
+    return exe
+
+
+def test_stats_as_counted(api):
+    F = api.F
+    L = api.L
+    nodes = range(1, F.otype.maxNode + 1)
+    embedCounts = collections.Counter(
+        (F.otype.v(n), F.otype.v(m)) for n in nodes for m in L.u(n)
+    )
+    (typeCounts, stats) = api.C.stats.data
+    assert typeCounts == collections.Counter(F.otype.v(n) for n in nodes)
+    assert stats == dict(embedCounts)
+
+
+def test_stat_spread_as_fanout(api):
+    # with whole types as yarns the spread of [[ is the average number
+    # of embedded nodes of the other type, and that of ]] the average number
+    # of embedders
+    F = api.F
+    L = api.L
+    for (fType, tType) in (("sentence", "phrase"), ("word", "phrase")):
+        for (rel, lev) in (("[[", L.d), ("]]", L.u)):
+            exe = SearchExe(
+                api, f"a:{fType}\nb:{tType}\na {rel} b", silent=True, _msgCache=[]
+            )
+            exe._parse()
+            exe._prepare()
+            exe.yarns = {0: set(F.otype.s(fType)), 1: set(F.otype.s(tType))}
+            (f, rela, t) = exe.qedges[0]
+            nodes = F.otype.s(fType)
+            fanOut = sum(len(lev(n, otype=tType)) for n in nodes) / len(nodes)
+            assert _statSpread(exe, rela, f, t) == pytest.approx(fanOut), rel
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_plan_is_stable(api, template):
+    plan = studied(api, template).stitchPlan
+    for i in range(3):
+        assert studied(api, template).stitchPlan == plan
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_strategies_agree(api, template):
+    expected = sorted(studied(api, template).fetch())
+    assert expected
+    for strategy in STRATEGY[1:]:
+        assert sorted(studied(api, template, strategy=strategy).fetch()) == expected
@@ -0,0 +1,108 @@
+import functools
+from array import array
+
+from txtpy.bench import benchOrder, orderByComparator, syntheticWarp, silent
+from txtpy.core.prepare import levDown, levUp, levels, order, rank
+
+
+def bothOrders(otype, oslots):
+    levelData = levels(silent, silent, otype, oslots, {})
+    return (
+        order(silent, silent, otype, oslots, levelData),
+        orderByComparator(silent, silent, otype, oslots, levelData),
+    )
+
+
+def levUpByDict(otype, oslots, rank):
+    # the embedders as they were computed before the sweep over the slots
+
+    (otype, maxSlot, maxNode, slotType) = otype
+    oslots = oslots[0]
+    oslotsInv = {}
+    for (k, mList) in enumerate(oslots):
+        for m in mList:
+            oslotsInv.setdefault(m, set()).add(k + 1 + maxSlot)
+    embedders = []
+    for n in range(1, maxSlot + 1):
+        embedders.append(sorted(oslotsInv[n], key=lambda k: -rank[k - 1]))
+    for n in range(maxSlot + 1, maxNode + 1):
+        mList = oslots[n - maxSlot - 1]
+        contentEmbedders = functools.reduce(
+            lambda x, y: x & oslotsInv[y], mList[1:], oslotsInv[mList[0]]
+        )
+        embedders.append(
+            sorted((m for m in contentEmbedders if m != n), key=lambda k: -rank[k - 1])
+        )
+    return [list(t) for t in embedders]
+
+
+def levDownByDict(otype, levUp, rank):
+    (otype, maxSlot, maxNode, slotType) = otype
+    inverse = {}
+    for n in range(maxSlot + 1, maxNode + 1):
+        for m in levUp[n - 1]:
+            inverse.setdefault(m, set()).add(n)
+    return [
+        sorted(inverse.get(n, []), key=lambda m: rank[m - 1])
+        for n in range(maxSlot + 1, maxNode + 1)
+    ]
+
+
+def bothLevels(otype, oslots):
+    levelData = levels(silent, silent, otype, oslots, {})
+    orderData = order(silent, silent, otype, oslots, levelData)
+    rankData = rank(silent, silent, otype, orderData)
+    up = levUp(silent, silent, otype, oslots, rankData)
+    down = levDown(silent, silent, otype, up, rankData)
+    upD = levUpByDict(otype, oslots, rankData)
+    downD = levDownByDict(otype, upD, rankData)
+    return (([list(a) for a in up], [list(a) for a in down]), (upD, downD))
+
+
+def test_order_as_comparator():
+    (otype, oslots) = syntheticWarp(5000)
+    (nodes, nodesC) = bothOrders(otype, oslots)
+    assert nodes == nodesC
+
+
+def test_order_ties():
+    # 7: 1-4, 8: 1,3 (gapped), 9: 2-3, 10: 1-4 as well, 11: 5-6;
+    # clauses have more slots on average than sentences, so they rank higher
+
+    maxSlot = 6
+    slots = ((1, 2, 3, 4), (1, 3), (2, 3), (1, 2, 3, 4), (5, 6))
+    types = ("sentence", "phrase", "phrase", "clause", "sentence")
+    otype = (types, maxSlot, maxSlot + len(slots), "word")
+    oslots = (tuple(array("I", s) for s in slots), maxSlot, maxSlot + len(slots))
+    (nodes, nodesC) = bothOrders(otype, oslots)
+    assert nodes == nodesC
+    assert list(nodes) == [10, 7, 8, 1, 9, 2, 3, 4, 11, 5, 6]
+
+
+def test_levels_as_dict():
+    (otype, oslots) = syntheticWarp(5000)
+    (csr, byDict) = bothLevels(otype, oslots)
+    assert csr == byDict
+
+
+def test_levels_gapped():
+    # 8: 1,3 and 9: 2-3 are both in 7 and 10, 8 is not in 9 nor 9 in 8;
+    # 12: 1,3,5 embeds 8; 7 and 10 embed each other
+
+    maxSlot = 6
+    slots = ((1, 2, 3, 4), (1, 3), (2, 3), (1, 2, 3, 4), (5, 6), (1, 3, 5))
+    types = ("sentence", "phrase", "phrase", "clause", "sentence", "clause")
+    otype = (types, maxSlot, maxSlot + len(slots), "word")
+    oslots = (tuple(array("I", s) for s in slots), maxSlot, maxSlot + len(slots))
+    ((up, down), byDict) = bothLevels(otype, oslots)
+    assert (up, down) == byDict
+    assert sorted(up[8 - 1]) == [7, 10, 12]
+    assert sorted(up[9 - 1]) == [7, 10]
+    assert sorted(down[7 - maxSlot - 1]) == [8, 9, 10]
+
+
+def test_bench_order(capsys):
+    benchOrder(1000)
+    out = capsys.readouterr().out
+    assert "1000 slots" in out
+    assert "same=True" in out
@@ -0,0 +1,40 @@
+from txtpy.search.searchexe import SearchExe
+
+TEMPLATE = """
+sentence
+  phrase sp=NP
+    w:word sp=noun
+  phrase sp=VP
+"""
+
+
+def fresh(api, template, sets=None):
+    # a search that parses the template itself, without a prepared front
+
+    exe = SearchExe(api, template, sets=sets, silent=True, _msgCache=[])
+    return sorted(exe.search())
+
+
+def test_prepared_as_plain(api):
+    query = api.S.prepare(TEMPLATE)
+    expected = fresh(api, TEMPLATE)
+    assert expected
+    assert sorted(query.run()) == expected
+    assert sorted(query.run()) == expected
+    assert sorted(api.S.search(TEMPLATE)) == expected
+
+
+def test_set_kinds_per_front(api):
+    # whether a custom set holds slots is remembered per front,
+    # it must not carry over to other templates
+
+    F = api.F
+    phrases = set(F.otype.s("phrase"))
+    words = set(F.otype.s("word"))
+    templateP = "x:X\nw:word\nx [[ w"
+    templateW = "w:X\np:phrase\np [[ w"
+    expectedP = fresh(api, templateP, sets=dict(X=phrases))
+    expectedW = fresh(api, templateW, sets=dict(X=words))
+    assert expectedP and expectedW
+    assert sorted(api.S.search(templateP, sets=dict(X=phrases))) == expectedP
+    assert sorted(api.S.search(templateW, sets=dict(X=words))) == expectedW
@@ -0,0 +1,71 @@
+from txtpy.search.profile import PHASES
+
+TEMPLATE = """
+phrase sp=NP
+  word sp=noun
+"""
+
+CHAIN = """
+sentence
+  phrase sp=NP
+    word sp=noun
+"""
+
+
+def profiled(S, template, **kwargs):
+    (results, profile) = S.search(template, profile=True, **kwargs)
+    return (list(results), profile)
+
+
+def test_profile_step_counts(api):
+    S = api.S
+    (results, profile) = profiled(S, TEMPLATE)
+    exe = S.exe
+    assert results and sorted(results) == sorted(S.search(TEMPLATE))
+    assert profile.finished and profile.complete
+    assert profile.nResults == len(results)
+    # the template has been prepared, so it is not parsed again
+    assert set(PHASES) - set(profile.phases) == {"syntax", "semantics"}
+
+    # count the step of the plan by hand
+    ((e, dir),) = exe.stitchPlan[1]
+    (f, rela, t) = exe.qedges[e]
+    if dir == -1:
+        (f, rela, t) = (t, exe.converse[rela], f)
+    r = exe.relations[rela]["func"](exe.qnodes[f][0], exe.qnodes[t][0])
+    yarnF = exe.yarns[f]
+    candidates = sum(len(tuple(r(n) or ())) for n in yarnF)
+    assert profile.steps == [
+        dict(
+            entered=len(yarnF),
+            calls=len(yarnF),
+            candidates=candidates,
+            passed=len(results),
+            backtracks=candidates - len(results),
+        )
+    ]
+    assert profile.yarns["edges"] == tuple(len(exe.yarns[q]) for q in range(2))
+
+
+def test_profile_chain(api):
+    (results, profile) = profiled(api.S, CHAIN)
+    steps = profile.steps
+    assert len(steps) == 2
+    assert steps[0]["passed"] == steps[1]["entered"]
+    assert steps[-1]["passed"] == len(results)
+    for step in steps:
+        assert step["backtracks"] == step["candidates"] - step["passed"]
+
+
+def test_profile_hook_and_limit(api):
+    S = api.S
+    seen = []
+    S.exportProfiles(seen.append)
+    try:
+        (results, profile) = profiled(S, CHAIN, limit=3)
+    finally:
+        S.exportProfiles(None)
+    assert len(results) == 3
+    assert seen == [profile]
+    assert not profile.complete and profile.nResults == 3
+    assert profile.asDict()["results"] == 3
@@ -0,0 +1,119 @@
+from txtpy.search.cache import QuantifierCache
+from txtpy.search.yarn import Yarn
+
+WITHOUT = """
+phrase sp=NP
+/without/
+  word sp=art
+/-/
+"""
+
+WHERE = """
+phrase
+/where/
+  word sp=noun
+/have/
+  word num<5
+/-/
+"""
+
+WHERE_SAME = """
+phrase
+/where/
+  w:word sp=noun
+/have/
+  v:word num<5
+  v = w
+/-/
+"""
+
+WITH = """
+phrase
+/with/
+  word sp=verb
+/or/
+  word sp=adj
+/-/
+"""
+
+
+def slotsOf(api, n):
+    return api.E.oslots.s(n)
+
+
+def expected(api):
+    # the outcomes of the quantifiers, computed directly
+
+    F = api.F
+    phrases = F.otype.s("phrase")
+    sp = F.sp.v
+    num = F.num.v
+    return {
+        WITHOUT: {
+            p
+            for p in phrases
+            if sp(p) == "NP" and all(sp(w) != "art" for w in slotsOf(api, p))
+        },
+        # the word of the consequent need not be the word of the antecedent
+        WHERE: {
+            p
+            for p in phrases
+            if all(sp(w) != "noun" for w in slotsOf(api, p))
+            or any(num(w) < 5 for w in slotsOf(api, p))
+        },
+        # here the consequent is about the word of the antecedent
+        WHERE_SAME: {
+            p
+            for p in phrases
+            if all(num(w) < 5 for w in slotsOf(api, p) if sp(w) == "noun")
+        },
+        WITH: {
+            p
+            for p in phrases
+            if any(sp(w) in {"verb", "adj"} for w in slotsOf(api, p))
+        },
+    }
+
+
+def test_quantifiers(api, monkeypatch):
+    monkeypatch.setattr(api.S, "quantifierCache", QuantifierCache(api))
+    for (query, nodes) in expected(api).items():
+        assert {r[0] for r in api.S.search(query)} == nodes
+
+
+def test_quantifier_cache_hashes_yarns(api, monkeypatch):
+    # the universe of a quantifier is a Yarn, so its key is made from the bits,
+    # and a remembered outcome is a Yarn again
+
+    quCache = QuantifierCache(api)
+    monkeypatch.setattr(api.S, "quantifierCache", quCache)
+    universes = []
+    key = QuantifierCache.key
+
+    def recordKey(self, searchExe, quKind, atom, quTemplates, universe):
+        universes.append(universe)
+        return key(self, searchExe, quKind, atom, quTemplates, universe)
+
+    monkeypatch.setattr(QuantifierCache, "key", recordKey)
+    results = {}
+    for query in (WITHOUT, WHERE, WITH):
+        results[query] = sorted(api.S.search(query))
+    assert universes
+    assert all(type(universe) is Yarn for universe in universes)
+    assert quCache.misses == 3 and quCache.hits == 0
+
+    for query in (WITHOUT, WHERE, WITH):
+        assert sorted(api.S.search(query)) == results[query]
+    assert quCache.hits == 3
+
+
+def test_quantifier_key_of_yarn_and_set(api):
+    quCache = QuantifierCache(api)
+    exe = type("Exe", (), {"sets": None})()
+    size = api.F.otype.maxNode + 1
+    nodes = api.F.otype.s("phrase")
+    yarn = Yarn.fromNodes(nodes, size)
+    args = (exe, "/without/", "phrase", ("  word sp=art",))
+    assert quCache.key(*args, yarn) == quCache.key(*args, Yarn.fromNodes(nodes, size))
+    assert quCache.key(*args, set(nodes)) == quCache.key(*args, frozenset(nodes))
+    assert quCache.key(*args, yarn) != quCache.key(*args, yarn - {nodes[0]})
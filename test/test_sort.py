@@ -0,0 +1,51 @@
+import pytest
+
+TEMPLATES = (
+    """
+phrase sp=NP
+  word sp=noun
+""",
+    """
+sentence
+  w1:word
+  <: w2:word
+  <: w3:word
+""",
+    """
+w1:word sp=verb
+w2:word sp=noun
+w1 << w2
+""",
+)
+
+
+def sortedResults(api, template):
+    return sorted(api.S.search(template), key=api.N.sortKeyTuple)
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_top_k_as_sorted(api, template):
+    S = api.S
+    expected = sortedResults(api, template)
+    assert len(expected) > 20
+    for limit in (1, 7, 20, None):
+        results = list(S.search(template, sort=True, limit=limit))
+        assert results == expected[0:limit]
+        cached = list(S.search(template, sort=True, limit=limit, cache=True))
+        assert cached == expected[0:limit]
+
+
+def test_top_k_in_parallel(api):
+    template = TEMPLATES[1]
+    expected = sortedResults(api, template)
+    results = list(api.S.search(template, sort=True, limit=50, workers=2))
+    assert results == expected[0:50]
+
+
+def test_top_k_stops_early(api):
+    # only the first nodes of the first yarn are stitched
+    template = TEMPLATES[2]
+    (results, profile) = api.S.search(template, sort=True, limit=5, profile=True)
+    assert len(results) == 5
+    yarn = api.S.exe.yarns[0]
+    assert profile.steps[0]["entered"] < len(yarn) / 10
@@ -0,0 +1,36 @@
+from txtpy.bench import SPIN_RELATIONS, benchSpin
+from txtpy.search.searchexe import SearchExe
+from txtpy.search.spin import spinAtoms, spinByRelation
+
+
+def spunYarns(api, rel):
+    exe = SearchExe(
+        api, f"p:phrase sp=NP\nw:word sp=verb\np {rel} w", silent=True, _msgCache=[]
+    )
+    exe._parse()
+    exe._prepare()
+    spinAtoms(exe)
+    (f, rela, t) = exe.qedges[0]
+    (fTp, tTp) = (exe.qnodes[f][0], exe.qnodes[t][0])
+    relation = exe.relations[rela]
+    (yarnF, yarnT) = (exe.yarns[f], exe.yarns[t])
+    # the generic spin tries all pairs for relations between two nodes
+    expected = spinByRelation(relation["func"](fTp, tTp), yarnF, yarnT)
+    spin = relation["spin"]
+    spun = spin(fTp, tTp)(yarnF, yarnT) if callable(spin) else expected
+    return (tuple(set(y) for y in spun), expected)
+
+
+def test_spin_as_generic(api):
+    for rel in SPIN_RELATIONS:
+        (spun, expected) = spunYarns(api, rel)
+        assert expected[0] and expected[1], rel
+        assert spun == expected, rel
+
+
+def test_bench_spin(capsys):
+    benchSpin(2000)
+    out = capsys.readouterr().out
+    assert "2000 slots" in out
+    for rel in SPIN_RELATIONS:
+        assert f"\n{rel} " in out
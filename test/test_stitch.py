@@ -0,0 +1,46 @@
+from txtpy.search.searchexe import SearchExe
+from txtpy.search.stitch import _compileStitcher
+
+TEMPLATES = (
+    """
+sentence
+  phrase sp=NP
+    word sp=noun
+  phrase sp=VP
+""",
+    """
+p:phrase
+  w:word
+  v:word
+w .lex. v
+w < v
+""",
+)
+
+
+def results(api, template, compileStitch):
+    exe = SearchExe(
+        api,
+        template,
+        silent=True,
+        _msgCache=[],
+        perfParams=dict(api.S.perfParams, compileStitch=compileStitch),
+    )
+    return sorted(exe.search())
+
+
+def test_compiled_as_interpreted(api):
+    for template in TEMPLATES:
+        expected = results(api, template, 0)
+        assert expected
+        assert results(api, template, 1) == expected
+
+
+def test_compiled_shapes_are_kept(api):
+    _compileStitcher.cache_clear()
+    results(api, TEMPLATES[0], 1)
+    misses = _compileStitcher.cache_info().misses
+    assert misses >= 1
+    results(api, TEMPLATES[0], 1)
+    info = _compileStitcher.cache_info()
+    assert info.misses == misses and info.hits >= 1
@@ -0,0 +1,79 @@
+from txtpy.core.validate import checkDataset, checkOslots, validateWarp
+
+OTYPE = """@node
+@valueType=str
+@writtenBy=test
+
+1-4\tword
+6-7\tphrase
+"""
+
+OSLOTS = """@edge
+@valueType=str
+@writtenBy=test
+
+6\t1-2
+3-4
+"""
+
+
+def writeWarp(location, otype, oslots):
+    location.mkdir(exist_ok=True)
+    (location / "otype.tf").write_text(otype, encoding="utf8")
+    (location / "oslots.tf").write_text(oslots, encoding="utf8")
+    return str(location)
+
+
+def collector():
+    messages = []
+
+    def collect(msg, tm=True):
+        messages.append(msg)
+
+    return (messages, collect)
+
+
+def test_valid_dataset(corpus, capsys):
+    assert checkDataset(corpus)
+    out = capsys.readouterr()
+    assert "OK: oslots is valid" in out.out + out.err
+    assert "ERROR" not in out.out + out.err
+
+
+def test_gap_in_otype(tmp_path, capsys):
+    # node 5 has no type: that is the error, nothing else is wrong
+
+    assert not checkDataset(writeWarp(tmp_path / "gap", OTYPE, OSLOTS))
+    out = capsys.readouterr()
+    report = out.out + out.err
+    assert "otype has no type for nodes" in report
+    assert "5" in report.split("otype has no type for nodes")[1].split("\n")[1]
+    assert "not in otype" not in report
+    assert "unmapped" not in report
+
+
+def test_gap_as_save_sees_it():
+    otype = {1: "word", 2: "word", 3: "word", 4: "word", 6: "phrase", 7: "phrase"}
+    oslots = {6: {1, 2}, 7: {3, 4}}
+    (messages, collect) = collector()
+    assert not validateWarp(otype, oslots, collect, collect)
+    assert "ERROR: otype has no type for nodes" in messages
+    assert not any("unmapped" in msg or "not in otype" in msg for msg in messages)
+
+
+def test_broken_oslots(tmp_path, capsys):
+    otype = OTYPE.replace("6-7\tphrase", "5-7\tphrase")
+    oslots = OSLOTS.replace("6\t1-2\n3-4\n", "1\t1\n6\t1-2\n8\t3-4\n")
+    assert not checkDataset(writeWarp(tmp_path / "broken", otype, oslots))
+    out = capsys.readouterr()
+    report = out.out + out.err
+    assert "oslots maps slot nodes" in report
+    assert "oslots maps nodes that are not in otype" in report
+    assert "unmapped phrase" in report
+
+
+def test_check_oslots():
+    nodes = [2, 5, 6, 7, 9, 12, 13]
+    assert checkOslots(nodes, 4, 12) == ([2], [13], [8, 10, 11])
+    assert checkOslots(list(range(5, 13)), 4, 12) == ([], [], [])
+    assert checkOslots([], 4, 6) == ([], [], [5, 6])
@@ -0,0 +1,50 @@
+import random
+
+from txtpy.bench import benchYarn
+from txtpy.search.yarn import Yarn
+
+SIZE = 1001
+
+
+def randomSets(seed):
+    rng = random.Random(seed)
+    return [
+        {n for n in range(1, SIZE) if rng.random() < fraction}
+        for fraction in (0, 0.01, 0.3, 0.9, 1)
+    ]
+
+
+def test_yarn_as_set():
+    sets = randomSets(1)
+    for a in sets:
+        yarn = Yarn.fromNodes(a, SIZE)
+        assert len(yarn) == len(a)
+        assert list(yarn) == sorted(a)
+        assert yarn == a
+        assert all((n in yarn) == (n in a) for n in range(-1, SIZE + 2))
+        assert "x" not in yarn
+        for b in sets:
+            yarnB = Yarn.fromNodes(b, SIZE)
+            for other in (b, yarnB):
+                assert yarn & other == a & b
+                assert yarn | other == a | b
+                assert yarn - other == a - b
+            assert b & yarn == a & b
+            assert b | yarn == a | b
+            assert b - yarn == b - a
+
+
+def test_yarn_from_range():
+    for (b, e) in ((1, SIZE), (0, 5), (300, 300), (990, 2000)):
+        yarn = Yarn.fromNodes(range(b, e), SIZE)
+        assert yarn == set(range(b, min((e, SIZE))))
+    yarn = Yarn.fromNodes(range(1, 20, 3), SIZE)
+    assert yarn == set(range(1, 20, 3))
+    assert Yarn.fromNodes(yarn, SIZE) is yarn
+
+
+def test_bench_yarn(capsys):
+    benchYarn(2000, probes=1000)
+    out = capsys.readouterr().out
+    assert "2000 nodes, memory per yarn" in out
+    assert "1000 membership tests" in out
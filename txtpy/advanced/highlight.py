@@ -61,12 +61,13 @@ def getTupleHighlights(api, tup, highlights, colorMap, condenseType):
     return newHighlights
 
 
-def getPassageHighlights(app, node, query, cache):
+def getPassageHighlights(app, node, query, cache=None):
+    # cache is still accepted, for existing callers, but not used any more
 
     if not query:
         return None
 
-    (queryResults, messages, features) = runSearch(app, query, cache)
+    (queryResults, messages, features) = runSearch(app, query)
     if messages:
         return None
 
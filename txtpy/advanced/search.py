@@ -9,24 +9,30 @@ def searchApi(app):
     app.search = types.MethodType(search, app)
 
 
-def search(app, query, silent=False, sets=None, shallow=False, sort=True):
+def search(app, query, silent=False, sets=None, shallow=False, sort=True, limit=None):
 
     info = app.info
     isSilent = app.isSilent
     setSilent = app.setSilent
     api = app.api
     S = api.S
-    N = api.N
-    sortKeyTuple = N.sortKeyTuple
 
     wasSilent = isSilent()
 
-    results = S.search(query, sets=sets, shallow=shallow)
+    # the canonical order is delivered by the search itself,
+    # which stops after the first limit results
+    # other sort keys need all results before they can be applied
+    ownSort = sort is True or not sort
+    results = S.search(
+        query,
+        sets=sets,
+        shallow=shallow,
+        sort=sort is True,
+        limit=limit if ownSort else None,
+    )
     if not shallow:
-        if not sort:
+        if ownSort:
             results = list(results)
-        elif sort is True:
-            results = sorted(results, key=sortKeyTuple)
         else:
             try:
                 sortedResults = sorted(results, key=sort)
@@ -40,7 +46,7 @@ def search(app, query, silent=False, sets=None, shallow=False, sort=True):
                     error=True,
                 )
                 sortedResults = list(results)
-            results = sortedResults
+            results = sortedResults[0:limit]
 
         features = ()
         if S.exe:
@@ -60,29 +66,31 @@ def search(app, query, silent=False, sets=None, shallow=False, sort=True):
     return results
 
 
-def runSearch(app, query, cache):
+def runSearch(app, query, cache=None):
+    # The results are cached in S.resultCache,
+    # keyed by the parsed template and the state of the data.
+    # The cache argument is still accepted, for existing callers,
+    # but it is not used any more.
 
     api = app.api
     S = api.S
     plainSearch = S.search
 
-    cacheKey = (query, False)
-    if cacheKey in cache:
-        return cache[cacheKey]
     options = dict(_msgCache=[])
     if app.sets is not None:
         options["sets"] = app.sets
-    (queryResults, messages, exe) = plainSearch(query, here=False, **options)
+    (queryResults, messages, exe) = plainSearch(
+        query, here=False, cache=True, **options
+    )
     features = ()
     if exe:
         qnodes = getattr(exe, "qnodes", [])
-        nodeMap = getattr(S.exe, "nodeMap", {})
+        nodeMap = getattr(exe, "nodeMap", {})
         features = tuple(
             (i, tuple(sorted(set(q[1].keys()) | nodeMap.get(i, set()))))
             for (i, q) in enumerate(qnodes)
         )
-    queryResults = tuple(sorted(queryResults))
-    cache[cacheKey] = (queryResults, messages, features)
+    queryResults = tuple(queryResults)
     return (queryResults, messages, features)
 
 
@@ -92,7 +100,7 @@ def runSearchCondensed(app, query, cache, condenseType):
     cacheKey = (query, True, condenseType)
     if cacheKey in cache:
         return cache[cacheKey]
-    (queryResults, messages, features) = runSearch(app, query, cache)
+    (queryResults, messages, features) = runSearch(app, query)
     queryResults = condense(api, queryResults, condenseType, multiple=True)
     cache[cacheKey] = (queryResults, messages, features)
     return (queryResults, messages, features)
@@ -0,0 +1,603 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import shutil
+import functools
+import collections
+import tracemalloc
+from inspect import signature
+from array import array
+
+from .fabric import Fabric
+from .core.data import Data, ERROR_CUTOFF
+from .core.helpers import console, setFromSpec, valueFromTf
+from .core.prepare import levels, order
+from .core.timestamp import Timestamp
+from .search.searchexe import SearchExe
+from .search.spin import spinAtoms, spinByRelation
+from .search.yarn import Yarn
+
+HELP = """
+USAGE
+
+python -m txtpy.bench --help
+
+python -m txtpy.bench order [{maxSlot}]
+
+python -m txtpy.bench parse [{maxLines} [{workers}]]
+
+python -m txtpy.bench spin [{maxSlot}]
+
+python -m txtpy.bench yarn [{maxNode}]
+
+EFFECT
+
+Runs benchmarks on synthetic datasets of increasing size, up to maxSlot slots.
+
+order: computes the canonical order of the nodes (__order__) with the sort keys,
+and with the pairwise comparator that was used before (default maxSlot 1000000).
+Both orders must be the same.
+
+parse: reads .tf files of a string feature, an integer feature and an edge feature
+of increasing size (default maxLines 1000000), as Data does without a binary:
+line by line into sets, as before; into ranges; and into ranges with a pool
+of worker processes (default 4), which parses files of more than 64MB in chunks.
+Only the reading is timed. All results must be the same.
+
+spin: spins the yarns of a phrase and a word that are related by a slot position
+relation (<, <<, =:, ::, <:, =k: and the like) on a synthetic dataset
+(default maxSlot 200000): with the spin function of the relation,
+and generically, with the relation function.
+Reports the times and the sizes of the spun yarns;
+relations without a spin function of their own are only spun generically,
+relations between two nodes (<, <<) are only spun by their spin function.
+
+yarn: the memory of yarns of several sizes over maxNode nodes (default 300000)
+as byte maps (Yarn), as sets, and as bit maps (computed, one bit per node);
+and the time of membership tests and intersections for each of them.
+"""
+
+# SYNTHETIC DATA ###
+
+# Sentences of 10 to 30 slots, divided into phrases of 1 to 4 slots.
+# Some phrases have a gap, and some phrases have a clause with the same slots,
+# so that the tie breaks of the canonical order are exercised.
+
+
+def syntheticWarp(maxSlot, seed=1):
+    # otype and oslots in the form in which the precompute functions get them
+
+    rng = random.Random(seed)
+    sentences = []
+    phrases = []
+    clauses = []
+    s = 1
+    while s <= maxSlot:
+        e = min(maxSlot, s + rng.randrange(10, 30) - 1)
+        sentences.append(array("I", range(s, e + 1)))
+        p = s
+        while p <= e:
+            pe = min(e, p + rng.randrange(1, 5) - 1)
+            slots = array("I", range(p, pe + 1))
+            if len(slots) >= 3 and rng.random() < 0.2:
+                slots.pop(1)
+            phrases.append(slots)
+            if rng.random() < 0.1:
+                clauses.append(slots)
+            p = pe + 1
+        s = e + 1
+    otype = (
+        ("sentence",) * len(sentences)
+        + ("clause",) * len(clauses)
+        + ("phrase",) * len(phrases)
+    )
+    oslots = tuple(sentences + clauses + phrases)
+    maxNode = maxSlot + len(oslots)
+    return ((otype, maxSlot, maxNode, "word"), (oslots, maxSlot, maxNode))
+
+
+def silent(msg, tm=True):
+    pass
+
+
+# CANONICAL ORDER ###
+
+
+def orderByComparator(info, error, otype, oslots, levels):
+    # the canonical order as it was computed before the sort keys
+
+    (otype, maxSlot, maxNode, slotType) = otype
+    oslots = oslots[0]
+    otypeLevels = dict(((x[0], i) for (i, x) in enumerate(reversed(levels))))
+
+    def otypeRank(n):
+        return otypeLevels[slotType if n < maxSlot + 1 else otype[n - maxSlot - 1]]
+
+    def before(na, nb):
+        if na < maxSlot + 1:
+            a = na
+            sa = {a}
+        else:
+            a = na - maxSlot
+            sa = set(oslots[a - 1])
+        if nb < maxSlot + 1:
+            b = nb
+            sb = {b}
+        else:
+            b = nb - maxSlot
+            sb = set(oslots[b - 1])
+        oa = otypeRank(na)
+        ob = otypeRank(nb)
+        if sa == sb:
+            return (
+                (-1 if na < nb else 1 if na > nb else 0)
+                if oa == ob
+                else -1
+                if oa > ob
+                else 1
+            )
+        if sa > sb:
+            return -1
+        if sa < sb:
+            return 1
+        am = min(sa - sb)
+        bm = min(sb - sa)
+        return -1 if am < bm else 1 if bm < am else None
+
+    canonKey = functools.cmp_to_key(before)
+    nodes = sorted(range(1, maxNode + 1), key=canonKey)
+    return array("I", nodes)
+
+
+def benchOrder(maxSlot=1000000):
+    size = 1000
+    while size <= maxSlot:
+        (otype, oslots) = syntheticWarp(size)
+        levelData = levels(silent, silent, otype, oslots, {})
+        start = time.perf_counter()
+        nodes = order(silent, silent, otype, oslots, levelData)
+        keyTime = time.perf_counter() - start
+        start = time.perf_counter()
+        nodesC = orderByComparator(silent, silent, otype, oslots, levelData)
+        cmpTime = time.perf_counter() - start
+        console(
+            f"{size:>9} slots {otype[2]:>9} nodes:"
+            f" comparator {cmpTime:>7.3f}s keys {keyTime:>7.3f}s"
+            f" = x{cmpTime / keyTime:>5.1f} (same={nodes == nodesC})"
+        )
+        if size == maxSlot:
+            break
+        size = min((size * 10, maxSlot))
+
+
+# PARSING TF FILES ###
+
+
+def writeFeature(path, kind, nLines, seed=1):
+    # a .tf file of nLines data lines, with implicit nodes mostly,
+    # and now and then an explicit node or a range of nodes
+
+    rng = random.Random(seed)
+    isEdge = kind == "edge"
+    valueType = "int" if kind == "int" else "str"
+    with open(path, "w", encoding="utf8") as fh:
+        fh.write(f"@{'edge' if isEdge else 'node'}\n@valueType={valueType}\n\n")
+        n = 0
+        for i in range(nLines):
+            n += 1
+            spec = ""
+            if rng.random() < 0.05:
+                n += rng.randrange(1, 10)
+                e = n + rng.randrange(0, 20)
+                spec = f"{n}-{e}\t" if e > n else f"{n}\t"
+                n = e
+            if isEdge:
+                m = rng.randrange(1, 1000000)
+                fh.write(f"{spec}{m}-{m + rng.randrange(0, 50)}\n")
+            elif kind == "int":
+                fh.write(f"{spec}{rng.randrange(1000)}\n")
+            else:
+                fh.write(f"{spec}{rng.choice(('noun', 'verb', 'adj', 'art'))}\n")
+
+
+def readDataTfByLine(self, fh, firstI):
+    # Data._readDataTf as it was before the ranges: every node specification
+    # becomes a set, every node gets its value in a dict
+
+    tmObj = self.tmObj
+    error = tmObj.error
+
+    errors = collections.defaultdict(list)
+    i = firstI
+    implicit_node = 1
+    data = {}
+    isEdge = self.isEdge
+    edgeValues = self.edgeValues
+    normFields = 3 if isEdge and edgeValues else 2
+    isNum = self.dataType == "int"
+    for line in fh:
+        i += 1
+        fields = line.rstrip("\n").split("\t")
+        lfields = len(fields)
+        if lfields > normFields:
+            errors["wrongFields"].append(i)
+            continue
+        if lfields == normFields:
+            nodes = setFromSpec(fields[0])
+            if isEdge:
+                if fields[1] == "":
+                    errors["emptyNode2Spec"].append(i)
+                    continue
+                nodes2 = setFromSpec(fields[1])
+            if not isEdge or edgeValues:
+                valTf = fields[-1]
+        else:
+            if isEdge:
+                if edgeValues:
+                    if lfields == normFields - 1:
+                        nodes = {implicit_node}
+                        nodes2 = setFromSpec(fields[0])
+                        valTf = fields[-1]
+                    elif lfields == normFields - 2:
+                        nodes = {implicit_node}
+                        if fields[0] == "":
+                            errors["emptyNode2Spec"].append(i)
+                            continue
+                        nodes2 = setFromSpec(fields[0])
+                        valTf = ""
+                    else:
+                        nodes = {implicit_node}
+                        valTf = ""
+                        errors["emptyNode2Spec"].append(i)
+                        continue
+                else:
+                    if lfields == normFields - 1:
+                        nodes = {implicit_node}
+                        if fields[0] == "":
+                            errors["emptyNode2Spec"].append(i)
+                            continue
+                        nodes2 = setFromSpec(fields[0])
+                    else:
+                        nodes = {implicit_node}
+                        errors["emptyNode2Spec"].append(i)
+                        continue
+            else:
+                nodes = {implicit_node}
+                if lfields == 1:
+                    valTf = fields[0]
+                else:
+                    valTf = ""
+        implicit_node = max(nodes) + 1
+        if not isEdge or edgeValues:
+            value = (
+                int(valTf)
+                if isNum and valTf != ""
+                else None
+                if isNum
+                else ""
+                if valTf == ""
+                else valueFromTf(valTf)
+            )
+        if isEdge:
+            for n in nodes:
+                for m in nodes2:
+                    if not edgeValues:
+                        data.setdefault(n, set()).add(m)
+                    else:
+                        data.setdefault(n, {})[m] = value  # even if the value is None
+        else:
+            for n in nodes:
+                if value is not None:
+                    data[n] = value
+    for kind in errors:
+        lnk = len(errors[kind])
+        error(
+            "{} in lines {}".format(
+                kind, ",".join(str(ln) for ln in errors[kind][0:ERROR_CUTOFF])
+            )
+        )
+        if lnk > ERROR_CUTOFF:
+            error(f"\t and {lnk - ERROR_CUTOFF} more cases", tm=False)
+    self.data = data
+    if not errors:
+        # the warp features do not occur in this benchmark
+        seen = {}
+        datax = {}
+        if isEdge and edgeValues:
+            for (n, ms) in data.items():
+                msx = {}
+                for (m, v) in ms.items():
+                    if v not in seen:
+                        seen[v] = v
+                    msx[m] = seen[v]
+                datax[n] = msx
+        elif isEdge:
+            for (n, ms) in data.items():
+                msx = frozenset(ms)
+                if msx not in seen:
+                    seen[msx] = msx
+                datax[n] = seen[msx]
+        else:
+            for (n, ms) in data.items():
+                if ms not in seen:
+                    seen[ms] = ms
+                datax[n] = seen[ms]
+        self.data = datax
+
+    return not errors
+
+
+class DataByLine(Data):
+    _readDataTf = readDataTfByLine
+
+
+def readFeature(dataClass, path, workers=1):
+    # reads a .tf file as Data.load does when there is no binary,
+    # returns the time it takes and the data
+
+    tmObj = Timestamp()
+    tmObj.setSilent("deep")
+    feature = dataClass(path, tmObj, workers=workers)
+    start = time.perf_counter()
+    good = feature._readTf()
+    elapsed = time.perf_counter() - start
+    return (elapsed, feature.data if good else None)
+
+
+def fingerprint(data):
+    # the data of big edge features does not fit in memory twice,
+    # so the results are compared by their fingerprints
+
+    if data is None:
+        return None
+    return (len(data), sum(hash((n, value)) for (n, value) in data.items()))
+
+
+def benchParse(maxLines=1000000, workers=4):
+    tempDir = tempfile.mkdtemp(prefix="tf-bench-")
+    try:
+        size = 10000
+        while size <= maxLines:
+            for kind in ("str", "int", "edge"):
+                path = f"{tempDir}/{kind}.tf"
+                writeFeature(path, kind, size)
+                mb = os.path.getsize(path) / 1024 / 1024
+                fingerprints = []
+                report = []
+                for (label, dataClass, nWorkers) in (
+                    ("before", DataByLine, 1),
+                    ("ranges", Data, 1),
+                    (f"workers={workers}", Data, workers),
+                ):
+                    (elapsed, data) = readFeature(dataClass, path, nWorkers)
+                    fingerprints.append(fingerprint(data))
+                    data = None  # before the next reading
+                    report.append(
+                        f"{label} {size / elapsed / 1e3:>6.0f}k lines/s"
+                        f" {mb / elapsed:>5.1f} MB/s"
+                    )
+                same = fingerprints[0] is not None and all(
+                    f == fingerprints[0] for f in fingerprints[1:]
+                )
+                console(
+                    f"{size:>8} lines {kind:<4} {mb:>5.1f} MB: "
+                    + " | ".join(report)
+                    + f" (same={same})"
+                )
+            if size == maxLines:
+                break
+            size = min((size * 10, maxLines))
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+
+# SPINNING SLOT POSITION RELATIONS ###
+
+SPIN_RELATIONS = """
+    <
+    >
+    <<
+    >>
+    =:
+    :=
+    ::
+    <:
+    :>
+    =2:
+    :2=
+    :2:
+    <2:
+    :2>
+""".strip().split()
+
+
+def writeSynthetic(location, maxSlot, seed=1):
+    # a dataset with the synthetic warp and a feature sp for words and phrases
+
+    rng = random.Random(seed)
+    ((otype, maxSlot, maxNode, slotType), (oslots, maxSlot, maxNode)) = syntheticWarp(
+        maxSlot, seed=seed
+    )
+    otypeData = {n: slotType for n in range(1, maxSlot + 1)}
+    otypeData.update({maxSlot + 1 + i: nType for (i, nType) in enumerate(otype)})
+    oslotsData = {maxSlot + 1 + i: set(slots) for (i, slots) in enumerate(oslots)}
+    sp = {n: rng.choice(("noun", "verb", "adj", "art")) for n in range(1, maxSlot + 1)}
+    sp.update(
+        {
+            maxSlot + 1 + i: rng.choice(("NP", "VP", "PP"))
+            for (i, nType) in enumerate(otype)
+            if nType == "phrase"
+        }
+    )
+    TF = Fabric(locations=location, silent="deep")
+    TF.save(
+        nodeFeatures=dict(otype=otypeData, sp=sp),
+        edgeFeatures=dict(oslots=oslotsData),
+        metaData={
+            "": dict(source="synthetic"),
+            "otype": dict(valueType="str"),
+            "oslots": dict(valueType="str"),
+            "sp": dict(valueType="str"),
+        },
+        silent="deep",
+    )
+
+
+def spinTimes(api, rel, repeat=5):
+    # the best times of the spin function and of the generic spin,
+    # and the sizes of the yarns they leave
+
+    exe = SearchExe(
+        api, f"p:phrase sp=NP\nw:word sp=verb\np {rel} w", silent=True, _msgCache=[]
+    )
+    exe._parse()
+    exe._prepare()
+    spinAtoms(exe)
+    (f, rela, t) = exe.qedges[0]
+    (fTp, tTp) = (exe.qnodes[f][0], exe.qnodes[t][0])
+    relation = exe.relations[rela]
+    (yarnF, yarnT) = (exe.yarns[f], exe.yarns[t])
+
+    # the relations :: and :k: have no spin function of their own,
+    # the generic spin of a relation between two nodes tries all pairs,
+    # the relations <, >, <<, >> were not spun at all before they had a spin
+    spinFunc = relation["spin"]
+    func = relation["func"](fTp, tTp)
+    spins = [
+        (lambda: spinFunc(fTp, tTp)(yarnF, yarnT)) if callable(spinFunc) else None,
+        (
+            (lambda: spinByRelation(func, yarnF, yarnT))
+            if len(signature(func).parameters) == 1
+            else None
+        ),
+    ]
+
+    outcomes = []
+    for spin in spins:
+        if spin is None:
+            outcomes.append(None)
+            continue
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            (newF, newT) = spin()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min((best, elapsed))
+        outcomes.append((best, len(newF) + len(newT)))
+    return (len(yarnF) + len(yarnT), outcomes)
+
+
+def benchSpin(maxSlot=200000):
+    tempDir = tempfile.mkdtemp(prefix="tf-bench-")
+    try:
+        writeSynthetic(tempDir, maxSlot)
+        api = Fabric(locations=tempDir, silent="deep").load("sp", silent="deep")
+        console(f"{maxSlot} slots, yarns of phrases sp=NP and words sp=verb")
+        for rel in SPIN_RELATIONS:
+            (size, outcomes) = spinTimes(api, rel)
+            (spin, generic) = (
+                " {:>7.3f}s to {:>8}".format(*outcome)
+                if outcome is not None
+                else f" {'not run':>20}"
+                for outcome in outcomes
+            )
+            console(f"{rel:<4} {size:>8} nodes: spin{spin} generic{generic}")
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+
+# YARNS ###
+
+
+def allocated(make):
+    # the object that make() returns, and the memory allocated for it
+
+    tracemalloc.start()
+    try:
+        x = make()
+        return (x, tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+
+
+def bestTime(func, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min((best, elapsed))
+    return best
+
+
+def benchYarn(maxNode=300000, probes=1000000, seed=1):
+    rng = random.Random(seed)
+    size = maxNode + 1
+    console(f"{maxNode} nodes, memory per yarn")
+    for amount in (3, maxNode // 100, maxNode // 10, maxNode // 2):
+        nodes = sorted(rng.sample(range(1, size), amount))
+        (yarn, yarnMem) = allocated(lambda: Yarn.fromNodes(nodes, size))
+        (nodeSet, setMem) = allocated(lambda: set(nodes))
+        console(
+            f"{amount:>8} nodes: bytes {yarnMem / 1000:>8.1f}KB"
+            f" set {setMem / 1000:>8.1f}KB bits {size / 8000:>8.1f}KB"
+        )
+
+    nodes = rng.sample(range(1, size), maxNode // 2)
+    yarn = Yarn.fromNodes(nodes, size)
+    nodeSet = set(nodes)
+    packed = bytearray((size + 7) // 8)
+    for n in nodes:
+        packed[n >> 3] |= 1 << (n & 7)
+    bits = yarn.bits
+    tries = [rng.randrange(size) for i in range(probes)]
+    times = (
+        bestTime(lambda: sum(1 for n in tries if bits[n])),
+        bestTime(lambda: sum(1 for n in tries if n in nodeSet)),
+        bestTime(lambda: sum(1 for n in tries if packed[n >> 3] >> (n & 7) & 1)),
+    )
+    console(
+        "{} membership tests: bytes {:>7.3f}s set {:>7.3f}s bits {:>7.3f}s".format(
+            probes, *times
+        )
+    )
+    other = rng.sample(range(1, size), maxNode // 2)
+    otherYarn = Yarn.fromNodes(other, size)
+    otherSet = set(other)
+    console(
+        "intersection of two halves: bytes {:>7.3f}s set {:>7.3f}s".format(
+            bestTime(lambda: yarn & otherYarn), bestTime(lambda: nodeSet & otherSet)
+        )
+    )
+
+
+def main(cargs=sys.argv):
+    if len(cargs) < 2 or any(
+        arg in {"--help", "-help", "-h", "?", "-?"} for arg in cargs
+    ):
+        console(HELP)
+        return
+
+    if cargs[1] == "order":
+        benchOrder(*(int(arg) for arg in cargs[2:3]))
+        return
+
+    if cargs[1] == "parse":
+        benchParse(*(int(arg) for arg in cargs[2:4]))
+        return
+
+    if cargs[1] == "spin":
+        benchSpin(*(int(arg) for arg in cargs[2:3]))
+        return
+
+    if cargs[1] == "yarn":
+        benchYarn(*(int(arg) for arg in cargs[2:3]))
+        return
+
+    console(HELP)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import os
+import pickle
+import shutil
+import tempfile
+from array import array
+from heapq import merge
+from itertools import islice
+
+from ..parameters import PICKLE_PROTOCOL, SPILL_SIZE
+
+# SPILLING CONVERSION STATE TO DISK ###
+
+# When a corpus is too big to convert in memory, the walker writes what the
+# director delivers to run files on disk, instead of to dicts and sets:
+#
+#   slots:    per node type the slot memberships (seq, slot),
+#             packed into one integer each and kept in typed arrays;
+#   features: per feature the assignments, in the order in which they are made.
+#
+# Whatever has to be ordered is sorted by an external merge sort:
+# at most SPILL_SIZE records are sorted in memory at a time,
+# the sorted runs are written to disk and merged while they are read back.
+
+# number of records that are written and read at a time
+CHUNK = 10000
+
+# maximum number of runs that are merged at the same time
+FAN_IN = 64
+
+SEQ_SHIFT = 32
+SLOT_MASK = (1 << SEQ_SHIFT) - 1
+
+
+def writeRun(path, records, typecode, append=False):
+
+    records = iter(records)
+    with open(path, "ab" if append else "wb") as fh:
+        while True:
+            chunk = list(islice(records, CHUNK))
+            if not chunk:
+                break
+            if typecode:
+                array(typecode, chunk).tofile(fh)
+            else:
+                pickle.dump(chunk, fh, protocol=PICKLE_PROTOCOL)
+
+
+def readRun(path, typecode):
+
+    with open(path, "rb") as fh:
+        if typecode:
+            while True:
+                chunk = array(typecode)
+                try:
+                    chunk.fromfile(fh, CHUNK)
+                except EOFError:
+                    # the items that were there have been read nevertheless
+                    yield from chunk
+                    return
+                yield from chunk
+        else:
+            while True:
+                try:
+                    chunk = pickle.load(fh)
+                except EOFError:
+                    return
+                yield from chunk
+
+
+class RunLog(object):
+    # records in the order in which they have been added
+
+    def __init__(self, path, typecode=None):
+        self.path = path
+        self.typecode = typecode
+        self.buffer = []
+        self.count = 0
+        open(path, "wb").close()
+
+    def add(self, record):
+
+        buffer = self.buffer
+        buffer.append(record)
+        if len(buffer) >= CHUNK:
+            self._flush()
+
+    def _flush(self):
+
+        buffer = self.buffer
+        if buffer:
+            writeRun(self.path, buffer, self.typecode, append=True)
+            self.count += len(buffer)
+            self.buffer = []
+
+    def __len__(self):
+
+        return self.count + len(self.buffer)
+
+    def __iter__(self):
+
+        self._flush()
+        return readRun(self.path, self.typecode)
+
+
+class RunSorter(object):
+    # records in sorted order, sorted by an external merge sort
+
+    def __init__(self, base, typecode=None, size=SPILL_SIZE):
+        self.base = base
+        self.typecode = typecode
+        self.size = max((size, 1))
+        self.buffer = array(typecode) if typecode else []
+        self.runs = []
+        self.made = 0
+        self.count = 0
+
+    def add(self, record):
+
+        buffer = self.buffer
+        buffer.append(record)
+        if len(buffer) >= self.size:
+            self._spill()
+
+    def _newRun(self):
+
+        path = f"{self.base}.{self.made}"
+        self.made += 1
+        return path
+
+    def _spill(self):
+
+        buffer = self.buffer
+        if not len(buffer):
+            return
+        path = self._newRun()
+        writeRun(path, sorted(buffer), self.typecode)
+        self.runs.append(path)
+        self.count += len(buffer)
+        self.buffer = array(self.typecode) if self.typecode else []
+
+    def finish(self):
+
+        self._spill()
+        typecode = self.typecode
+        runs = self.runs
+        # merge in several passes if there are too many runs to open at once
+        while len(runs) > FAN_IN:
+            group = runs[0:FAN_IN]
+            path = self._newRun()
+            writeRun(path, merge(*(readRun(p, typecode) for p in group)), typecode)
+            for p in group:
+                os.unlink(p)
+            runs = runs[FAN_IN:] + [path]
+        self.runs = runs
+
+    def __len__(self):
+
+        return self.count + len(self.buffer)
+
+    def __iter__(self):
+
+        self.finish()
+        typecode = self.typecode
+        return merge(*(readRun(p, typecode) for p in self.runs))
+
+
+class Spill(object):
+
+    def __init__(self, location=None, size=SPILL_SIZE):
+        if location is not None:
+            location = os.path.expanduser(location)
+            os.makedirs(location, exist_ok=True)
+        self.tempDir = tempfile.mkdtemp(prefix="cv-", dir=location)
+        self.size = size
+        self.made = 0
+        self.slots = {}
+        self.nodeFeatures = {}
+        self.edgeFeatures = {}
+        self.edgeValues = set()
+
+    def _path(self, kind):
+
+        path = f"{self.tempDir}/{kind}{self.made}"
+        self.made += 1
+        return path
+
+    def log(self, kind, typecode=None):
+
+        return RunLog(self._path(kind), typecode=typecode)
+
+    def sorter(self, kind, typecode=None):
+
+        return RunSorter(self._path(kind), typecode=typecode, size=self.size)
+
+    def addSlot(self, node, slot):
+
+        (nType, seq) = node
+        sorter = self.slots.get(nType, None)
+        if sorter is None:
+            sorter = self.sorter("slots", typecode="Q")
+            self.slots[nType] = sorter
+        sorter.add(seq << SEQ_SHIFT | slot)
+
+    def addFeature(self, feat, node, value):
+
+        log = self.nodeFeatures.get(feat, None)
+        if log is None:
+            log = self.log("node")
+            self.nodeFeatures[feat] = log
+        log.add((node, value))
+
+    def addEdge(self, feat, nodeFrom, nodeTo, value):
+
+        log = self.edgeFeatures.get(feat, None)
+        if log is None:
+            log = self.log("edge")
+            self.edgeFeatures[feat] = log
+        log.add((nodeFrom, nodeTo, value))
+        if value is not None:
+            self.edgeValues.add(feat)
+
+    def nodeSlots(self, nType):
+        # yields (seq, slots) in the order of seq, the slots sorted and distinct
+
+        sorter = self.slots.get(nType, None)
+        if sorter is None:
+            return
+        curSeq = None
+        slots = None
+        for packed in sorter:
+            seq = packed >> SEQ_SHIFT
+            slot = packed & SLOT_MASK
+            if seq != curSeq:
+                if curSeq is not None:
+                    yield (curSeq, slots)
+                curSeq = seq
+                slots = array("I", (slot,))
+            elif slot != slots[-1]:
+                slots.append(slot)
+        if curSeq is not None:
+            yield (curSeq, slots)
+
+    def close(self):
+
+        shutil.rmtree(self.tempDir, ignore_errors=True)
+
+
+def lastValues(records):
+    # records (n, i, value) sorted by node and then by the order of assignment:
+    # the last assignment to a node counts
+
+    def items():
+
+        prev = None
+        for (n, i, value) in records:
+            if prev is not None and n != prev[0]:
+                yield prev
+            prev = (n, value)
+        if prev is not None:
+            yield prev
+
+    return items
+
+
+def lastEdgeValues(records, hasValues):
+    # records (nFrom, nTo, i, value) sorted by from node, to node
+    # and the order of assignment
+
+    def items():
+
+        curFrom = None
+        toValues = None
+        for (nFrom, nTo, i, value) in records:
+            if nFrom != curFrom:
+                if curFrom is not None:
+                    yield (curFrom, toValues)
+                curFrom = nFrom
+                toValues = {} if hasValues else set()
+            if hasValues:
+                toValues[nTo] = value
+            else:
+                toValues.add(nTo)
+        if curFrom is not None:
+            yield (curFrom, toValues)
+
+    return items
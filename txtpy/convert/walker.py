@@ -1,10 +1,51 @@
 
 import collections
-import functools
 import re
+from time import perf_counter, process_time
+from array import array
+from bisect import bisect_right
+from itertools import chain
 
-from ..core.data import WARP
-from ..core.helpers import itemize, isInt
+from ..core.data import WARP, StreamedData
+from ..core.helpers import itemize, isInt, slotsKey
+from .spill import Spill, lastValues, lastEdgeValues
+
+# The slots of a node are kept as a flat list of ranges: b0, e0, b1, e1, ...
+# sorted, with gaps between the ranges.
+# New slots come in increasing order, they extend the last range or start a new one.
+
+
+def addSlot(ranges, s):
+
+    if not ranges or s > ranges[-1] + 1:
+        ranges.extend((s, s))
+        return
+    if s == ranges[-1] + 1:
+        ranges[-1] = s
+        return
+
+    # a slot that arrives out of order
+    i = bisect_right(ranges, s)
+    if i % 2 or s == ranges[i - 1]:
+        # s is already in a range
+        return
+    extendsLeft = i > 0 and s == ranges[i - 1] + 1
+    extendsRight = s == ranges[i] - 1
+    if extendsLeft and extendsRight:
+        del ranges[i - 1 : i + 1]
+    elif extendsLeft:
+        ranges[i - 1] = s
+    elif extendsRight:
+        ranges[i] = s
+    else:
+        ranges[i:i] = (s, s)
+
+
+def slotsFromRanges(ranges):
+
+    return chain.from_iterable(
+        range(ranges[i], ranges[i + 1] + 1) for i in range(0, len(ranges), 2)
+    )
 
 
 class CV(object):
@@ -94,6 +135,8 @@ class CV(object):
         warn=True,
         generateTf=True,
         force=False,
+        spill=False,
+        profile=False,
     ):
 
         tmObj = self.TF.tmObj
@@ -117,44 +160,98 @@ class CV(object):
         self.metaData = {}
         self.nodeFeatures = {}
         self.edgeFeatures = {}
+        # wall and cpu time per phase of the conversion
+        self.phases = {}
+
+        # Out-of-core conversion: slots and features go to files on disk,
+        # in a temporary directory in spill (if it is a directory)
+        # or in the system's temporary location.
+        # The files are removed when walk() is done, also if it fails;
+        # the spilled features can only be saved by walk() itself.
+        # The slots and feature values are not at hand during the walk:
+        # a director that calls cv.linked(), or cv.get() for other features
+        # than section features, cannot spill; those calls raise a RuntimeError.
+        self.spill = (
+            None if not spill else Spill(location=None if spill is True else spill)
+        )
 
-        indent(level=1, reset=True)
-        self._prepareMeta(otext, generic)
+        try:
+            indent(level=1, reset=True)
+            self._prepareMeta(otext, generic)
 
-        indent(level=1, reset=True)
-        self._follow(director)
+            timed = self._timed
 
-        indent(level=1, reset=True)
-        self._removeUnlinked()
+            indent(level=1, reset=True)
+            timed("follow", self._follow, director)
 
-        indent(level=1, reset=True)
-        self._checkGraph()
+            if self.spill is None:
+                indent(level=1, reset=True)
+                timed("removeUnlinked", self._removeUnlinked)
 
-        indent(level=1, reset=True)
-        self._checkFeatures()
+                indent(level=1, reset=True)
+                timed("checkGraph", self._checkGraph)
 
-        indent(level=1, reset=True)
-        self._reorderNodes()
+            indent(level=1, reset=True)
+            timed("checkFeatures", self._checkFeatures)
 
-        indent(level=1, reset=True)
-        self._reassignFeatures()
+            indent(level=1, reset=True)
+            if self.spill is None:
+                timed("reorderNodes", self._reorderNodes)
+            else:
+                # removes the unlinked nodes as well
+                timed("reorderNodes", self._reorderSpilled)
 
-        if generateTf:
+            indent(level=1, reset=True)
+            if self.spill is None:
+                timed("reassignFeatures", self._reassignFeatures)
+            else:
+                # checks the edges and the feature values as well
+                timed("reassignFeatures", self._reassignSpilled)
 
-            indent(level=0)
+            if generateTf:
 
-            if self.good or self.force:
-                self.good = self.TF.save(
-                    metaData=self.metaData,
-                    nodeFeatures=self.nodeFeatures,
-                    edgeFeatures=self.edgeFeatures,
-                )
+                indent(level=0)
+
+                if self.good or self.force:
+                    self.good = timed(
+                        "save",
+                        self.TF.save,
+                        metaData=self.metaData,
+                        nodeFeatures=self.nodeFeatures,
+                        edgeFeatures=self.edgeFeatures,
+                    )
+        finally:
+            if self.spill is not None:
+                self.spill.close()
 
         self._showWarnings()
+        if profile:
+            self.showPhases()
         setSilent(self.wasSilent)
 
         return self.good
 
+    def _timed(self, phase, func, *args, **kwargs):
+
+        wall = perf_counter()
+        cpu = process_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.phases[phase] = (perf_counter() - wall, process_time() - cpu)
+
+    def showPhases(self):
+
+        info = self.TF.tmObj.info
+        phases = self.phases
+
+        info(f"{'phase':<16} {'wall':>9} {'cpu':>9}", tm=False, force=True)
+        for (phase, (wall, cpu)) in phases.items():
+            info(f"{phase:<16} {wall:>8.3f}s {cpu:>8.3f}s", tm=False, force=True)
+        wall = sum(times[0] for times in phases.values())
+        cpu = sum(times[1] for times in phases.values())
+        info(f"{'total':<16} {wall:>8.3f}s {cpu:>8.3f}s", tm=False, force=True)
+
     def _prepareMeta(self, otext, generic):
         varRe = re.compile(r"\{([^}]+)\}")
 
@@ -368,6 +465,7 @@ class CV(object):
         curSeq = self.curSeq
         curEmbedders = self.curEmbedders
         oslots = self.oslots
+        spill = self.spill
         levelFromSection = self.levelFromSection
         warnings = self.warnings
 
@@ -378,10 +476,22 @@ class CV(object):
         seq = curSeq[nType]
 
         inSection = False
-        for eNode in curEmbedders:
-            if eNode[0] in levelFromSection:
-                inSection = True
-            oslots[eNode].add(seq)
+        if spill is None:
+            # seq is bigger than all slots so far
+            for eNode in curEmbedders:
+                if eNode[0] in levelFromSection:
+                    inSection = True
+                ranges = oslots[eNode]
+                if ranges and ranges[-1] == seq - 1:
+                    ranges[-1] = seq
+                else:
+                    ranges.extend((seq, seq))
+        else:
+            addSlot = spill.addSlot
+            for eNode in curEmbedders:
+                if eNode[0] in levelFromSection:
+                    inSection = True
+                addSlot(eNode, seq)
 
         if levelFromSection and not inSection:
             warnings["slot outside sections"].append(f"{seq}")
@@ -414,9 +524,10 @@ class CV(object):
             for s in slots:
                 if not 1 <= s <= maxSlot:
                     errors[f'slot out of range in `cv.node(({nType}, {seq}))`'].append(f"{s}")
+                elif self.spill is None:
+                    addSlot(self.oslots[node], s)
                 else:
-                    oslots = self.oslots
-                    oslots[node].add(s)
+                    self.spill.addSlot(node, s)
 
             self.stats[self.T] += 1
         else:
@@ -440,8 +551,12 @@ class CV(object):
 
         (nType, seq) = node
         if nType == self.slotType:
-            for eNode in curEmbedders:
-                oslots[eNode].add(seq)
+            if self.spill is None:
+                for eNode in curEmbedders:
+                    addSlot(oslots[eNode], seq)
+            else:
+                for eNode in curEmbedders:
+                    self.spill.addSlot(eNode, seq)
         else:
             self._checkSecLevel(node, before=None)
             curEmbedders.add(node)
@@ -449,6 +564,7 @@ class CV(object):
     def feature(self, node, **features):
 
         nodeFeatures = self.nodeFeatures
+        spill = self.spill
 
         self.stats[self.F] += 1
 
@@ -456,17 +572,26 @@ class CV(object):
             if v is None:
                 continue
             # self._checkType(k, v, self.N)
-            nodeFeatures[k][node] = v
+            if spill is None:
+                nodeFeatures[k][node] = v
+            else:
+                spill.addFeature(k, node, v)
+                if k in self.sectionValues:
+                    self.sectionValues[k][node] = v
 
     def edge(self, nodeFrom, nodeTo, **features):
 
         edgeFeatures = self.edgeFeatures
+        spill = self.spill
 
         self.stats[self.E] += 1
 
         for (k, v) in features.items():
             # self._checkType(k, v, self.E)
-            edgeFeatures[k][nodeFrom][nodeTo] = v
+            if spill is None:
+                edgeFeatures[k][nodeFrom][nodeTo] = v
+            else:
+                spill.addEdge(k, nodeFrom, nodeTo, v)
 
     def occurs(self, feat):
 
@@ -510,8 +635,10 @@ class CV(object):
 
     def linked(self, node):
 
+        if self.spill is not None:
+            raise RuntimeError("cv.linked() is not available when spilling")
         oslots = self.oslots
-        return tuple(oslots.get(node, []))
+        return tuple(slotsFromRanges(oslots.get(node, [])))
 
     def active(self, node):
 
@@ -531,6 +658,14 @@ class CV(object):
             errors["use `cv.get(ft, n)` or `cv.get(ft, nf, nt)`"].append(None)
             return None
 
+        if self.spill is not None:
+            # when spilling, only the values of section features are at hand
+            if len(args) == 1 and feature in self.sectionValues:
+                return self.sectionValues[feature].get(args[0], None)
+            raise RuntimeError(
+                f'cv.get() only delivers section features when spilling, not "{feature}"'
+            )
+
         return (
             nodeFeatures.get(feature, {}).get(args[0], None)
             if len(args) == 1
@@ -540,7 +675,9 @@ class CV(object):
     def _checkSecLevel(self, node, before=True):
         levelFromSection = self.levelFromSection
         sectionFeatures = self.sectionFeatures
-        nodeFeatures = self.nodeFeatures
+        nodeFeatures = (
+            self.nodeFeatures if self.spill is None else self.sectionValues
+        )
         warnings = self.warnings
         curEmbedders = self.curEmbedders
 
@@ -595,12 +732,19 @@ class CV(object):
 
         slotType = self.slotType
         errors = self.errors
+        spill = self.spill
 
-        self.oslots = collections.defaultdict(set)
-        self.nodeFeatures = collections.defaultdict(dict)
-        self.edgeFeatures = collections.defaultdict(
-            lambda: collections.defaultdict(dict)
-        )
+        if spill is None:
+            self.oslots = collections.defaultdict(list)
+            self.nodeFeatures = collections.defaultdict(dict)
+            self.edgeFeatures = collections.defaultdict(
+                lambda: collections.defaultdict(dict)
+            )
+        else:
+            self.oslots = None
+            self.nodeFeatures = spill.nodeFeatures
+            self.edgeFeatures = spill.edgeFeatures
+            self.sectionValues = {feat: {} for feat in self.sectionFeatures}
         self.nodes = collections.defaultdict(set)
         nodes = self.nodes
 
@@ -625,8 +769,11 @@ class CV(object):
         totalNodes = 0
 
         for (nType, lastSeq) in sorted(self.curSeq.items()):
-            for seq in range(1, lastSeq + 1):
-                nodes[nType].add(seq)
+            if spill is None:
+                for seq in range(1, lastSeq + 1):
+                    nodes[nType].add(seq)
+            else:
+                nodes[nType] = range(1, lastSeq + 1)
             slotRep = " = slot type" if nType == slotType else ""
             info(f'{lastSeq:>8} x "{nType}" node {slotRep}', tm=False)
             totalNodes += lastSeq
@@ -745,9 +892,12 @@ class CV(object):
         nodes = self.nodes
         nodeFeatures = self.nodeFeatures
         edgeFeatures = self.edgeFeatures
+        spill = self.spill
 
         errors = self.errors
 
+        # when spilling, the values are checked while they are reassigned
+
         for feat in intFeatures:
             if (
                 feat not in WARP
@@ -778,12 +928,13 @@ class CV(object):
                 errors["structure"].append(
                     f'"{feat}" is declared as a structure feature, but this node feature does not occur'
                 )
-                nodeFeatures[feat] = {}
+                if spill is None:
+                    nodeFeatures[feat] = {}
 
         structureSet = self.structureSet
         featFromType = self.featFromType
         for nType in nodes:
-            if nType not in structureSet:
+            if spill is not None or nType not in structureSet:
                 continue
             feat = featFromType[nType]
             for seq in nodes[nType]:
@@ -819,25 +970,29 @@ class CV(object):
                     f'node feature "{feat}" has metadata but does not occur'
                 )
 
-        for (feat, featData) in sorted(nodeFeatures.items()):
-            if None in featData:
-                errors["feature values assigned to None"].append(
-                    f'node feature "{feat}" has a node None'
-                )
-        for (feat, featData) in sorted(edgeFeatures.items()):
-            if None in featData:
-                errors["feature values assigned to None"].append(
-                    f'edge feature "{feat}" has a from-node None'
-                )
-            for toValues in featData.values():
-                if None in toValues:
+        if spill is None:
+            for (feat, featData) in sorted(nodeFeatures.items()):
+                if None in featData:
+                    errors["feature values assigned to None"].append(
+                        f'node feature "{feat}" has a node None'
+                    )
+            for (feat, featData) in sorted(edgeFeatures.items()):
+                if None in featData:
                     errors["feature values assigned to None"].append(
-                        f'edge feature "{feat}" has a to-node None'
+                        f'edge feature "{feat}" has a from-node None'
                     )
+                for toValues in featData.values():
+                    if None in toValues:
+                        errors["feature values assigned to None"].append(
+                            f'edge feature "{feat}" has a to-node None'
+                        )
 
         for (feat, featData) in sorted(edgeFeatures.items()):
             if feat in WARP:
                 continue
+            if spill is not None:
+                metaData.setdefault(feat, {})["edgeValues"] = feat in spill.edgeValues
+                continue
             hasValues = False
             for (nodeTo, toValues) in featData.items():
                 if any(v is not None for v in toValues.values()):
@@ -851,7 +1006,7 @@ class CV(object):
             metaData.setdefault(feat, {})["edgeValues"] = hasValues
 
         for feat in intFeatures:
-            if feat in WARP:
+            if feat in WARP or spill is not None:
                 continue
             if feat in nodeFeatures:
                 featData = nodeFeatures[feat]
@@ -919,26 +1074,22 @@ class CV(object):
 
     def _canonical(self, nType):
         oslots = self.oslots
+        end = self.maxSlot + 1
 
-        def before(nodeA, nodeB):
-            slotsA = oslots[(nType, nodeA)]
-            slotsB = oslots[(nType, nodeB)]
-            if slotsA == slotsB:
-                return 0
-
-            aWithoutB = slotsA - slotsB
-            if not aWithoutB:
-                return 1
-
-            bWithoutA = slotsB - slotsA
-            if not bWithoutA:
-                return -1
+        # Comparing these keys is comparing the nodes in canonical order:
+        # the starts and the negated ends of the ranges, terminated by end
+        # (see slotsKey() in core.helpers)
 
-            aMin = min(aWithoutB)
-            bMin = min(bWithoutA)
-            return -1 if aMin < bMin else 1
+        def key(seq):
+            ranges = oslots[(nType, seq)]
+            if len(ranges) == 2:
+                return (ranges[0], -ranges[1], end)
+            k = list(ranges)
+            k[1::2] = [-e for e in ranges[1::2]]
+            k.append(end)
+            return tuple(k)
 
-        return functools.cmp_to_key(before)
+        return key
 
     def _reassignFeatures(self):
         tmObj = self.TF.tmObj
@@ -956,7 +1107,21 @@ class CV(object):
         edgeFeatures = self.edgeFeatures
 
         otype = {n: nType for ((nType, seq), n) in nodeMap.items()}
-        oslots = {nodeMap[node]: slots for (node, slots) in oslots.items()}
+
+        # oslots goes to TF.save as ranges, in node order;
+        # save writes the .tf file and the binary from them
+        maxSlot = self.maxSlot
+        maxNode = self.maxNode
+        slotRanges = [None] * (maxNode - maxSlot)
+        for (node, ranges) in oslots.items():
+            slotRanges[nodeMap[node] - maxSlot - 1] = ranges
+
+        def oslotsItems():
+            n = maxSlot
+            for ranges in slotRanges:
+                n += 1
+                if ranges:
+                    yield (n, tuple(zip(ranges[0::2], ranges[1::2])))
 
         nodeFeaturesProto = self.nodeFeatures
         edgeFeaturesProto = self.edgeFeatures
@@ -993,7 +1158,250 @@ class CV(object):
             edgeFeatures[k] = featureData
 
         nodeFeatures["otype"] = otype
-        edgeFeatures["oslots"] = oslots
+        edgeFeatures["oslots"] = (
+            StreamedData(oslotsItems, ranged=True),
+            maxSlot,
+            maxNode,
+        )
+
+        indent(level=1)
+
+        self.oslots = None
+        self.otype = None
+        self.nodeFeatures = nodeFeatures
+        self.edgeFeatures = edgeFeatures
+
+        self._showErrors()
+
+    def _reorderSpilled(self):
+        tmObj = self.TF.tmObj
+        info = tmObj.info
+        indent = tmObj.indent
+
+        if not self.good and not self.force:
+            return
+
+        info("reordering nodes ...")
+
+        spill = self.spill
+        nodeTypes = self.curSeq
+        slotType = self.slotType
+
+        nTypes = tuple(sorted(nType for nType in nodeTypes if nType != slotType))
+
+        # per node type: the new node numbers by sequence number, 0 for removed nodes
+        self.nodeMap = {}
+        self.maxSlot = nodeTypes[slotType]
+        self.typeRanges = [(slotType, 1, self.maxSlot)]
+        # the slots of the non-slot nodes, in the order of their new numbers,
+        # as the keys by which they have been sorted
+        self.oslotKeys = spill.log("oslots")
+
+        nodeMap = self.nodeMap
+        maxSlot = self.maxSlot
+        typeRanges = self.typeRanges
+        oslotKeys = self.oslotKeys
+        end = maxSlot + 1
+
+        unlinked = {}
+        n = maxSlot
+
+        for nType in nTypes:
+            lastSeq = nodeTypes[nType]
+            seqMap = array("I", bytes(4 * (lastSeq + 1)))
+            keys = spill.sorter("keys")
+            removed = []
+            nRemoved = 0
+            prevSeq = 0
+            for (seq, slots) in spill.nodeSlots(nType):
+                if seq > prevSeq + 1:
+                    removed.extend(range(prevSeq + 1, seq)[0 : 5 - len(removed)])
+                    nRemoved += seq - prevSeq - 1
+                keys.add(slotsKey(slots, end) + (seq,))
+                prevSeq = seq
+            if lastSeq > prevSeq:
+                removed.extend(range(prevSeq + 1, lastSeq + 1)[0 : 5 - len(removed)])
+                nRemoved += lastSeq - prevSeq
+            if nRemoved:
+                unlinked[nType] = (nRemoved, removed)
+
+            info(f'Sorting {len(keys)} nodes of type "{nType}"')
+            first = n + 1
+            for key in keys:
+                n += 1
+                seqMap[key[-1]] = n
+                oslotKeys.add(key[0:-2])
+            nodeMap[nType] = seqMap
+            if n >= first:
+                typeRanges.append((nType, first, n))
+
+        if unlinked:
+            info("Removing unlinked nodes ... ")
+            indent(level=2)
+            totalRemoved = 0
+            for (nType, (lSeqs, seqs)) in unlinked.items():
+                totalRemoved += lSeqs
+                rep = " ..." if lSeqs > 5 else ""
+                pl = "" if lSeqs == 1 else "s"
+                info(f'{lSeqs:>6} unlinked "{nType}" node{pl}: {seqs}{rep}')
+            pl = "" if totalRemoved == 1 else "s"
+            info(f"{totalRemoved:>6} unlinked node{pl}")
+            self.totalNodes -= totalRemoved
+            info(f"Leaving {self.totalNodes:>6} nodes")
+            indent(level=1)
+
+        self.maxNode = n
+        info(f"Max node = {n}")
+
+        self._showErrors()
+
+    def _reassignSpilled(self):
+        tmObj = self.TF.tmObj
+        info = tmObj.info
+        indent = tmObj.indent
+
+        if not self.good and not self.force:
+            return
+
+        info("reassigning feature values ...")
+
+        spill = self.spill
+        errors = self.errors
+        nodeTypes = self.curSeq
+        slotType = self.slotType
+        maxSlot = self.maxSlot
+        maxNode = self.maxNode
+        nodeMap = self.nodeMap
+        intFeatures = self.intFeatures
+        featFromType = self.featFromType
+        typeRanges = self.typeRanges
+        oslotKeys = self.oslotKeys
+
+        def exists(node):
+            if type(node) is not tuple or len(node) != 2:
+                return False
+            (nType, seq) = node
+            return (
+                nType in nodeTypes
+                and type(seq) is int
+                and 1 <= seq <= nodeTypes[nType]
+            )
+
+        def mapNode(node):
+            # the new number of an existing node, 0 if it has been removed
+            (nType, seq) = node
+            return seq if nType == slotType else nodeMap[nType][seq]
+
+        nodeFeatures = {}
+        edgeFeatures = {}
+
+        indent(level=2)
+
+        for k in sorted(spill.nodeFeatures):
+            log = spill.nodeFeatures[k]
+            ln = len(log)
+            pl = "" if ln == 1 else "s"
+            info(f'node feature "{k}" with {ln} assignment{pl}')
+            checkInt = k in intFeatures
+            # the structure types that need a value for this feature
+            seen = {
+                nType: bytearray(nodeTypes[nType] + 1)
+                for (nType, feat) in featFromType.items()
+                if feat == k and nType in nodeTypes
+            }
+            records = spill.sorter("values")
+            for (i, (node, value)) in enumerate(log):
+                if node is None:
+                    errors["feature values assigned to None"].append(
+                        f'node feature "{k}" has a node None'
+                    )
+                    continue
+                if not exists(node):
+                    continue
+                n = mapNode(node)
+                if not n:
+                    continue
+                (nType, seq) = node
+                if checkInt and not isInt(value):
+                    errors["Not a number"].append(
+                        f'"node feature "{k}": {nType} {seq} => "{value}"'
+                    )
+                if nType in seen:
+                    seen[nType][seq] = 1
+                records.add((n, i, value))
+            for (nType, marks) in seen.items():
+                for seq in range(1, len(marks)):
+                    if not marks[seq] and mapNode((nType, seq)):
+                        errors["structure features"].append(
+                            f'"structure element "{nType}" {seq} has no value for "{k}"'
+                        )
+            records.finish()
+            nodeFeatures[k] = StreamedData(lastValues(records))
+
+        for k in sorted(spill.edgeFeatures):
+            log = spill.edgeFeatures[k]
+            ln = len(log)
+            pl = "" if ln == 1 else "s"
+            info(f'edge feature "{k}" with {ln} assignment{pl}')
+            hasValues = k in spill.edgeValues
+            checkInt = hasValues and k in intFeatures
+            records = spill.sorter("values")
+            for (i, (nodeFrom, nodeTo, value)) in enumerate(log):
+                if nodeFrom is None or nodeTo is None:
+                    end = "from" if nodeFrom is None else "to"
+                    errors["feature values assigned to None"].append(
+                        f'edge feature "{k}" has a {end}-node None'
+                    )
+                    continue
+                if not exists(nodeFrom):
+                    errors["Edge feature: illegal node"].append(
+                        f'"{k}": from-node  {nodeFrom} not in node set'
+                    )
+                    continue
+                if not exists(nodeTo):
+                    errors["Edge feature: illegal node"].append(
+                        f'"{k}": to-node  {nodeTo} not in node set'
+                    )
+                    continue
+                nFrom = mapNode(nodeFrom)
+                if not nFrom:
+                    continue
+                # an edge to an unlinked node is an error, as in _checkGraph,
+                # where the unlinked nodes have left the node set
+                nTo = mapNode(nodeTo)
+                if not nTo:
+                    errors["Edge feature: illegal node"].append(
+                        f'"{k}": to-node  {nodeTo} not in node set'
+                    )
+                    continue
+                if checkInt and not isInt(value):
+                    (fType, fNode) = nodeFrom
+                    (tType, tNode) = nodeTo
+                    errors["Not a number"].append(
+                        f'"edge feature "{k}":'
+                        f' {fType} {fNode} ="{value}"=> {tType} {tNode}'
+                    )
+                records.add((nFrom, nTo, i, value))
+            records.finish()
+            edgeFeatures[k] = StreamedData(lastEdgeValues(records, hasValues))
+
+        def otypeItems():
+            for (nType, b, e) in typeRanges:
+                for n in range(b, e + 1):
+                    yield (n, nType)
+
+        def oslotsItems():
+            n = maxSlot
+            for key in oslotKeys:
+                n += 1
+                yield (n, tuple((key[i], -key[i + 1]) for i in range(0, len(key), 2)))
+
+        nodeFeatures["otype"] = (StreamedData(otypeItems), slotType, maxSlot, maxNode)
+        edgeFeatures["oslots"] = (
+            StreamedData(oslotsItems, ranged=True),
+            maxSlot,
+            maxNode,
+        )
 
         indent(level=1)
 
@@ -5,6 +5,7 @@ from .locality import Locality
 from .nodefeature import NodeFeatures
 from .edgefeature import EdgeFeatures
 from .computed import Computeds
+from .lazy import LazyFeature
 from .text import Text
 from ..search.search import Search
 
@@ -79,14 +80,18 @@ class Api(object):
         if not hasattr(self.F, fName):
             self.TF.error(f'Node feature "{fName}" not loaded')
             return None
-        return getattr(self.F, fName)
+        feature = getattr(self.F, fName)
+        # hand out the loaded feature itself, which is faster in loops
+        return feature._resolve() if type(feature) is LazyFeature else feature
 
     def Es(self, fName):
 
         if not hasattr(self.E, fName):
             self.TF.error(f'Edge feature "{fName}" not loaded')
             return None
-        return getattr(self.E, fName)
+        feature = getattr(self.E, fName)
+        # hand out the loaded feature itself, which is faster in loops
+        return feature._resolve() if type(feature) is LazyFeature else feature
 
     def Cs(self, fName):
 
@@ -150,11 +155,15 @@ class Api(object):
                 continue
             if fObj.dataLoaded and (hasattr(F, fName) or hasattr(E, fName)):
                 loadedFeatures.add(fName)
+            elif type(F.__dict__.get(fName, E.__dict__.get(fName, None))) is LazyFeature:
+                # will be loaded on first use
+                loadedFeatures.add(fName)
             else:
                 needToLoad.add(fName)
         if len(needToLoad):
+            # when loading lazily, the features get proxies
             TF.load(
-                needToLoad, add=True, silent="deep",
+                needToLoad, add=True, silent="deep", lazy=TF.residency is not None,
             )
             loadedFeatures |= needToLoad
         return loadedFeatures
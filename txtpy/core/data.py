@@ -3,17 +3,38 @@ import pickle
 import gzip
 import collections
 from array import array
+from itertools import chain
 import time
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from ..parameters import PACK_VERSION, PICKLE_PROTOCOL, GZIP_LEVEL
 from .helpers import (
-    setFromSpec,
-    valueFromTf,
     tfFromValue,
     specFromRanges,
     rangesFromSet,
     check32,
     console,
+    tempPath,
+)
+from .mapped import (
+    isMapped,
+    readMapped,
+    writeMapped,
+    compactNodeData,
+    MappedArrays,
+    MappedNodeData,
+)
+from .tfparse import (
+    CHUNK_SIZE,
+    parseLines,
+    parseChunk,
+    chunkBounds,
+    resolveBlocks,
+    nodeDataFromBlocks,
+    otypeFromBlocks,
+    edgeDataFromBlocks,
+    oslotsFromBlocks,
 )
 
 ERROR_CUTOFF = 20
@@ -36,6 +57,248 @@ MEM_MSG = (
 )
 
 
+def readBin(binPath):
+    if isMapped(binPath):
+        return readMapped(binPath)
+    with gzip.open(binPath, "rb") as f:
+        return pickle.load(f)
+
+
+def writeBin(binPath, kind, data, dataType, edgeValues):
+    # write to a temporary file first: the current binary may be mapped
+    # into memory, and overwriting it in place would corrupt that data
+    tmpPath = tempPath(binPath)
+    try:
+        if not writeMapped(
+            tmpPath, kind, data, dataType=dataType, edgeValues=edgeValues
+        ):
+            with gzip.open(tmpPath, "wb", compresslevel=GZIP_LEVEL) as f:
+                pickle.dump(data, f, protocol=PICKLE_PROTOCOL)
+        os.replace(tmpPath, binPath)
+    finally:
+        # only there if it has not replaced the binary
+        if os.path.exists(tmpPath):
+            os.unlink(tmpPath)
+
+
+def mappedKind(fileName, method, isEdge, data):
+    if fileName == WARP[0]:
+        return "otype"
+    if fileName == WARP[1]:
+        return "oslots"
+    if method:
+        return (
+            "array"
+            if type(data) is array
+            else "arrays"
+            if type(data) is MappedArrays
+            else None
+        )
+    return "edge" if isEdge else "node"
+
+
+def computeBin(fileName, method, binPath, depSpecs):
+    # Computes a feature in a separate process and delivers it
+    # through its binary file.
+    # The dependencies are given as (isConfig, metaData or binPath)
+    # Returns whether the computation succeeded and the messages issued
+
+    messages = []
+    cmpFormat = f"c {fileName:<20} {{}}"
+
+    def info(msg, tm=True):
+        messages.append((False, cmpFormat.format(msg), tm))
+
+    def error(msg, tm=True):
+        messages.append((True, cmpFormat.format(msg), tm))
+
+    depData = []
+    for (isConfig, spec) in depSpecs:
+        if isConfig:
+            depData.append(spec)
+        else:
+            data = readBin(spec)
+            if data is None:
+                error(f'cannot read "{spec}"')
+                return (False, messages)
+            depData.append(data)
+    data = method(info, error, *depData)
+    if data is None:
+        return (False, messages)
+    writeBin(binPath, mappedKind(fileName, method, False, data), data, "str", False)
+    return (True, messages)
+
+
+def saveFeature(
+    path, data, metaData, isEdge, isConfig, edgeValues, nodeRanges, tmObj=None
+):
+    # Writes a feature to its .tf file and to its binary cache,
+    # in a separate process, or in the main process if a tmObj is given.
+    # Returns whether the writing succeeded and the messages issued
+
+    msgLog = MessageLog() if tmObj is None else None
+    fObj = Data(
+        path,
+        msgLog or tmObj,
+        data=data,
+        metaData=metaData,
+        isEdge=isEdge,
+        isConfig=isConfig,
+        edgeValues=edgeValues,
+    )
+    good = fObj.save(nodeRanges=nodeRanges, overwrite=True, cache=True)
+    return (good, None if msgLog is None else msgLog.messages)
+
+
+def isStreamed(data):
+    return type(data) is StreamedData or (
+        type(data) is tuple and type(data[0]) is StreamedData
+    )
+
+
+def loadedData(fileName, isEdge, edgeValues, dataType, data):
+    # The data of a feature in the form it gets when its .tf file is read,
+    # or None if it is not certain that the .tf file reproduces it exactly
+
+    if fileName == WARP[0]:
+        return _loadedOtype(data)
+    if fileName == WARP[1]:
+        return _loadedOslots(data)
+    if type(data) is not dict:
+        return None
+    tp = int if dataType == "int" else str
+    loaded = {}
+    for n in sorted(data):
+        if type(n) is not int or n < 1:
+            return None
+        ms = data[n]
+        if isEdge:
+            if not ms or any(type(m) is not int or m < 1 for m in ms):
+                return None
+            if edgeValues:
+                # missing edge values do not survive a round trip
+                if type(ms) is not dict or any(type(v) is not tp for v in ms.values()):
+                    return None
+                loaded[n] = dict(ms)
+            else:
+                loaded[n] = frozenset(ms)
+        elif ms is not None:
+            if type(ms) is not tp:
+                return None
+            loaded[n] = ms
+    return loaded
+
+
+def _loadedOtype(data):
+    if type(data) is not dict or 1 not in data:
+        return None
+    slotType = data[1]
+    otype = []
+    maxSlot = 0
+    maxNode = len(data)
+    for n in range(1, maxNode + 1):
+        nType = data.get(n, None)
+        if type(nType) is not str or not nType:
+            return None
+        if nType == slotType:
+            if otype:
+                return None
+            maxSlot = n
+        else:
+            otype.append(nType)
+    return (tuple(otype), maxSlot, maxNode, slotType)
+
+
+def _loadedOslots(data):
+    if isStreamed(data):
+        return _loadedOslotsRanged(*data) if data[0].ranged else None
+    if type(data) is not dict or not data:
+        return None
+    nodes = sorted(data)
+    maxSlot = nodes[0] - 1
+    maxNode = nodes[-1]
+    if maxSlot < 1 or maxNode - maxSlot != len(nodes):
+        return None
+    oslots = []
+    for n in nodes:
+        slots = sorted(set(data[n]))
+        if not slots or type(slots[0]) is not int or slots[0] < 1:
+            return None
+        oslots.append(array("I", slots))
+    return (tuple(oslots), maxSlot, maxNode)
+
+
+def _loadedOslotsRanged(streamed, maxSlot, maxNode):
+    # The slots of the nodes are made from their ranges one node at a time,
+    # while the binary is being written; they are never all in memory as sets.
+    # Nodes that are missing make the binary fail, oslots is then compiled
+    # from its .tf file when it is loaded.
+
+    def slotArrays():
+        expected = maxSlot + 1
+        for (n, ranges) in streamed.items():
+            if n != expected or not ranges:
+                raise ValueError(f"no slots for node {expected}")
+            expected += 1
+            slots = array("I")
+            for (b, e) in ranges:
+                slots.extend(range(b, e + 1))
+            yield slots
+        if expected != maxNode + 1:
+            raise ValueError(f"no slots for node {expected}")
+
+    return (slotArrays(), maxSlot, maxNode)
+
+
+class MessageLog(object):
+    # Stands in for a Timestamp object in a worker process:
+    # the messages are collected, and issued later by the main process
+
+    def __init__(self):
+        self.messages = []
+        self.silent = False
+
+    def info(self, msg, tm=True, nl=True, cache=0, force=False):
+
+        self.messages.append((False, msg, tm))
+
+    def warning(self, msg, tm=True, nl=True, cache=0, force=False):
+
+        self.messages.append((False, msg, tm))
+
+    def error(self, msg, tm=True, nl=True, cache=0):
+
+        self.messages.append((True, msg, tm))
+
+    def indent(self, level=None, reset=False, _verbose=None):
+
+        pass
+
+    def isSilent(self):
+        return self.silent
+
+    def setSilent(self, silent):
+
+        self.silent = silent
+
+
+class StreamedData(object):
+    # Feature data that is not held in memory, but delivered in node order
+    # by a function that can be called as often as needed,
+    # e.g. the results of an out-of-core conversion that are still on disk.
+    # For edge features the values per node are sets or dicts,
+    # or, if ranged, tuples of (first, last) ranges of target nodes.
+
+    def __init__(self, items, ranged=False):
+        self.items = items
+        self.ranged = ranged
+
+    def nodes(self):
+
+        for (n, value) in self.items():
+            yield n
+
+
 class Data(object):
     def __init__(
         self,
@@ -48,6 +311,7 @@ class Data(object):
         metaData={},
         method=None,
         dependencies=None,
+        workers=1,
     ):
         (dirName, baseName) = os.path.split(path)
         (fileName, extension) = os.path.splitext(baseName)
@@ -64,6 +328,7 @@ class Data(object):
         self.metaData = metaData
         self.method = method
         self.dependencies = dependencies
+        self.workers = workers
         self.data = data
         self.dataLoaded = False
         self.dataError = False
@@ -159,7 +424,7 @@ class Data(object):
         self.data = None
         self.dataLoaded = False
 
-    def save(self, overwrite=False, nodeRanges=False, silent=None):
+    def save(self, overwrite=False, nodeRanges=False, silent=None, cache=False):
         tmObj = self.tmObj
         isSilent = tmObj.isSilent
         setSilent = tmObj.setSilent
@@ -168,6 +433,8 @@ class Data(object):
             wasSilent = isSilent()
             setSilent(silent)
         result = self._writeTf(overwrite=overwrite, nodeRanges=nodeRanges)
+        if result and cache and not self.isConfig:
+            self._cacheDataBin()
         if silent is not None:
             setSilent(wasSilent)
         return result
@@ -247,89 +514,43 @@ class Data(object):
         error = tmObj.error
 
         errors = collections.defaultdict(list)
-        i = firstI
-        implicit_node = 1
-        data = {}
         isEdge = self.isEdge
         edgeValues = self.edgeValues
-        normFields = 3 if isEdge and edgeValues else 2
         isNum = self.dataType == "int"
-        for line in fh:
-            i += 1
-            fields = line.rstrip("\n").split("\t")
-            lfields = len(fields)
-            if lfields > normFields:
-                errors["wrongFields"].append(i)
-                continue
-            if lfields == normFields:
-                nodes = setFromSpec(fields[0])
-                if isEdge:
-                    if fields[1] == "":
-                        errors["emptyNode2Spec"].append(i)
-                        continue
-                    nodes2 = setFromSpec(fields[1])
-                if not isEdge or edgeValues:
-                    valTf = fields[-1]
-            else:
-                if isEdge:
-                    if edgeValues:
-                        if lfields == normFields - 1:
-                            nodes = {implicit_node}
-                            nodes2 = setFromSpec(fields[0])
-                            valTf = fields[-1]
-                        elif lfields == normFields - 2:
-                            nodes = {implicit_node}
-                            if fields[0] == "":
-                                errors["emptyNode2Spec"].append(i)
-                                continue
-                            nodes2 = setFromSpec(fields[0])
-                            valTf = ""
-                        else:
-                            nodes = {implicit_node}
-                            valTf = ""
-                            errors["emptyNode2Spec"].append(i)
-                            continue
-                    else:
-                        if lfields == normFields - 1:
-                            nodes = {implicit_node}
-                            if fields[0] == "":
-                                errors["emptyNode2Spec"].append(i)
-                                continue
-                            nodes2 = setFromSpec(fields[0])
-                        else:
-                            nodes = {implicit_node}
-                            errors["emptyNode2Spec"].append(i)
-                            continue
-                else:
-                    nodes = {implicit_node}
-                    if lfields == 1:
-                        valTf = fields[0]
-                    else:
-                        valTf = ""
-            implicit_node = max(nodes) + 1
-            if not isEdge or edgeValues:
-                value = (
-                    int(valTf)
-                    if isNum and valTf != ""
-                    else None
-                    if isNum
-                    else ""
-                    if valTf == ""
-                    else valueFromTf(valTf)
-                )
-            if isEdge:
-                for n in nodes:
-                    for m in nodes2:
-                        if not edgeValues:
-                            data.setdefault(n, set()).add(m)
-                        else:
-                            data.setdefault(n, {})[
-                                m
-                            ] = value  # even if the value is None
-            else:
-                for n in nodes:
-                    if value is not None:
-                        data[n] = value
+        fileName = self.fileName
+
+        chunks = None
+        # parsing in a pool is opt-in: Fabric(workers=n)
+        workers = self.workers
+        if (
+            workers is not None
+            and workers > 1
+            and os.path.getsize(self.path) > 2 * CHUNK_SIZE
+        ):
+            chunks = self._readChunks(firstI, workers)
+        if chunks is None:
+            chunks = [parseLines(fh, isEdge, edgeValues, isNum)]
+
+        i = firstI
+        for (blocks, chunkErrors, nLines, endState) in chunks:
+            for (kind, ln) in chunkErrors:
+                errors[kind].append(i + ln)
+            i += nLines
+        blocks = resolveBlocks([(chunk[0], chunk[3]) for chunk in chunks])
+
+        data = None
+        if fileName == WARP[0]:
+            blocks = list(blocks)
+            data = otypeFromBlocks(blocks)
+            if data is None:
+                data = nodeDataFromBlocks(blocks, False)
+        elif fileName == WARP[1]:
+            data = oslotsFromBlocks(blocks)
+        elif isEdge:
+            data = edgeDataFromBlocks(blocks, edgeValues)
+        else:
+            data = nodeDataFromBlocks(list(blocks), isNum)
+
         for kind in errors:
             lnk = len(errors[kind])
             error(
@@ -341,7 +562,9 @@ class Data(object):
                 error(f"\t and {lnk - ERROR_CUTOFF} more cases", tm=False)
         self.data = data
         if not errors:
-            if self.fileName == WARP[0]:
+            if self.fileName == WARP[0] and type(data) is tuple:
+                pass
+            elif self.fileName == WARP[0]:
                 slotType = data[1]
                 otype = []
                 maxSlot = 1
@@ -372,7 +595,7 @@ class Data(object):
                     pass
                 oslots = []
                 for n in nodeList:
-                    oslots.append(array("I", sorted(data[n])))
+                    oslots.append(data[n])
                 self.data = (tuple(oslots), maxSlot, maxNode)
             elif isEdge:
                 seen = {}
@@ -392,6 +615,8 @@ class Data(object):
                             seen[msx] = msx
                         datax[n] = seen[msx]
                 self.data = datax
+            elif type(data) is MappedNodeData:
+                pass
             else:
                 seen = {}
                 datax = {}
@@ -399,10 +624,30 @@ class Data(object):
                     if ms not in seen:
                         seen[ms] = ms
                     datax[n] = seen[ms]
-                self.data = datax
+                self.data = compactNodeData(datax, self.dataType) or datax
 
         return not errors
 
+    def _readChunks(self, firstI, workers):
+        # parse the data lines in byte ranges by a pool of processes
+        # we skip the metadata lines, which have been read already
+
+        with open(self.path, "rb") as fh:
+            for i in range(firstI):
+                fh.readline()
+            offset = fh.tell()
+        bounds = chunkBounds(self.path, offset)
+        args = (self.isEdge, self.edgeValues, self.dataType == "int")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(parseChunk, self.path, start, end, *args)
+                    for (start, end) in bounds
+                ]
+                return [future.result() for future in futures]
+        except (OSError, BrokenProcessPool):
+            return None
+
     def _compute(self, metaOnly=False):
         if metaOnly:
             return True
@@ -472,11 +717,32 @@ class Data(object):
                         f'Feature file "{fpath}" already exists, feature will not be written'
                     )
                     return False
+        # write to a temporary file first, so that the feature file
+        # is either the complete old one or the complete new one
+        tmpPath = tempPath(fpath)
         try:
-            fh = open(fpath, "w", encoding="utf8")
+            fh = open(tmpPath, "w", encoding="utf8")
         except Exception:
             error(f'Cannot write to feature file "{fpath}"')
             return False
+        try:
+            good = self._writeFh(fh, metaOnly=metaOnly, nodeRanges=nodeRanges)
+            fh.close()
+            if good:
+                os.replace(tmpPath, fpath)
+        finally:
+            fh.close()
+            # only there if it has not replaced the feature file
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+        msgFormat = "{:<1} {:<20} to {}"
+        if good:
+            info(msgFormat.format("M" if metaOnly else "T", fileName, dirName))
+        else:
+            error(msgFormat.format("M" if metaOnly else "T", fileName, dirName))
+        return good
+
+    def _writeFh(self, fh, metaOnly=False, nodeRanges=False):
         fh.write(
             "@{}\n".format(
                 "config" if self.isConfig else "edge" if self.isEdge else "node"
@@ -497,12 +763,6 @@ class Data(object):
         good = True
         if not metaOnly:
             good = self._writeDataTf(fh, nodeRanges=nodeRanges)
-        fh.close()
-        msgFormat = "{:<1} {:<20} to {}"
-        if good:
-            info(msgFormat.format("M" if metaOnly else "T", fileName, dirName))
-        else:
-            error(msgFormat.format("M" if metaOnly else "T", fileName, dirName))
         return good
 
     def _writeDataTf(self, fh, nodeRanges=False):
@@ -520,18 +780,22 @@ class Data(object):
             maxSlot = data[2] if fName == WARP[0] else data[1]
             slotType = data[1] if fName == WARP[0] else None
             data = data[0]
-            if fName == WARP[0]:
+            if type(data) is StreamedData:
+                pass
+            elif fName == WARP[0]:
                 data = dict(((k, slotType) for k in range(1, maxSlot + 1)))
                 data.update(
                     dict(((k + 1 + maxSlot, data[k]) for k in range(len(data))))
                 )
             elif self.fileName == WARP[1]:
                 data = dict(((k + 1 + maxSlot, data[k]) for k in range(len(data))))
+        streamed = type(data) is StreamedData
+        ranged = streamed and data.ranged
+        items = data.items() if streamed else ((n, data[n]) for n in sorted(data))
         edgeValues = self.edgeValues
         if self.isEdge:
             implicitNode = 1
-            for n in sorted(data):
-                thisData = data[n]
+            for (n, thisData) in items:
                 sets = {}
                 if edgeValues:
                     for m in thisData:
@@ -557,7 +821,9 @@ class Data(object):
                                 )
                             )
                 else:
-                    nodeSpec2 = specFromRanges(rangesFromSet(thisData))
+                    nodeSpec2 = specFromRanges(
+                        thisData if ranged else rangesFromSet(thisData)
+                    )
                     nodeSpec = "" if n == implicitNode else n
                     implicitNode = n + 1
                     fh.write(
@@ -565,9 +831,36 @@ class Data(object):
                     )
         else:
             sets = {}
-            if nodeRanges:
-                for n in sorted(data):
-                    sets.setdefault(data[n], []).append(n)
+            if nodeRanges and streamed:
+                # streamed data is not grouped by value,
+                # every run of nodes with the same value gets its own line
+                implicitNode = 1
+                run = None
+                for (n, value) in chain(items, ((None, None),)):
+                    if run is not None:
+                        if n == run[2] + 1 and value == run[0]:
+                            run[2] = n
+                            continue
+                        (runValue, b, e) = run
+                        nodeSpec = (
+                            ""
+                            if b == e == implicitNode
+                            else specFromRanges(((b, e),))
+                        )
+                        implicitNode = e
+                        tfValue = (
+                            runValue if runValue is None else tfFromValue(runValue)
+                        )
+                        if tfValue is not None:
+                            fh.write(
+                                "{}{}{}\n".format(
+                                    nodeSpec, "\t" if nodeSpec else "", tfValue,
+                                )
+                            )
+                    run = None if n is None else [value, n, n]
+            elif nodeRanges:
+                for (n, value) in items:
+                    sets.setdefault(value, []).append(n)
                 implicitNode = 1
                 for (value, nset) in sorted(
                     sets.items(), key=lambda x: (x[1][0], x[1][-1])
@@ -586,10 +879,9 @@ class Data(object):
                         )
             else:
                 implicitNode = 1
-                for n in sorted(data):
+                for (n, value) in items:
                     nodeSpec = "" if n == implicitNode else n
                     implicitNode = n + 1
-                    value = data[n]
                     tfValue = value if value is None else tfFromValue(value)
                     if tfValue is not None:
                         fh.write(
@@ -606,8 +898,14 @@ class Data(object):
         if not os.path.exists(self.binPath):
             error(f'TF reading: feature file "{self.binPath}" does not exist')
             return False
-        with gzip.open(self.binPath, "rb") as f:
-            self.data = pickle.load(f)
+        data = readBin(self.binPath)
+        if data is None:
+            error(
+                f'TF reading: feature file "{self.binPath}"'
+                " has been made on an other kind of machine"
+            )
+            return False
+        self.data = data
         self.dataLoaded = time.time()
         return True
 
@@ -629,8 +927,13 @@ class Data(object):
         if not good:
             return False
         try:
-            with gzip.open(self.binPath, "wb", compresslevel=GZIP_LEVEL) as f:
-                pickle.dump(self.data, f, protocol=PICKLE_PROTOCOL)
+            writeBin(
+                self.binPath,
+                mappedKind(self.fileName, self.method, self.isEdge, self.data),
+                self.data,
+                self.dataType,
+                self.edgeValues,
+            )
         except Exception as e:
             error(f'Cannot write to file "{self.binPath}" because: {str(e)}')
             self.cleanDataBin()
@@ -638,6 +941,46 @@ class Data(object):
         self.dataLoaded = time.time()
         return True
 
+    def _cacheDataBin(self):
+        # The binary of data that has just been written to the .tf file,
+        # so that loading it does not have to parse that file again.
+        # Data that cannot be cached this way is compiled when it is loaded.
+        # Any old binary goes: it no longer corresponds to the .tf file.
+
+        tmObj = self.tmObj
+        error = tmObj.error
+
+        self.cleanDataBin()
+        data = loadedData(
+            self.fileName, self.isEdge, self.edgeValues, self.dataType, self.data
+        )
+        if data is None:
+            return False
+        try:
+            os.makedirs(self.binDir, exist_ok=True)
+            writeBin(
+                self.binPath,
+                mappedKind(self.fileName, None, self.isEdge, data),
+                data,
+                self.dataType,
+                self.edgeValues,
+            )
+        except ValueError:
+            # nodes without slots, oslots is compiled from its .tf file
+            # when it is loaded
+            self.cleanDataBin()
+            return False
+        except Exception as e:
+            error(f'Cannot write to file "{self.binPath}" because: {str(e)}')
+            self.cleanDataBin()
+            return False
+        return True
+
+    def isStale(self):
+        origTime = self._getModified()
+        binTime = self._getModified(bin=True)
+        return bool(origTime) and (not binTime or origTime > binTime)
+
     def _getModified(self, bin=False):
         if bin:
             return (
@@ -2,6 +2,7 @@
 import collections
 
 from .helpers import makeInverse, makeInverseVal
+from .mapped import MappedEdgeData
 
 
 class EdgeFeatures(object):
@@ -18,6 +19,9 @@ class EdgeFeature(object):
         if type(data) is tuple:
             self.data = data[0]
             self.dataInv = data[1]
+        elif type(data) is MappedEdgeData:
+            self.data = data
+            self.dataInv = data.inverse
         else:
             self.data = data
             self.dataInv = (
@@ -30,13 +34,14 @@ class EdgeFeature(object):
 
     def f(self, n):
 
-        if n not in self.data:
+        ms = self.data.get(n, None)
+        if ms is None:
             return ()
         Crank = self.api.C.rank.data
         if self.doValues:
-            return tuple(sorted(self.data[n].items(), key=lambda mv: Crank[mv[0] - 1]))
+            return tuple(sorted(ms.items(), key=lambda mv: Crank[mv[0] - 1]))
         else:
-            return tuple(sorted(self.data[n], key=lambda m: Crank[m - 1]))
+            return tuple(sorted(ms, key=lambda m: Crank[m - 1]))
 
     def t(self, n):
 
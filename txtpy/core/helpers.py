@@ -1,6 +1,7 @@
 import os
 import sys
 import re
+import threading
 
 LETTER = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
 VALID = set("_0123456789") | LETTER
@@ -29,6 +30,12 @@ def dirEmpty(target):
     return not os.path.exists(target) or not os.listdir(target)
 
 
+def tempPath(path):
+    # a temporary file next to path, to be written completely before it replaces
+    # path; the name differs between processes and threads that write path
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
 def isInt(val):
     try:
         val = int(val)
@@ -227,6 +234,26 @@ def rangesFromList(nodeList):  # the list must be sorted
         yield (curstart, curend)
 
 
+def slotsKey(slots, end):  # the slots must be sorted, end must exceed all slots
+    # Comparing these keys is equivalent to comparing the slot sets
+    # in canonical order: the set that has the first slot that is not in the other
+    # set comes first, and if one set contains the other, the bigger set comes first.
+    # The key alternates the starts and the negated ends of the ranges of slots,
+    # terminated by end.
+    if not len(slots):
+        return (end,)
+    first = slots[0]
+    last = slots[-1]
+    if last - first + 1 == len(slots):
+        return (first, -last, end)
+    key = []
+    for (b, e) in rangesFromList(slots):
+        key.append(b)
+        key.append(-e)
+    key.append(end)
+    return tuple(key)
+
+
 def specFromRanges(ranges):  # ranges must be normalized
     return ",".join(
         "{}".format(r[0]) if r[0] == r[1] else "{}-{}".format(*r) for r in ranges
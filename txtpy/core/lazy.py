@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+from .nodefeature import NodeFeature
+from .edgefeature import EdgeFeature
+
+
+class LazyFeature(object):
+    # Stands in for a feature in F or E, and loads it on first use.
+    # All attributes are delegated to the loaded feature.
+
+    def __init__(self, residency, fName):
+        self._residency = residency
+        self._fName = fName
+
+    def _resolve(self):
+        return self._residency.get(self._fName)
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+class Residency(object):
+    # Keeps track of the lazily loaded features.
+    # If there is a limit, the least recently used features
+    # are unloaded when more than limit features are resident.
+    #
+    # Queries may run in several threads at the same time.
+    # A query can pin the features it gets: it collects them in a set,
+    # by getting them inside using(pinned). Pinned features are not unloaded
+    # until the query calls unpin(pinned).
+
+    def __init__(self, TF, limit=None):
+        self.TF = TF
+        self.limit = limit
+        self.resident = OrderedDict()
+        # the features that have been requested lazily
+        self.requested = set()
+        self.proxies = {}
+        self.lock = threading.RLock()
+        self.inUse = Counter()
+        self.local = threading.local()
+
+    def add(self, api, fName, isEdge):
+        with self.lock:
+            proxy = LazyFeature(self, fName)
+            self.proxies[fName] = proxy
+            setattr(api.E if isEdge else api.F, fName, proxy)
+
+    def release(self, fName):
+        # the feature has been loaded in the normal way,
+        # so it is no longer managed here
+        with self.lock:
+            self.requested.discard(fName)
+            self.proxies.pop(fName, None)
+            self.resident.pop(fName, None)
+
+    def get(self, fName):
+        # loading happens under the lock, so that a feature is loaded only once
+        with self.lock:
+            resident = self.resident
+            feature = resident.get(fName, None)
+            if feature is not None:
+                resident.move_to_end(fName)
+                self._pin(fName)
+                return feature
+
+            TF = self.TF
+            fObj = TF.features[fName]
+            if not fObj.load(silent="deep"):
+                TF.tmObj.error(f'Feature "{fName}" could not be loaded')
+                raise AttributeError(fName)
+            api = TF.api
+            feature = (
+                EdgeFeature(api, fObj.metaData, fObj.data, fObj.edgeValues)
+                if fObj.isEdge
+                else NodeFeature(api, fObj.metaData, fObj.data)
+            )
+            resident[fName] = feature
+            self._pin(fName)
+            self._evict()
+            return feature
+
+    @contextmanager
+    def using(self, pinned):
+
+        local = self.local
+        outer = getattr(local, "pinned", None)
+        local.pinned = pinned
+        try:
+            yield
+        finally:
+            local.pinned = outer
+
+    def unpin(self, pinned):
+
+        with self.lock:
+            inUse = self.inUse
+            for fName in pinned:
+                inUse[fName] -= 1
+                if inUse[fName] <= 0:
+                    del inUse[fName]
+            pinned.clear()
+            self._evict()
+
+    def _pin(self, fName):
+
+        pinned = getattr(self.local, "pinned", None)
+        if pinned is not None and fName not in pinned:
+            pinned.add(fName)
+            self.inUse[fName] += 1
+
+    def _evict(self):
+        # unload the least recently used features that are not in use
+
+        limit = self.limit
+        if limit is None:
+            return
+        resident = self.resident
+        excess = len(resident) - max((limit, 1))
+        if excess <= 0:
+            return
+        inUse = self.inUse
+        for oldName in [f for f in resident if not inUse[f]][0:excess]:
+            del resident[oldName]
+            self.TF.features[oldName].unload()
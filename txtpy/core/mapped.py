@@ -0,0 +1,513 @@
+import sys
+import mmap
+import pickle
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+
+from ..parameters import PICKLE_PROTOCOL
+from .helpers import makeInverse, makeInverseVal
+
+# MEMORY-MAPPED COLUMNAR FEATURE STORAGE ###
+
+# A mapped file consists of
+#   MAGIC (8 bytes)
+#   length of the header (8 bytes, little endian)
+#   the header: a pickled dict with the kind of data, scalar information
+#     and the location of every section
+#   the sections: typed arrays, each aligned on an 8 byte boundary
+#
+# Sections are never copied on loading: they are memoryviews into
+# a read-only memory map, so the pages are shared between processes
+# that load the same feature.
+
+MAGIC = b"TFMAPPED"
+ALIGN = 8
+HEAD = len(MAGIC) + 8
+
+INT_NONE = -(2 ** 63)
+INT_MAX = 2 ** 63 - 1
+NODE_MAX = 2 ** 32 - 1
+
+CAST_TYPES = set("bBhHiIlLqQ")
+
+MACHINE = (sys.byteorder, tuple(array(tc).itemsize for tc in "IQq"))
+
+
+def isMapped(path):
+    with open(path, "rb") as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def writeMapped(path, kind, data, dataType=None, edgeValues=False):
+    if kind == "otype":
+        packed = _packOtype(data)
+    elif kind == "oslots":
+        packed = _packOslots(data)
+    elif kind == "array":
+        packed = _packArray(data)
+    elif kind == "arrays":
+        packed = _packArrays(data)
+    elif kind == "node":
+        packed = _packNode(data, dataType)
+    elif kind == "edge":
+        packed = _packEdge(data, dataType, edgeValues)
+    else:
+        packed = None
+    if packed is None:
+        return False
+
+    (header, sections) = packed
+    header["kind"] = kind
+    header["machine"] = MACHINE
+
+    location = {}
+    pos = 0
+    for (name, arr) in sections.items():
+        pos += -pos % ALIGN
+        location[name] = (pos, arr.typecode, len(arr))
+        pos += len(arr) * arr.itemsize
+    header["sections"] = location
+    headerBytes = pickle.dumps(header, protocol=PICKLE_PROTOCOL)
+    start = HEAD + len(headerBytes)
+    start += -start % ALIGN
+
+    with open(path, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(len(headerBytes).to_bytes(8, "little"))
+        fh.write(headerBytes)
+        fh.write(bytes(start - HEAD - len(headerBytes)))
+        pos = 0
+        for (name, arr) in sections.items():
+            (offset, tc, n) = location[name]
+            fh.write(bytes(offset - pos))
+            arr.tofile(fh)
+            pos = offset + n * arr.itemsize
+    return True
+
+
+def readMapped(path):
+    with open(path, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    raw = memoryview(mm)
+    if bytes(raw[0 : len(MAGIC)]) != MAGIC:
+        return None
+    headerLen = int.from_bytes(raw[len(MAGIC) : HEAD], "little")
+    header = pickle.loads(raw[HEAD : HEAD + headerLen])
+    if header.get("machine", None) != MACHINE:
+        return None
+    start = HEAD + headerLen
+    start += -start % ALIGN
+
+    sections = {}
+    for (name, (offset, tc, n)) in header["sections"].items():
+        b = start + offset
+        e = b + n * array(tc).itemsize
+        sections[name] = raw[b:e].cast(tc)
+
+    kind = header["kind"]
+    if kind == "otype":
+        values = _unpackStrings(sections)
+        return (
+            MappedValues(sections["codes"], values),
+            header["maxSlot"],
+            header["maxNode"],
+            header["slotType"],
+        )
+    if kind == "oslots":
+        return (
+            MappedArrays(sections["offsets"], sections["slots"]),
+            header["maxSlot"],
+            header["maxNode"],
+        )
+    if kind == "array":
+        return sections["array"]
+    if kind == "arrays":
+        return MappedArrays(sections["offsets"], sections["slots"])
+    if kind == "node":
+        values = _unpackStrings(sections) if header["isStr"] else None
+        return MappedNodeData(
+            sections.get("nodes", None), sections["vals"], values, header["count"]
+        )
+    if kind == "edge":
+        values = _unpackStrings(sections) if header["isStr"] else None
+        edgeValues = header["edgeValues"]
+        inverse = MappedEdgeData(
+            *(sections.get(f"t{name}", None) for name in ("nodes", "offsets", "targets")),
+            sections.get("tvals", None),
+            values,
+            edgeValues,
+        )
+        return MappedEdgeData(
+            *(sections.get(f"f{name}", None) for name in ("nodes", "offsets", "targets")),
+            sections.get("fvals", None),
+            values,
+            edgeValues,
+            inverse=inverse,
+        )
+    return None
+
+
+# COMPACT STORAGE ###
+
+# String features are only stored compactly if they have few distinct values
+# compared to the number of nodes that carry them
+
+COMPACT_RATIO = 0.5
+
+
+def compactNodeData(data, dataType):
+    if not data:
+        return None
+    if dataType != "int" and len(set(data.values())) > COMPACT_RATIO * len(data):
+        return None
+    packed = _packNode(data, dataType)
+    if packed is None:
+        return None
+    (header, sections) = packed
+    values = _unpackStrings(sections) if header["isStr"] else None
+    return MappedNodeData(
+        sections.get("nodes", None), sections["vals"], values, header["count"]
+    )
+
+
+def nodeDataFromDense(codes, values):
+    # codes is indexed by node: the values themselves if values is None,
+    # otherwise indexes into values, where 0 means: no value
+    missing = INT_NONE if values is None else 0
+    count = len(codes) - codes.count(missing)
+    if values is not None and len(values) - 1 > COMPACT_RATIO * count:
+        return {n: values[c] for (n, c) in enumerate(codes) if c}
+    if 2 * count >= len(codes) - 1:
+        return MappedNodeData(None, codes, values, count)
+    nodes = array("I", (n for (n, c) in enumerate(codes) if c != missing))
+    vals = array(codes.typecode, (c for c in codes if c != missing))
+    return MappedNodeData(nodes, vals, values, count)
+
+
+# PACKING ###
+
+
+def _isNode(n):
+    return type(n) is int and 0 <= n <= NODE_MAX
+
+
+def _packStrings(strings, sections):
+    encoded = [s.encode("utf8") for s in strings]
+    offsets = array("Q", [0])
+    pos = 0
+    for e in encoded:
+        pos += len(e)
+        offsets.append(pos)
+    sections["strings"] = array("B", b"".join(encoded))
+    sections["stringOffsets"] = offsets
+
+
+def _unpackStrings(sections):
+    strings = sections["strings"]
+    offsets = sections["stringOffsets"]
+    return (None,) + tuple(
+        str(strings[offsets[i] : offsets[i + 1]], "utf8")
+        for i in range(len(offsets) - 1)
+    )
+
+
+def _valueIndex(values, allowNone=False):
+    # index 0 is reserved for "no value"
+    index = {}
+    strings = []
+    for v in values:
+        if v in index or v is None and allowNone:
+            continue
+        if type(v) is not str:
+            return None
+        strings.append(v)
+        index[v] = len(strings)
+    return (index, strings)
+
+
+def _packOtype(data):
+    (otype, maxSlot, maxNode, slotType) = data
+    types = sorted(set(otype))
+    index = {tp: i + 1 for (i, tp) in enumerate(types)}
+    sections = {}
+    sections["codes"] = array("I", (index[tp] for tp in otype))
+    _packStrings(types, sections)
+    return (dict(maxSlot=maxSlot, maxNode=maxNode, slotType=slotType), sections)
+
+
+def _packOslots(data):
+    (oslots, maxSlot, maxNode) = data
+    offsets = array("Q", [0])
+    slots = array("I")
+    for mList in oslots:
+        slots.extend(mList if type(mList) is array else array("I", mList))
+        offsets.append(len(slots))
+    return (dict(maxSlot=maxSlot, maxNode=maxNode), dict(offsets=offsets, slots=slots))
+
+
+def _packArray(data):
+    if data.typecode not in CAST_TYPES:
+        return None
+    return ({}, dict(array=data))
+
+
+def _packArrays(data):
+    sections = {}
+    for (name, arr) in (("offsets", data.offsets), ("slots", data.slots)):
+        sections[name] = arr if type(arr) is array else array(arr.format, arr)
+    return ({}, sections)
+
+
+def _packNode(data, dataType):
+    if type(data) is MappedNodeData:
+        return data.packed()
+    isStr = dataType != "int"
+    if not all(_isNode(n) for n in data):
+        return None
+    sections = {}
+    if isStr:
+        valueIndex = _valueIndex(data.values())
+        if valueIndex is None:
+            return None
+        (index, strings) = valueIndex
+        _packStrings(strings, sections)
+        tc = "I"
+        missing = 0
+    else:
+        if not all(type(v) is int and INT_NONE < v <= INT_MAX for v in data.values()):
+            return None
+        index = None
+        tc = "q"
+        missing = INT_NONE
+
+    maxKey = max(data) if data else 0
+    if 2 * len(data) >= maxKey:
+        vals = array(tc, [missing]) * (maxKey + 1)
+        for (n, v) in data.items():
+            vals[n] = v if index is None else index[v]
+    else:
+        nodes = array("I", sorted(data))
+        vals = array(
+            tc, (data[n] for n in nodes) if index is None else (index[data[n]] for n in nodes)
+        )
+        sections["nodes"] = nodes
+    sections["vals"] = vals
+    return (dict(isStr=isStr, count=len(data)), sections)
+
+
+def _packEdge(data, dataType, edgeValues):
+    isStr = dataType != "int"
+    if not all(_isNode(n) and all(_isNode(m) for m in ms) for (n, ms) in data.items()):
+        return None
+    sections = {}
+    index = None
+    if edgeValues:
+        allValues = [v for ms in data.values() for v in ms.values()]
+        if isStr:
+            valueIndex = _valueIndex(allValues, allowNone=True)
+            if valueIndex is None:
+                return None
+            (index, strings) = valueIndex
+            _packStrings(strings, sections)
+        elif not all(
+            v is None or type(v) is int and INT_NONE < v <= INT_MAX for v in allValues
+        ):
+            return None
+    inverse = makeInverseVal(data) if edgeValues else makeInverse(data)
+    for (prefix, direction) in (("f", data), ("t", inverse)):
+        nodes = array("I", sorted(direction))
+        offsets = array("Q", [0])
+        targets = array("I")
+        vals = array("I" if isStr else "q")
+        for n in nodes:
+            ms = direction[n]
+            theseTargets = sorted(ms)
+            targets.extend(theseTargets)
+            offsets.append(len(targets))
+            if edgeValues:
+                if isStr:
+                    vals.extend(0 if ms[m] is None else index[ms[m]] for m in theseTargets)
+                else:
+                    vals.extend(INT_NONE if ms[m] is None else ms[m] for m in theseTargets)
+        sections[f"{prefix}nodes"] = nodes
+        sections[f"{prefix}offsets"] = offsets
+        sections[f"{prefix}targets"] = targets
+        if edgeValues:
+            sections[f"{prefix}vals"] = vals
+    return (dict(isStr=isStr and edgeValues, edgeValues=edgeValues), sections)
+
+
+# MAPPED DATA ###
+
+
+class MappedValues(Sequence):
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, k):
+        if type(k) is slice:
+            values = self.values
+            return tuple(values[c] for c in self.codes[k])
+        return self.values[self.codes[k]]
+
+
+class MappedArrays(Sequence):
+    def __init__(self, offsets, slots):
+        self.offsets = offsets
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        if type(k) is slice:
+            return tuple(self[i] for i in range(*k.indices(len(self))))
+        offsets = self.offsets
+        if k < 0:
+            k += len(offsets) - 1
+        if not 0 <= k < len(offsets) - 1:
+            raise IndexError(k)
+        slots = self.slots
+        if type(slots) is array:
+            return slots[offsets[k] : offsets[k + 1]]
+        result = array("I")
+        result.frombytes(slots[offsets[k] : offsets[k + 1]].cast("B"))
+        return result
+
+
+class MappedNodeData(Mapping):
+    def __init__(self, nodes, vals, values, count):
+        self.nodes = nodes
+        self.vals = vals
+        self.values = values
+        self.count = count
+        self.missing = INT_NONE if values is None else 0
+        self.index = None
+
+    def _pos(self, n):
+        nodes = self.nodes
+        if nodes is None:
+            vals = self.vals
+            return n if 0 <= n < len(vals) and vals[n] != self.missing else -1
+        i = bisect_left(nodes, n)
+        return i if i < len(nodes) and nodes[i] == n else -1
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, n):
+        return self._pos(n) >= 0
+
+    def __getitem__(self, n):
+        i = self._pos(n)
+        if i < 0:
+            raise KeyError(n)
+        x = self.vals[i]
+        return x if self.values is None else self.values[x]
+
+    def get(self, n, default=None):
+        i = self._pos(n)
+        if i < 0:
+            return default
+        x = self.vals[i]
+        return x if self.values is None else self.values[x]
+
+    def __iter__(self):
+        if self.nodes is not None:
+            return iter(self.nodes)
+        missing = self.missing
+        return (n for (n, x) in enumerate(self.vals) if x != missing)
+
+    def nodesByValue(self):
+        # inverted index: value => array of the nodes with that value, sorted
+        if self.index is None:
+            missing = self.missing
+            nodes = self.nodes
+            index = {}
+            for (i, x) in enumerate(self.vals):
+                if x != missing:
+                    ns = index.get(x, None)
+                    if ns is None:
+                        ns = array("I")
+                        index[x] = ns
+                    ns.append(i if nodes is None else nodes[i])
+            values = self.values
+            self.index = (
+                index
+                if values is None
+                else {values[x]: ns for (x, ns) in index.items()}
+            )
+        return self.index
+
+    def nodesIn(self, val, b, e):
+        # the nodes with value val between b and e inclusive, sorted
+        ns = self.nodesByValue().get(val, None)
+        if ns is None:
+            return ()
+        return ns[bisect_left(ns, b) : bisect_right(ns, e)]
+
+    def packed(self):
+        sections = {}
+        isStr = self.values is not None
+        if isStr:
+            _packStrings(self.values[1:], sections)
+        for (name, arr) in (("nodes", self.nodes), ("vals", self.vals)):
+            if arr is not None:
+                sections[name] = arr if type(arr) is array else array(arr.format, arr)
+        return (dict(isStr=isStr, count=self.count), sections)
+
+
+class MappedEdgeData(Mapping):
+    def __init__(
+        self, nodes, offsets, targets, vals, values, edgeValues, inverse=None
+    ):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+        self.vals = vals
+        self.values = values
+        self.edgeValues = edgeValues
+        self.inverse = inverse
+
+    def _pos(self, n):
+        nodes = self.nodes
+        i = bisect_left(nodes, n)
+        return i if i < len(nodes) and nodes[i] == n else -1
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, n):
+        return self._pos(n) >= 0
+
+    def _row(self, i):
+        b = self.offsets[i]
+        e = self.offsets[i + 1]
+        targets = self.targets[b:e]
+        if not self.edgeValues:
+            return frozenset(targets)
+        values = self.values
+        if values is None:
+            return {
+                m: None if v == INT_NONE else v
+                for (m, v) in zip(targets, self.vals[b:e])
+            }
+        return {m: values[v] for (m, v) in zip(targets, self.vals[b:e])}
+
+    def __getitem__(self, n):
+        i = self._pos(n)
+        if i < 0:
+            raise KeyError(n)
+        return self._row(i)
+
+    def get(self, n, default=None):
+        i = self._pos(n)
+        return default if i < 0 else self._row(i)
+
+    def __iter__(self):
+        return iter(self.nodes)
@@ -2,6 +2,8 @@
 
 import collections
 
+from .mapped import MappedNodeData
+
 
 class NodeFeatures(object):
     pass
@@ -21,22 +23,45 @@ class NodeFeature(object):
 
     def v(self, n):
 
-        if n in self.data:
-            return self.data[n]
-        return None
+        return self.data.get(n, None)
 
     def s(self, val):
 
         Crank = self.api.C.rank.data
-        return tuple(
-            sorted(
-                [n for n in self.data if self.data[n] == val],
-                key=lambda n: Crank[n - 1],
-            )
-        )
+        data = self.data
+        if type(data) is MappedNodeData:
+            nodes = data.nodesByValue().get(val, ())
+        else:
+            nodes = [n for n in data if data[n] == val]
+        return tuple(sorted(nodes, key=lambda n: Crank[n - 1]))
 
     def freqList(self, nodeTypes=None):
 
+        data = self.data
+        if type(data) is MappedNodeData:
+            index = data.nodesByValue()
+            if nodeTypes is None:
+                fql = {val: len(nodes) for (val, nodes) in index.items()}
+            else:
+                # node types may interleave, so we only use their intervals
+                # to narrow down the nodes, and then check their types
+                fOtype = self.api.F.otype.v
+                otypeInterval = self.api.F.otype.sInterval
+                intervals = []
+                nodeIntervals = (otypeInterval(nType) for nType in nodeTypes)
+                for (b, e) in sorted(x for x in nodeIntervals if x):
+                    if intervals and b <= intervals[-1][1] + 1:
+                        intervals[-1][1] = max((e, intervals[-1][1]))
+                    else:
+                        intervals.append([b, e])
+                fql = collections.Counter()
+                for val in index:
+                    for (b, e) in intervals:
+                        for n in data.nodesIn(val, b, e):
+                            if fOtype(n) in nodeTypes:
+                                fql[val] += 1
+            return tuple(sorted(fql.items(), key=lambda x: (-x[1], x[0])))
+
         fql = collections.Counter()
         if nodeTypes is None:
             for n in self.data:
@@ -1,8 +1,10 @@
 
 from array import array
+from bisect import bisect_right
+from heapq import heappush, heappop
 import collections
-import functools
-from .helpers import itemize
+from .helpers import itemize, slotsKey, rangesFromList
+from .mapped import MappedArrays
 
 
 def levels(info, error, otype, oslots, otext):
@@ -55,43 +57,17 @@ def order(info, error, otype, oslots, levels):
     info("assigning otype levels to nodes")
     otypeLevels = dict(((x[0], i) for (i, x) in enumerate(reversed(levels))))
 
-    def otypeRank(n):
-        return otypeLevels[slotType if n < maxSlot + 1 else otype[n - maxSlot - 1]]
-
-    def before(na, nb):
-        if na < maxSlot + 1:
-            a = na
-            sa = {a}
-        else:
-            a = na - maxSlot
-            sa = set(oslots[a - 1])
-        if nb < maxSlot + 1:
-            b = nb
-            sb = {b}
-        else:
-            b = nb - maxSlot
-            sb = set(oslots[b - 1])
-        oa = otypeRank(na)
-        ob = otypeRank(nb)
-        if sa == sb:
-            return (
-                (-1 if na < nb else 1 if na > nb else 0)
-                if oa == ob
-                else -1
-                if oa > ob
-                else 1
-            )
-        if sa > sb:
-            return -1
-        if sa < sb:
-            return 1
-        am = min(sa - sb)
-        bm = min(sb - sa)
-        return -1 if am < bm else 1 if bm < am else None
-
-    canonKey = functools.cmp_to_key(before)
+    info("computing sort keys")
+    end = maxSlot + 1
+    slotRank = otypeLevels[slotType]
+    keys = [None] * (maxNode + 1)
+    for n in range(1, maxSlot + 1):
+        keys[n] = (n, -n, end, -slotRank, n)
+    for (i, slots) in enumerate(oslots):
+        n = i + end
+        keys[n] = slotsKey(slots, end) + (-otypeLevels[otype[i]], n)
     info("sorting nodes")
-    nodes = sorted(range(1, maxNode + 1), key=canonKey)
+    nodes = sorted(range(1, maxNode + 1), key=keys.__getitem__)
     return array("I", nodes)
 
 
@@ -107,63 +83,106 @@ def levUp(info, error, otype, oslots, rank):
 
     (otype, maxSlot, maxNode, slotType) = otype
     oslots = oslots[0]
-    info("making inverse of edge feature oslots")
-    oslotsInv = {}
+    info("collecting runs of slots")
+    runs = []
+    gapped = {}
     for (k, mList) in enumerate(oslots):
-        for m in mList:
-            oslotsInv.setdefault(m, set()).add(k + 1 + maxSlot)
+        if not len(mList):
+            continue
+        n = k + 1 + maxSlot
+        first = mList[0]
+        last = mList[-1]
+        if last - first + 1 == len(mList):
+            runs.append((first, last, n))
+        else:
+            nRuns = tuple(rangesFromList(mList))
+            gapped[n] = (nRuns, [b for (b, e) in nRuns])
+            for (b, e) in nRuns:
+                runs.append((b, e, n))
+    runs.sort()
+
+    def contains(m, mEnd, n):
+        # m has a run from before the first slot of n till mEnd
+        if n not in gapped:
+            return mEnd >= oslots[n - maxSlot - 1][-1]
+        (nRuns, nStarts) = gapped[n]
+        if m not in gapped:
+            return mEnd >= nRuns[-1][1]
+        (mRuns, mStarts) = gapped[m]
+        for (b, e) in nRuns:
+            i = bisect_right(mStarts, b) - 1
+            if i < 0 or mRuns[i][1] < e:
+                return False
+        return True
+
+    def rankKey(m):
+        return rank[m - 1]
+
     info("listing embedders of all nodes")
-    embedders = []
-    for n in range(1, maxSlot + 1):
-        contentEmbedders = oslotsInv[n]
-        embedders.append(
-            tuple(
+    # sweep over the slots, keeping track of the runs that contain the current slot
+    embedders = [()] * maxNode
+    active = {}
+    ending = []
+    seen = {}
+    r = 0
+    nRuns = len(runs)
+    for s in range(1, maxSlot + 1):
+        while ending and ending[0][0] < s:
+            del active[heappop(ending)[1]]
+        starting = []
+        while r < nRuns and runs[r][0] == s:
+            (b, e, m) = runs[r]
+            active[m] = e
+            heappush(ending, (e, m))
+            if b == oslots[m - maxSlot - 1][0]:
+                starting.append(m)
+            r += 1
+        # reuse embedder tuples, because lots of nodes share embedders
+        t = tuple(sorted(active, key=rankKey, reverse=True))
+        embedders[s - 1] = seen.setdefault(t, t)
+        for n in starting:
+            embedders[n - 1] = tuple(
                 sorted(
-                    [m for m in contentEmbedders if m != n], key=lambda k: -rank[k - 1],
-                )
-            )
-        )
-    for n in range(maxSlot + 1, maxNode + 1):
-        mList = oslots[n - maxSlot - 1]
-        if len(mList) == 0:
-            embedders.append(tuple())
-        else:
-            contentEmbedders = functools.reduce(
-                lambda x, y: x & oslotsInv[y], mList[1:], oslotsInv[mList[0]],
-            )
-            embedders.append(
-                tuple(
-                    sorted(
-                        [m for m in contentEmbedders if m != n],
-                        key=lambda k: -rank[k - 1],
-                    )
+                    (
+                        m
+                        for (m, mEnd) in active.items()
+                        if m != n and contains(m, mEnd, n)
+                    ),
+                    key=rankKey,
+                    reverse=True,
                 )
             )
-    # reuse embedder tuples, because lots of nodes share embedders
-    seen = {}
-    embeddersx = []
+    info("turning embedders into arrays")
+    offsets = array("Q", [0])
+    flat = array("I")
     for t in embedders:
-        if t not in seen:
-            seen[t] = array("I", t)
-        embeddersx.append(seen[t])
-    return tuple(embeddersx)
+        flat.extend(t)
+        offsets.append(len(flat))
+    return MappedArrays(offsets, flat)
 
 
 def levDown(info, error, otype, levUp, rank):
 
     (otype, maxSlot, maxNode, slotType) = otype
-    info("inverting embedders")
-    inverse = {}
+    info("counting embeddees")
+    nNodes = maxNode - maxSlot
+    counts = array("Q", [0]) * (nNodes + 1)
     for n in range(maxSlot + 1, maxNode + 1):
         for m in levUp[n - 1]:
-            inverse.setdefault(m, set()).add(n)
-    info("turning embeddees into list")
-    embeddees = []
-    for n in range(maxSlot + 1, maxNode + 1):
-        embeddees.append(
-            array("I", sorted(inverse.get(n, []), key=lambda m: rank[m - 1]))
-        )
-    return tuple(embeddees)
+            counts[m - maxSlot] += 1
+    offsets = array("Q", [0]) * (nNodes + 1)
+    for i in range(nNodes):
+        offsets[i + 1] = offsets[i] + counts[i + 1]
+    info("inverting embedders")
+    # by visiting the nodes in canonical order, the embeddees end up sorted by rank
+    flat = array("I", [0]) * offsets[nNodes]
+    fill = array("Q", offsets)
+    for n in sorted(range(maxSlot + 1, maxNode + 1), key=lambda k: rank[k - 1]):
+        for m in levUp[n - 1]:
+            i = m - maxSlot - 1
+            flat[fill[i]] = n
+            fill[i] += 1
+    return MappedArrays(offsets, flat)
 
 
 def boundary(info, error, otype, oslots, rank):
@@ -187,6 +206,64 @@ def boundary(info, error, otype, oslots, rank):
     return (tuple(firstSlots), tuple(lastSlots))
 
 
+def intervals(info, error, otype, oslots):
+
+    (otype, maxSlot, maxNode, slotType) = otype
+    oslots = oslots[0]
+    info("computing slot intervals of nodes")
+    firsts = array("I", range(1, maxSlot + 1))
+    lasts = array("I", range(1, maxSlot + 1))
+    gapped = array("B", [0]) * maxNode
+    nodesByType = {}
+    for (k, mList) in enumerate(oslots):
+        n = k + 1 + maxSlot
+        if len(mList):
+            first = mList[0]
+            last = mList[-1]
+            if last - first + 1 != len(mList):
+                gapped[n - 1] = 1
+        else:
+            first = 0
+            last = 0
+        firsts.append(first)
+        lasts.append(last)
+        nodesByType.setdefault(otype[k], []).append(n)
+    info("sorting nodes by first slot per type")
+    byType = {}
+    for (nType, nodes) in nodesByType.items():
+        nodes.sort(key=lambda n: firsts[n - 1])
+        maxLen = max(lasts[n - 1] - firsts[n - 1] for n in nodes)
+        byType[nType] = (
+            array("I", nodes),
+            array("I", (firsts[n - 1] for n in nodes)),
+            maxLen,
+        )
+    return (firsts, lasts, gapped, byType)
+
+
+def stats(info, error, otype, levUp):
+
+    (otype, maxSlot, maxNode, slotType) = otype
+    info("computing statistics of types and embedding")
+    typeCounts = collections.Counter(otype)
+    typeCounts[slotType] = maxSlot
+    nTypes = (slotType,) + tuple(sorted(set(otype)))
+    typeCode = {nType: i for (i, nType) in enumerate(nTypes)}
+    codes = array("B" if len(nTypes) < 256 else "I", [0]) * (maxSlot + 1)
+    codes.extend(typeCode[nType] for nType in otype)
+
+    # pairs (inner type, outer type) counted by code, for speed
+    pairCounts = collections.Counter()
+    for n in range(1, maxNode + 1):
+        code = codes[n] * len(nTypes)
+        pairCounts.update(code + codes[m] for m in levUp[n - 1])
+    embedCounts = {
+        (nTypes[c // len(nTypes)], nTypes[c % len(nTypes)]): amount
+        for (c, amount) in pairCounts.items()
+    }
+    return (dict(typeCounts), embedCounts)
+
+
 def sections(info, error, otype, oslots, otext, levUp, levels, *sFeats):
 
     (otype, maxSlot, maxNode, slotType) = otype
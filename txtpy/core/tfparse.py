@@ -0,0 +1,301 @@
+import os
+from array import array
+from itertools import chain
+
+from .helpers import valueFromTf
+from .mapped import INT_NONE, INT_MAX, NODE_MAX, nodeDataFromDense
+
+# FAST PARSING OF TF DATA ###
+
+# Node specifications are parsed into ranges (b, e), which are never expanded
+# into sets. Lines are turned into blocks:
+#
+#   ("s", start, relative, values)
+#       consecutive lines of a node feature without node specification:
+#       the nodes start, start + 1, ... get the values
+#   ("r", ranges, value)
+#       a line of a node feature with a node specification
+#   ("e", ranges, start, relative, ranges2, value)
+#       a line of an edge feature; ranges is None if there is no node
+#       specification, in which case start is the implicit node
+#
+# A chunk of lines does not know the implicit node number at its start,
+# so until the first node specification, start is relative to that number.
+# When the chunks are put together, the relative starts are resolved.
+
+CHUNK_SIZE = 32 * 1024 * 1024
+
+COMPACT_SPARSE = 2
+
+
+def rangesFromSpec(spec):
+    ranges = []
+    for r_str in spec.split(","):
+        bounds = r_str.split("-")
+        if len(bounds) == 1:
+            n = int(r_str)
+            ranges.append((n, n))
+        else:
+            b = int(bounds[0])
+            e = int(bounds[1])
+            ranges.append((b, e) if b <= e else (e, b))
+    return ranges
+
+
+def parseLines(lines, isEdge, edgeValues, isNum):
+    blocks = []
+    errors = []
+    implicit = 0
+    relative = True
+    seq = None
+    normFields = 3 if isEdge and edgeValues else 2
+    i = 0
+
+    for line in lines:
+        i += 1
+        fields = line.rstrip("\n").split("\t")
+        lfields = len(fields)
+        if lfields > normFields:
+            errors.append(("wrongFields", i))
+            continue
+        ranges = None
+        if lfields == normFields:
+            ranges = rangesFromSpec(fields[0])
+            if isEdge:
+                if fields[1] == "":
+                    errors.append(("emptyNode2Spec", i))
+                    continue
+                ranges2 = rangesFromSpec(fields[1])
+            if not isEdge or edgeValues:
+                valTf = fields[-1]
+        elif isEdge:
+            if edgeValues and lfields == normFields - 1:
+                ranges2 = rangesFromSpec(fields[0])
+                valTf = fields[-1]
+            else:
+                if fields[0] == "":
+                    errors.append(("emptyNode2Spec", i))
+                    continue
+                ranges2 = rangesFromSpec(fields[0])
+                valTf = ""
+        else:
+            valTf = fields[0]
+
+        value = None
+        if not isEdge or edgeValues:
+            if isNum:
+                value = None if valTf == "" else int(valTf)
+            else:
+                value = valTf if "\\" not in valTf else valueFromTf(valTf)
+
+        if isEdge:
+            blocks.append(("e", ranges, implicit, relative, ranges2, value))
+        elif ranges is None:
+            if seq is None:
+                seq = []
+                blocks.append(("s", implicit, relative, seq))
+            seq.append(value)
+        else:
+            blocks.append(("r", ranges, value))
+            seq = None
+
+        if ranges is None:
+            implicit += 1
+        else:
+            implicit = max(e for (b, e) in ranges) + 1
+            relative = False
+    return (blocks, errors, i, (implicit, relative))
+
+
+def parseChunk(path, start, end, isEdge, edgeValues, isNum):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        text = fh.read(end - start).decode("utf8")
+    # same line endings as reading the file in text mode
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return parseLines(lines, isEdge, edgeValues, isNum)
+
+
+def chunkBounds(path, offset, chunkSize=None):
+    if chunkSize is None:
+        chunkSize = CHUNK_SIZE
+    size = os.path.getsize(path)
+    bounds = []
+    with open(path, "rb") as fh:
+        start = offset
+        while start < size:
+            fh.seek(min((start + chunkSize, size)))
+            fh.readline()
+            end = min((fh.tell(), size))
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def resolveBlocks(chunks):
+    # chunks: a list of (blocks, endState) in file order
+    base = 1
+    for (blocks, (implicit, relative)) in chunks:
+        for block in blocks:
+            kind = block[0]
+            if kind == "s":
+                (kind, start, rel, values) = block
+                yield (kind, start + base if rel else start, values)
+            elif kind == "e":
+                (kind, ranges, start, rel, ranges2, value) = block
+                if ranges is None:
+                    n = start + base if rel else start
+                    ranges = ((n, n),)
+                yield (kind, ranges, ranges2, value)
+            else:
+                yield block
+        base = implicit + base if relative else implicit
+
+
+# TURNING BLOCKS INTO DATA ###
+
+
+def _blockNodes(blocks):
+    total = 0
+    maxKey = 0
+    for block in blocks:
+        if block[0] == "s":
+            k = len(block[2])
+            total += k
+            maxKey = max((maxKey, block[1] + k - 1))
+        else:
+            for (b, e) in block[1]:
+                total += e - b + 1
+                maxKey = max((maxKey, e))
+    return (total, maxKey)
+
+
+def _denseCodes(blocks, isNum):
+    # fill a node-indexed array with the values (int features)
+    # or with indexes in a table of values (str features)
+    # Returns None if that is not possible
+    (total, maxKey) = _blockNodes(blocks)
+    if maxKey > NODE_MAX or COMPACT_SPARSE * total < maxKey:
+        return None
+    if isNum:
+        for block in blocks:
+            vals = block[2] if block[0] == "s" else (block[2],)
+            for v in vals:
+                if v is not None and not INT_NONE < v <= INT_MAX:
+                    return None
+        tc = "q"
+        missing = INT_NONE
+        index = None
+        values = None
+    else:
+        distinct = set()
+        for block in blocks:
+            if block[0] == "s":
+                distinct.update(block[2])
+            else:
+                distinct.add(block[2])
+        values = (None,) + tuple(sorted(distinct))
+        index = {v: i for (i, v) in enumerate(values) if i}
+        tc = "I"
+        missing = 0
+
+    codes = array(tc, [missing]) * (maxKey + 1)
+    for block in blocks:
+        if block[0] == "s":
+            (kind, start, vals) = block
+            if None in vals:
+                for (n, v) in enumerate(vals, start=start):
+                    if v is not None:
+                        codes[n] = v if index is None else index[v]
+            else:
+                codes[start : start + len(vals)] = (
+                    array(tc, vals)
+                    if index is None
+                    else array(tc, map(index.__getitem__, vals))
+                )
+        else:
+            (kind, ranges, v) = block
+            if v is None:
+                continue
+            code = v if index is None else index[v]
+            for (b, e) in ranges:
+                codes[b : e + 1] = array(tc, [code]) * (e - b + 1)
+    return (codes, values)
+
+
+def nodeDataFromBlocks(blocks, isNum):
+    dense = _denseCodes(blocks, isNum)
+    if dense is not None:
+        return nodeDataFromDense(*dense)
+
+    data = {}
+    for block in blocks:
+        if block[0] == "s":
+            (kind, start, vals) = block
+            data.update(
+                (n, v) for (n, v) in enumerate(vals, start=start) if v is not None
+            )
+        else:
+            (kind, ranges, v) = block
+            if v is None:
+                continue
+            for (b, e) in ranges:
+                data.update(dict.fromkeys(range(b, e + 1), v))
+    return data
+
+
+def otypeFromBlocks(blocks):
+    dense = _denseCodes(blocks, False)
+    if dense is None:
+        return None
+    (codes, values) = dense
+    slotCode = codes[1] if len(codes) > 1 else 0
+    if not slotCode:
+        return None
+    maxSlot = len(codes) - 1 - codes[::-1].index(slotCode)
+    otype = tuple(values[c] for c in codes if c and c != slotCode)
+    maxNode = len(codes) - codes.count(0)
+    return (otype, maxSlot, maxNode, values[slotCode])
+
+
+def edgeDataFromBlocks(blocks, edgeValues):
+    data = {}
+    for (kind, ranges, ranges2, value) in blocks:
+        for (b, e) in ranges:
+            for n in range(b, e + 1):
+                if edgeValues:
+                    ms = data.setdefault(n, {})
+                    for (b2, e2) in ranges2:
+                        ms.update(dict.fromkeys(range(b2, e2 + 1), value))
+                else:
+                    ms = data.setdefault(n, set())
+                    for (b2, e2) in ranges2:
+                        ms.update(range(b2, e2 + 1))
+    return data
+
+
+def oslotsFromBlocks(blocks):
+    nodeRanges = {}
+    for (kind, ranges, ranges2, value) in blocks:
+        for (b, e) in ranges:
+            for n in range(b, e + 1):
+                nodeRanges.setdefault(n, []).extend(ranges2)
+    data = {}
+    for (n, ranges) in nodeRanges.items():
+        # the usual case: ranges in increasing order that do not overlap
+        slots = array("I")
+        prev = 0
+        for (b, e) in ranges:
+            if b <= prev:
+                slots = None
+                break
+            slots.extend(range(b, e + 1))
+            prev = e
+        if slots is None:
+            slots = array(
+                "I", sorted(set(chain.from_iterable(range(b, e + 1) for (b, e) in ranges)))
+            )
+        data[n] = slots
+    return data
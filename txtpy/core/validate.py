@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from itertools import compress, repeat
+from operator import eq
+
+from .data import StreamedData, WARP
+from .helpers import console, makeExamples
+from .tfparse import (
+    parseLines,
+    resolveBlocks,
+    nodeDataFromBlocks,
+    oslotsFromBlocks,
+)
+
+HELP = """
+USAGE
+
+python -m txtpy.core.validate --help
+
+python -m txtpy.core.validate {tfDir}
+
+python -m txtpy.core.validate --bench [{maxNode}]
+
+EFFECT
+
+Checks the integrity of the otype and oslots features of the dataset in tfDir:
+oslots must map every non-slot node, and no other nodes.
+This is the check that TF performs before it saves a dataset.
+
+With --bench the check is run on synthetic datasets of up to maxNode nodes
+(default 10000000), a valid one and a broken one, and the throughput is reported.
+"""
+
+UNKNOWN = "_UNKNOWN_"
+
+# VALIDATING THE WARP FEATURES ###
+
+# The nodes that oslots maps are put in a sorted array.
+# The slot nodes and the nodes beyond maxNode that it maps are found
+# by bisection.
+# In between, the array should be exactly maxSlot + 1 ... maxNode.
+# Node nodes[i] is preceded by nodes[i] - (maxSlot + 1) - (i - lo) unmapped nodes,
+# a number that never decreases. Where it stays the same, there are no gaps,
+# so we only have to bisect the stretches where it increases.
+# A valid oslots feature is checked in constant time, once its nodes are sorted.
+
+
+def otypeBounds(otypeData):
+    # slotType, maxSlot, maxNode and a function that gives the type of nodes,
+    # for the forms in which otype can be passed to Fabric.save
+
+    if type(otypeData) is tuple:
+        (data, slotType, maxSlot, maxNode) = otypeData
+        if type(data) is StreamedData:
+
+            def typeOf(n):
+                return UNKNOWN
+
+        else:
+
+            def typeOf(n):
+                return data[n - maxSlot - 1] if maxSlot < n <= maxNode else UNKNOWN
+
+        return (slotType, maxSlot, maxNode, typeOf)
+
+    if 1 not in otypeData:
+        return None
+    slotType = otypeData[1]
+    # a dict has to be scanned, but that is done in C, not node by node in Python
+    maxSlot = max(compress(otypeData, map(eq, otypeData.values(), repeat(slotType))))
+    maxNode = max(otypeData)
+
+    def typeOf(n):
+        return otypeData.get(n, UNKNOWN)
+
+    return (slotType, maxSlot, maxNode, typeOf)
+
+
+def untypedNodes(otypeData, maxNode):
+    # the nodes up to maxNode that have no type, if otype is a dict;
+    # there are none if the dict has a key for every node
+
+    if type(otypeData) is not dict or len(otypeData) >= maxNode:
+        return []
+    return sorted(set(range(1, maxNode + 1)) - otypeData.keys())
+
+
+def oslotsNodes(oslotsData):
+    # the nodes mapped by oslots, sorted
+    # streamed data delivers its nodes in order already
+
+    if type(oslotsData) is StreamedData:
+        return array("q", oslotsData.nodes())
+    return sorted(oslotsData)
+
+
+def checkOslots(nodes, maxSlot, maxNode):
+    # nodes: the nodes mapped by oslots, sorted and distinct
+    # returns the mapped slot nodes, the mapped nodes beyond maxNode
+    # and the unmapped non-slot nodes
+
+    lo = bisect_right(nodes, maxSlot)
+    hi = bisect_right(nodes, maxNode, lo)
+    mappedSlotNodes = list(nodes[0:lo])
+    fakeNodes = list(nodes[hi:])
+    if lo == hi:
+        return (mappedSlotNodes, fakeNodes, list(range(maxSlot + 1, maxNode + 1)))
+
+    first = maxSlot + 1 - lo
+
+    def missing(i):
+        return nodes[i] - first - i
+
+    unmappedNodes = list(range(maxSlot + 1, nodes[lo]))
+    stack = [(lo, hi - 1)]
+    while stack:
+        (i, j) = stack.pop()
+        if missing(i) == missing(j):
+            continue
+        if j == i + 1:
+            unmappedNodes.extend(range(nodes[i] + 1, nodes[j]))
+            continue
+        k = (i + j) // 2
+        # the left half goes last on the stack, so that it is done first
+        stack.append((k, j))
+        stack.append((i, k))
+    unmappedNodes.extend(range(nodes[hi - 1] + 1, maxNode + 1))
+    return (mappedSlotNodes, fakeNodes, unmappedNodes)
+
+
+def validateWarp(otypeData, oslotsData, info, error):
+    # otypeData may be None, then there is nothing to check against
+
+    bounds = None if otypeData is None else otypeBounds(otypeData)
+    if type(oslotsData) is tuple:
+        (oslotsData, maxSlot, maxNode) = oslotsData
+        typeOf = None if bounds is None else bounds[3]
+    elif bounds is None:
+        error(f"ERROR: cannot check validity of {WARP[1]} feature")
+        return False
+    else:
+        (maxSlot, maxNode, typeOf) = bounds[1:]
+    if maxSlot is None or maxNode is None:
+        error(f"ERROR: cannot check validity of {WARP[1]} feature")
+        return False
+
+    good = True
+    info(f"maxSlot={maxSlot:>11}")
+    info(f"maxNode={maxNode:>11}")
+
+    (mappedSlotNodes, fakeNodes, unmappedNodes) = checkOslots(
+        oslotsNodes(oslotsData), maxSlot, maxNode
+    )
+
+    missingNodes = untypedNodes(otypeData, maxNode)
+    if missingNodes:
+        error(f"ERROR: {WARP[0]} has no type for nodes")
+        error(makeExamples(missingNodes), tm=False)
+        good = False
+        # nodes that are not there need no slots
+        missingSet = set(missingNodes)
+        unmappedNodes = [n for n in unmappedNodes if n not in missingSet]
+    if mappedSlotNodes:
+        error(f"ERROR: {WARP[1]} maps slot nodes")
+        error(makeExamples(mappedSlotNodes), tm=False)
+        good = False
+    if fakeNodes:
+        error(f"ERROR: {WARP[1]} maps nodes that are not in {WARP[0]}")
+        error(makeExamples(fakeNodes), tm=False)
+        good = False
+    if unmappedNodes:
+        error(f"ERROR: {WARP[1]} fails to map nodes:")
+        unmappedByType = {}
+        for n in unmappedNodes:
+            unmappedByType.setdefault(
+                UNKNOWN if typeOf is None else typeOf(n), []
+            ).append(n)
+        for (nType, nodes) in sorted(
+            unmappedByType.items(), key=lambda x: (-len(x[1]), x[0]),
+        ):
+            error(f"--- unmapped {nType:<10} : {makeExamples(nodes)}")
+        good = False
+
+    if good:
+        info(f"OK: {WARP[1]} is valid")
+    return good
+
+
+# CHECKING A DATASET ON DISK ###
+
+
+def readWarp(path, isEdge, error):
+    # the data of otype or oslots as it is in the file,
+    # without the assumptions that loading makes
+
+    if not os.path.exists(path):
+        error(f'feature file "{path}" does not exist')
+        return None
+    with open(path, encoding="utf8") as fh:
+        # skip the metadata, which ends with a blank line
+        for line in fh:
+            if line.rstrip("\n") == "":
+                break
+        (blocks, errors, nLines, endState) = parseLines(fh, isEdge, False, False)
+    if errors:
+        error(f'feature file "{path}" has {len(errors)} malformed lines')
+        return None
+    blocks = list(resolveBlocks([(blocks, endState)]))
+    if isEdge:
+        return oslotsFromBlocks(blocks)
+    # otype as a dict, the form in which Fabric.save validates it:
+    # nodes without a type are absent, and do not shift the other nodes
+    data = nodeDataFromBlocks(blocks, False)
+    return data if type(data) is dict else {n: data[n] for n in data}
+
+
+def checkDataset(tfDir):
+
+    def info(msg, tm=True):
+        console(msg)
+
+    def error(msg, tm=True):
+        console(msg, error=True)
+
+    tfDir = os.path.expanduser(tfDir)
+    otypeData = readWarp(f"{tfDir}/{WARP[0]}.tf", False, error)
+    oslotsData = readWarp(f"{tfDir}/{WARP[1]}.tf", True, error)
+    if otypeData is None or oslotsData is None:
+        return False
+    return validateWarp(otypeData, oslotsData, info, error)
+
+
+def benchmark(maxNode=10000000):
+    # datasets of increasing size with words and phrases of 2 words,
+    # in dicts, as they are passed to Fabric.save
+
+    messages = []
+
+    def collect(msg, tm=True):
+        messages.append(msg)
+
+    size = 1000
+    while size <= maxNode:
+        mSlot = 2 * size // 3
+        otypeData = dict.fromkeys(range(1, mSlot + 1), "word")
+        otypeData.update(dict.fromkeys(range(mSlot + 1, size + 1), "phrase"))
+        oslotsData = {
+            n: array("I", (2 * i + 1, 2 * i + 2))
+            for (i, n) in enumerate(range(mSlot + 1, size + 1))
+        }
+        for broken in (False, True):
+            if broken:
+                # unmap some nodes, and map a slot and a fake node
+                for n in range(mSlot + 1, size + 1, 997):
+                    del oslotsData[n]
+                oslotsData[1] = array("I", (1,))
+                oslotsData[size + 1] = array("I", (1,))
+            del messages[:]
+            start = time.perf_counter()
+            good = validateWarp(otypeData, oslotsData, collect, collect)
+            elapsed = time.perf_counter() - start
+            console(
+                f"{size:>10} nodes {'broken' if broken else 'valid':<6}: "
+                f"{elapsed:>7.3f}s = {size / elapsed / 1e6:>6.1f}M nodes/s"
+                f" (valid={good})"
+            )
+        if size == maxNode:
+            break
+        size = min((size * 10, maxNode))
+
+
+def main(cargs=sys.argv):
+    if len(cargs) < 2 or any(
+        arg in {"--help", "-help", "-h", "?", "-?"} for arg in cargs
+    ):
+        console(HELP)
+        return
+
+    if cargs[1] == "--bench":
+        benchmark(*(int(arg) for arg in cargs[2:3]))
+        return
+
+    good = checkDataset(cargs[1])
+    sys.exit(0 if good else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,19 @@
 import os
 
 import collections
-from .parameters import VERSION, NAME, APIREF, LOCATIONS
-from .core.data import Data, WARP, WARP2_DEFAULT, MEM_MSG
+from pickle import PicklingError
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from .parameters import VERSION, NAME, APIREF, LOCATIONS, SAVE_POOL_MIN
+from .core.data import (
+    Data,
+    WARP,
+    WARP2_DEFAULT,
+    MEM_MSG,
+    computeBin,
+    isStreamed,
+    saveFeature,
+)
 from .core.helpers import (
     itemize,
     setDir,
@@ -12,9 +23,9 @@ from .core.helpers import (
     cleanName,
     check32,
     console,
-    makeExamples,
 )
 from .core.timestamp import Timestamp
+from .core.validate import validateWarp
 from .core.prepare import (
     levels,
     order,
@@ -22,12 +33,15 @@ from .core.prepare import (
     levUp,
     levDown,
     boundary,
+    intervals,
+    stats,
     sections,
     structure,
 )
 from .core.computed import Computed
 from .core.nodefeature import NodeFeature
 from .core.edgefeature import EdgeFeature
+from .core.lazy import Residency
 from .core.otypefeature import OtypeFeature
 from .core.oslotsfeature import OslotsFeature
 from .core.api import (
@@ -48,6 +62,8 @@ PRECOMPUTE = (
     (False, "__levUp__", levUp, WARP[0:2] + ("__rank__",)),
     (False, "__levDown__", levDown, (WARP[0], "__levUp__", "__rank__")),
     (False, "__boundary__", boundary, WARP[0:2] + ("__rank__",)),
+    (False, "__intervals__", intervals, WARP[0:2]),
+    (False, "__stats__", stats, (WARP[0], "__levUp__")),
     (True, "__sections__", sections, WARP + ("__levUp__", "__levels__")),
     (
         True,
@@ -65,9 +81,10 @@ KIND = dict(__sections__="section", __structure__="structure")
 
 class Fabric(object):
 
-    def __init__(self, locations=None, modules=None, silent=False):
+    def __init__(self, locations=None, modules=None, silent=False, workers=1):
 
         self.silent = silent
+        self.workers = workers
         tmObj = Timestamp()
         self.tmObj = tmObj
         setSilent = tmObj.setSilent
@@ -112,10 +129,11 @@ Api reference : {APIREF}
         )
         self.featuresRequested = []
         self.features = {}
+        self.residency = None
 
         self._makeIndex()
 
-    def load(self, features, add=False, silent=None):
+    def load(self, features, add=False, silent=None, lazy=False, resident=None):
 
         tmObj = self.tmObj
         isSilent = tmObj.isSilent
@@ -131,6 +149,10 @@ Api reference : {APIREF}
             setSilent(silent)
         indent(level=0, reset=True)
         info("loading features ...")
+        if not add:
+            self.residency = Residency(self, limit=resident) if lazy else None
+        elif lazy and self.residency is None:
+            self.residency = Residency(self, limit=resident)
         self.sectionsOK = True
         self.structureOK = True
         self.good = True
@@ -138,6 +160,14 @@ Api reference : {APIREF}
             featuresRequested = (
                 itemize(features) if type(features) is str else sorted(features)
             )
+            if lazy:
+                # the requested features and their dependencies become proxies,
+                # they are loaded when they are first used
+                lazyFeatures = self._withDependencies(featuresRequested)
+                self.residency.requested |= lazyFeatures
+                featuresRequested = [
+                    f for f in featuresRequested if f not in lazyFeatures
+                ]
             if add:
                 self.featuresRequested += featuresRequested
             else:
@@ -328,73 +358,16 @@ Api reference : {APIREF}
             todo.append((fName, data, None, True))
         total = collections.Counter()
         failed = collections.Counter()
-        maxSlot = None
-        maxNode = None
-        slotType = None
         if WARP[0] in nodeFeatures:
             info(f"VALIDATING {WARP[1]} feature")
-            otypeData = nodeFeatures[WARP[0]]
-            if type(otypeData) is tuple:
-                (otypeData, slotType, maxSlot, maxNode) = otypeData
-            elif 1 in otypeData:
-                slotType = otypeData[1]
-                maxSlot = max(n for n in otypeData if otypeData[n] == slotType)
-                maxNode = max(otypeData)
         if WARP[1] in edgeFeatures:
             info(f"VALIDATING {WARP[1]} feature")
-            oslotsData = edgeFeatures[WARP[1]]
-            if type(oslotsData) is tuple:
-                (oslotsData, maxSlot, maxNode) = oslotsData
-            if maxSlot is None or maxNode is None:
-                error(f"ERROR: cannot check validity of {WARP[1]} feature")
+            if not validateWarp(
+                nodeFeatures.get(WARP[0], None), edgeFeatures[WARP[1]], info, error
+            ):
                 good = False
-            else:
-                info(f"maxSlot={maxSlot:>11}")
-                info(f"maxNode={maxNode:>11}")
-                maxNodeInData = max(oslotsData)
-                minNodeInData = min(oslotsData)
-
-                mappedSlotNodes = []
-                unmappedNodes = []
-                fakeNodes = []
-
-                start = min((maxSlot + 1, minNodeInData))
-                end = max((maxNode, maxNodeInData))
-                for n in range(start, end + 1):
-                    if n in oslotsData:
-                        if n <= maxSlot:
-                            mappedSlotNodes.append(n)
-                        elif n > maxNode:
-                            fakeNodes.append(n)
-                    else:
-                        if maxSlot < n <= maxNode:
-                            unmappedNodes.append(n)
-
-                if mappedSlotNodes:
-                    error(f"ERROR: {WARP[1]} maps slot nodes")
-                    error(makeExamples(mappedSlotNodes), tm=False)
-                    good = False
-                if fakeNodes:
-                    error(f"ERROR: {WARP[1]} maps nodes that are not in {WARP[0]}")
-                    error(makeExamples(fakeNodes), tm=False)
-                    good = False
-                if unmappedNodes:
-                    error(f"ERROR: {WARP[1]} fails to map nodes:")
-                    unmappedByType = {}
-                    for n in unmappedNodes:
-                        unmappedByType.setdefault(
-                            otypeData.get(n, "_UNKNOWN_"), []
-                        ).append(n)
-                    for (nType, nodes) in sorted(
-                        unmappedByType.items(),
-                        key=lambda x: (-len(x[1]), x[0]),
-                    ):
-                        error(f"--- unmapped {nType:<10} : {makeExamples(nodes)}")
-                    good = False
-
-            if good:
-                info(f"OK: {WARP[1]} is valid")
 
+        specs = []
         for (fName, data, isEdge, isConfig) in todo:
             edgeValues = False
             fMeta = {}
@@ -404,17 +377,35 @@ Api reference : {APIREF}
                 edgeValues = True
             if "edgeValues" in fMeta:
                 del fMeta["edgeValues"]
-            fObj = Data(
-                f"{self.writeDir}/{fName}.tf",
-                self.tmObj,
-                data=data,
-                metaData=fMeta,
-                isEdge=isEdge,
-                isConfig=isConfig,
-                edgeValues=edgeValues,
+            specs.append(
+                (
+                    fName,
+                    (
+                        f"{self.writeDir}/{fName}.tf",
+                        data,
+                        fMeta,
+                        isEdge,
+                        isConfig,
+                        edgeValues,
+                        fName == WARP[0],
+                    ),
+                )
             )
+        # the pool is only used on request
+        workers = self.workers
+        saved = (
+            self._saveParallel(specs, workers)
+            if workers is not None and workers > 1
+            else {}
+        )
+        for (fName, args) in specs:
+            if fName in saved:
+                fGood = saved[fName]
+            else:
+                fGood = saveFeature(*args, tmObj=self.tmObj)[0]
+            (isEdge, isConfig) = args[3:5]
             tag = "config" if isConfig else "edge" if isEdge else "node"
-            if fObj.save(nodeRanges=fName == WARP[0], overwrite=True):
+            if fGood:
                 total[tag] += 1
             else:
                 failed[tag] += 1
@@ -434,6 +425,49 @@ Api reference : {APIREF}
             setSilent(wasSilent)
         return good
 
+    def _saveParallel(self, specs, workers):
+        # Write features in a process pool, each to its .tf file
+        # and its binary cache.
+        # Data that is streamed from disk and config features
+        # are left to the main process, as are the features that remain
+        # if the pool breaks down.
+        # Returns whether each of the features written here succeeded.
+
+        tmObj = self.tmObj
+        indent = tmObj.indent
+        info = tmObj.info
+        error = tmObj.error
+
+        todo = [
+            (fName, args)
+            for (fName, args) in specs
+            if not args[4] and not isStreamed(args[1])
+        ]
+        saved = {}
+        if len(todo) < SAVE_POOL_MIN:
+            return saved
+
+        info(f"writing {len(todo)} features with {workers} processes")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    (fName, pool.submit(saveFeature, *args)) for (fName, args) in todo
+                ]
+                indent(level=1, reset=True)
+                for (fName, future) in futures:
+                    (good, messages) = future.result()
+                    for (isError, msg, tm) in messages:
+                        if isError:
+                            error(msg, tm=tm)
+                        else:
+                            info(msg, tm=tm)
+                    saved[fName] = good
+        except (BrokenProcessPool, OSError, PicklingError) as e:
+            info(f"parallel writing not possible: {e}")
+        finally:
+            indent(level=0)
+        return saved
+
     def exportMQL(self, mqlName, mqlDir):
 
         tmObj = self.tmObj
@@ -478,6 +512,38 @@ Api reference : {APIREF}
             if not self.features[fName].load(silent=silent):
                 self.good = False
 
+    def _withDependencies(self, fNames):
+        # the features with the features they depend on, all the way down
+
+        features = self.features
+        result = set()
+        todo = [fName for fName in fNames if fName in features]
+        while todo:
+            fName = todo.pop()
+            if fName in result:
+                continue
+            result.add(fName)
+            todo.extend(
+                dep.fileName
+                for dep in features[fName].dependencies or ()
+                if dep is not None
+            )
+        return result
+
+    def _addProxies(self, api):
+        # the lazy features that are not in F or E yet get their proxies there
+
+        residency = self.residency
+        if not residency:
+            return
+        for fName in sorted(residency.requested):
+            fObj = self.features[fName]
+            if fObj.method or hasattr(api.F, fName) or hasattr(api.E, fName):
+                continue
+            if not fObj.load(metaOnly=True, silent="deep") or fObj.isConfig:
+                continue
+            residency.add(api, fName, fObj.isEdge)
+
     def _makeIndex(self):
         tmObj = self.tmObj
         info = tmObj.info
@@ -503,7 +569,9 @@ Api reference : {APIREF}
             for featurePath in sorted(set(featurePaths[0:-1])):
                 if featurePath != chosenFPath:
                     self.featuresIgnored.setdefault(fName, []).append(featurePath)
-            self.features[fName] = Data(chosenFPath, self.tmObj)
+            self.features[fName] = Data(
+                chosenFPath, self.tmObj, workers=self.workers
+            )
         self._getWriteLoc()
         info(
             "{} features found and {} ignored".format(
@@ -587,15 +655,96 @@ Api reference : {APIREF}
 
     def _precompute(self):
         good = True
+        todo = []
         for (fName, dep2) in self.precomputeList:
             ok = getattr(self, f'{fName.strip("_")}OK', False)
             if dep2 and not ok:
                 continue
+            todo.append(fName)
+        # a pool only pays off for big datasets, so it is opt-in: Fabric(workers=n)
+        workers = self.workers
+        if workers is not None and workers > 1:
+            self._computeParallel(todo, workers)
+        for fName in todo:
             if not self.features[fName].load():
                 good = False
                 break
         self.good = good
 
+    def _computeParallel(self, todo, workers):
+        # Compute the stale features among todo in a process pool.
+        # A feature is submitted as soon as the features it depends on
+        # are ready; the workers deliver their results in the binary cache,
+        # from where they will be loaded in the normal way.
+        # If the pool cannot do its work, the remaining features will
+        # just be computed sequentially when they are loaded.
+        # Errors raised by the computations themselves are not hidden.
+
+        tmObj = self.tmObj
+        info = tmObj.info
+        error = tmObj.error
+
+        features = self.features
+        stale = [fName for fName in todo if features[fName].isStale()]
+        if len(stale) < 2:
+            return
+        staleSet = set(stale)
+        for fName in stale:
+            for dep in features[fName].dependencies:
+                if dep.method or dep.isConfig:
+                    continue
+                if not dep.dataLoaded and not dep.load():
+                    return
+                if not os.path.exists(dep.binPath):
+                    return
+            os.makedirs(features[fName].binDir, exist_ok=True)
+
+        def depSpecs(fName):
+            return [
+                (True, dep.metaData) if dep.isConfig else (False, dep.binPath)
+                for dep in features[fName].dependencies
+            ]
+
+        def ready(fName):
+            return all(
+                dep.fileName not in staleSet for dep in features[fName].dependencies
+            )
+
+        info(f"computing {len(stale)} features with {workers} processes")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                running = {}
+                waiting = list(stale)
+                while waiting or running:
+                    for fName in [f for f in waiting if ready(f)]:
+                        waiting.remove(fName)
+                        fObj = features[fName]
+                        running[
+                            pool.submit(
+                                computeBin,
+                                fName,
+                                fObj.method,
+                                fObj.binPath,
+                                depSpecs(fName),
+                            )
+                        ] = fName
+                    if not running:
+                        break
+                    (done, pending) = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        fName = running.pop(future)
+                        (good, messages) = future.result()
+                        for (isError, msg, tm) in messages:
+                            if isError:
+                                error(msg, tm=tm)
+                            else:
+                                info(msg, tm=tm, cache=-1)
+                        if not good:
+                            return
+                        staleSet.discard(fName)
+        except (BrokenProcessPool, OSError, PicklingError) as e:
+            info(f"parallel computation not possible: {e}")
+
     def _makeApi(self):
         if not self.good:
             return None
@@ -655,6 +804,7 @@ Api reference : {APIREF}
                             if hasattr(api.F, fName):
                                 delattr(api.F, fName)
                         fObj.unload()
+        self._addProxies(api)
         addOtype(api)
         addNodes(api)
         addLocality(api)
@@ -690,9 +840,13 @@ Api reference : {APIREF}
                         else:
                             apiFobj = NodeFeature(api, fObj.metaData, fObj.data)
                             setattr(api.F, fName, apiFobj)
+                        if self.residency:
+                            self.residency.release(fName)
                     else:
                         if fName in WARP or fName in self.textFeatures:
                             continue
+                        if self.residency and fName in self.residency.proxies:
+                            continue
                         elif fObj.isEdge:
                             if hasattr(api.E, fName):
                                 delattr(api.E, fName)
@@ -700,5 +854,6 @@ Api reference : {APIREF}
                             if hasattr(api.F, fName):
                                 delattr(api.F, fName)
                         fObj.unload()
+        self._addProxies(api)
         indent(level=0)
         info("All additional features loaded - for details use TF.loadLog()")
@@ -7,7 +7,7 @@ VERSION = '1.0.0'
 
 NAME = "Text-Fabric"
 
-PACK_VERSION = "2"
+PACK_VERSION = "3"
 
 API_VERSION = 3
 
@@ -89,3 +89,19 @@ YARN_RATIO = 1.25
 TRY_LIMIT_FROM = 40
 
 TRY_LIMIT_TO = 40
+
+RESULT_CACHE_SIZE = 64
+
+RESULT_DISK_SIZE = 256 * 1024 * 1024
+
+QUANTIFIER_CACHE_SIZE = 256
+
+PREPARED_CACHE_SIZE = 64
+
+# the least number of features that Fabric.save writes in a process pool:
+# every feature has to be pickled to a worker, which does not pay for a few
+SAVE_POOL_MIN = 8
+
+COMPILE_STITCH = 1
+
+SPILL_SIZE = 250000
@@ -0,0 +1,309 @@
+import os
+import hashlib
+import types
+import threading
+from array import array
+from collections import OrderedDict
+
+from .syntax import reTp
+from .yarn import Yarn
+from ..core.helpers import tempPath
+from ..parameters import RESULT_CACHE_SIZE, RESULT_DISK_SIZE, QUANTIFIER_CACHE_SIZE
+
+# CACHING OF SEARCH RESULTS ###
+
+# Results are cached under a key that is made up of
+#
+#   the template after syntax and semantics,
+#   so that layout and naming of the template do not matter;
+#   the fingerprints (modification time and size) of the loaded features;
+#   the custom sets.
+#
+# The most recently used results are kept in memory.
+# If there is a cache directory, results are also stored on disk,
+# one file per query, containing the sorted results as a flat array of nodes.
+# When the files take more than diskLimit bytes, the least recently used
+# ones are removed.
+
+RESULT_EXT = "tfr"
+
+
+def _normValue(val):
+    if val is None or val is True or val is False:
+        return val
+    if isinstance(val, reTp):
+        return ("~", val.pattern)
+    if isinstance(val, types.FunctionType):
+        # comparisons such as num>3 are compiled into lambdas
+        cells = tuple(c.cell_contents for c in val.__closure__ or ())
+        return ("f", val.__code__.co_code, cells)
+    if isinstance(val, (set, frozenset)):
+        return tuple(sorted(val, key=repr))
+    if isinstance(val, dict):
+        return tuple((k, _normValue(v)) for (k, v) in sorted(val.items()))
+    if isinstance(val, (tuple, list)):
+        return tuple(_normValue(v) for v in val)
+    return val
+
+
+def featuresFingerprint(api):
+    TF = api.TF
+    features = TF.features
+    fingerprint = []
+    for fName in sorted(set(api.Fall()) | set(api.Eall())):
+        fObj = features.get(fName, None)
+        if fObj is None or fObj.method or fObj.isConfig:
+            continue
+        try:
+            stat = os.stat(fObj.path)
+            fingerprint.append((fName, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            fingerprint.append((fName, None, None))
+    return tuple(fingerprint)
+
+
+def _setsFingerprint(sets):
+    if not sets:
+        return ()
+    fingerprint = []
+    for name in sorted(sets):
+        h = hashlib.sha1()
+        h.update(array("I", sorted(sets[name])).tobytes())
+        fingerprint.append((name, h.hexdigest()))
+    return tuple(fingerprint)
+
+
+class ResultCache(object):
+
+    def __init__(self, api, limit=None, location=None, diskLimit=None):
+        self.api = api
+        self.limit = RESULT_CACHE_SIZE if limit is None else limit
+        self.location = location
+        self.diskLimit = RESULT_DISK_SIZE if diskLimit is None else diskLimit
+        self.results = OrderedDict()
+        # searches may run in several threads at the same time
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, exe):
+
+        template = (
+            tuple(
+                (otype, _normValue(feats), _normValue([q[0:3] for q in quantifiers]))
+                for (otype, feats, src, quantifiers) in exe.qnodes
+            ),
+            tuple((f, _normValue(op), t) for (f, op, t) in exe.qedgesRaw),
+        )
+        keyRep = repr(
+            (template, featuresFingerprint(self.api), _setsFingerprint(exe.sets))
+        )
+        return hashlib.sha1(keyRep.encode("utf8")).hexdigest()
+
+    def get(self, key):
+
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+
+        results = self.results
+        queryResults = results.get(key, None)
+        if queryResults is None and self.location:
+            queryResults = self._read(key)
+            if queryResults is not None:
+                self._remember(key, queryResults)
+        elif queryResults is not None:
+            results.move_to_end(key)
+        if queryResults is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return queryResults
+
+    def put(self, key, queryResults):
+
+        with self.lock:
+            self._remember(key, queryResults)
+        if self.location:
+            self._write(key, queryResults)
+
+    def clear(self, disk=False):
+
+        with self.lock:
+            self.results.clear()
+        location = self.location
+        if disk and location and os.path.isdir(location):
+            for fileName in os.listdir(location):
+                if fileName.endswith(f".{RESULT_EXT}"):
+                    os.remove(f"{location}/{fileName}")
+
+    def search(self, exe):
+        # Deliver the sorted results of a search, from the cache if possible.
+        # Only the template is parsed before the cache is consulted;
+        # search errors are not cached.
+
+        # the search will not parse the template again
+        exe._parse()
+        if not exe.good:
+            return exe.search()
+
+        key = self.key(exe)
+        queryResults = self.get(key)
+        if queryResults is None:
+            queryResults = tuple(sorted(exe.search()))
+            if exe.good:
+                self.put(key, queryResults)
+        else:
+            exe.results = lambda remap=True: iter(queryResults)
+        return queryResults
+
+    def _remember(self, key, queryResults):
+
+        results = self.results
+        results[key] = queryResults
+        results.move_to_end(key)
+        while len(results) > max((self.limit, 1)):
+            results.popitem(last=False)
+
+    def _path(self, key):
+
+        return f"{self.location}/{key}.{RESULT_EXT}"
+
+    def _read(self, key):
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as fh:
+                header = array("I")
+                header.fromfile(fh, 2)
+                (width, nResults) = header
+                nodes = array("I")
+                nodes.fromfile(fh, width * nResults)
+            # reading counts as using
+            os.utime(path)
+        except (OSError, EOFError):
+            return None
+        if not nResults:
+            return ()
+        return tuple(zip(*[iter(nodes)] * width))
+
+    def _write(self, key, queryResults):
+
+        location = self.location
+        path = self._path(key)
+        width = len(queryResults[0]) if queryResults else 0
+        nodes = array("I")
+        for r in queryResults:
+            nodes.extend(r)
+        tmpPath = tempPath(path)
+        try:
+            if not os.path.exists(location):
+                os.makedirs(location, exist_ok=True)
+            with open(tmpPath, "wb") as fh:
+                array("I", (width, len(queryResults))).tofile(fh)
+                nodes.tofile(fh)
+            os.replace(tmpPath, path)
+        except OSError:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            return
+        self._sweep()
+
+    def _sweep(self):
+        # remove the least recently used result files until they fit
+
+        location = self.location
+        files = []
+        total = 0
+        with os.scandir(location) as sd:
+            for e in sd:
+                if not e.name.endswith(f".{RESULT_EXT}"):
+                    continue
+                try:
+                    stat = e.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, e.path))
+                total += stat.st_size
+        if total <= self.diskLimit:
+            return
+        for (mtime, size, path) in sorted(files):
+            try:
+                os.remove(path)
+            except OSError:
+                # another search may have removed it already
+                pass
+            total -= size
+            if total <= self.diskLimit:
+                break
+
+
+# CACHING OF QUANTIFIER OUTCOMES ###
+
+# A quantifier reduces the yarn of its atom.
+# The outcome depends on the kind of quantifier, its templates,
+# the yarn it starts with, the loaded features and the custom sets.
+# The most recently used outcomes are kept in memory.
+
+
+class QuantifierCache(object):
+
+    def __init__(self, api, limit=None):
+        self.api = api
+        self.limit = QUANTIFIER_CACHE_SIZE if limit is None else limit
+        self.outcomes = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, searchExe, quKind, atom, quTemplates, universe):
+
+        h = hashlib.sha1()
+        h.update(
+            repr(
+                (
+                    quKind,
+                    atom,
+                    tuple(quTemplates),
+                    featuresFingerprint(self.api),
+                    _setsFingerprint(searchExe.sets),
+                )
+            ).encode("utf8")
+        )
+        # a yarn is hashed by its bits as they are, other sets have to be sorted
+        if type(universe) is Yarn:
+            h.update(b"Y")
+            h.update(universe.bits)
+        else:
+            h.update(b"N")
+            h.update(array("I", sorted(universe)).tobytes())
+        return h.hexdigest()
+
+    def get(self, key):
+
+        with self.lock:
+            outcomes = self.outcomes
+            outcome = outcomes.get(key, None)
+            if outcome is None:
+                self.misses += 1
+            else:
+                outcomes.move_to_end(key)
+                self.hits += 1
+            return outcome
+
+    def put(self, key, outcome):
+
+        with self.lock:
+            outcomes = self.outcomes
+            outcomes[key] = outcome
+            outcomes.move_to_end(key)
+            while len(outcomes) > max((self.limit, 1)):
+                outcomes.popitem(last=False)
+
+    def clear(self):
+
+        with self.lock:
+            self.outcomes.clear()
@@ -155,9 +155,28 @@ def displayPlan(searchExe, details=False):
                 (f, t) = (t, f)
             displayNode(searchExe, f, pos2=True)
 
+            estimates = _estimateSteps(searchExe, f)
+            counts = searchExe.stepCounts
+            complete = searchExe.stepCountsComplete
             nodesSeen = {f}
-            for e in es:
-                nodesSeen |= displayEdge(searchExe, *e, nodesSeen)
+            for (i, e) in enumerate(es):
+                act = (
+                    "?"
+                    if counts is None
+                    else f"{counts[i + 1]}{'' if complete else '+'}"
+                )
+                card = f"{estimates[i]:.0f} vs {act}"
+                nodesSeen |= displayEdge(searchExe, *e, nodesSeen, card=card)
+            info(
+                "Partial results after each step: estimated vs actual"
+                + (
+                    " (actual known after fetching results)"
+                    if counts is None
+                    else "" if complete else " (+ = not all results fetched)"
+                ),
+                tm=False,
+                cache=_msgCache,
+            )
     info(
         "The results are connected to the original search template as follows:",
         cache=_msgCache,
@@ -174,6 +193,37 @@ def displayPlan(searchExe, details=False):
     setSilent(wasSilent)
 
 
+def _estimateSteps(searchExe, f):
+    # estimated number of partial results after each step of the plan:
+    # a new node multiplies them with the spread of the relation,
+    # a relation between nodes that are already bound filters them
+    # with the probability that the relation holds
+
+    qedges = searchExe.qedges
+    yarns = searchExe.yarns
+    spreads = searchExe.spreads
+    spreadsC = searchExe.spreadsC
+    (qs, es) = searchExe.stitchPlan
+
+    estimates = []
+    estimate = len(yarns[f])
+    nodesSeen = {f}
+    for (e, dir) in es:
+        (fq, rela, tq) = qedges[e]
+        if dir == -1:
+            (fq, tq) = (tq, fq)
+        spread = spreads.get(e, 0) if dir == 1 else spreadsC.get(e, 0)
+        if type(tq) is not tuple and tq not in nodesSeen:
+            estimate *= spread
+            nodesSeen.add(tq)
+        else:
+            ts = tq if type(tq) is tuple else (tq,)
+            yarnTl = min(len(yarns[x]) for x in ts)
+            estimate *= min((spread / yarnTl, 1)) if yarnTl else 0
+        estimates.append(estimate)
+    return estimates
+
+
 def displayNode(searchExe, q, pos2=False):
     info = searchExe.api.TF.info
     _msgCache = searchExe._msgCache
@@ -192,7 +242,7 @@ def displayNode(searchExe, q, pos2=False):
     info(nodeInfo, tm=False, cache=_msgCache)
 
 
-def displayEdge(searchExe, e, dir, nodesSeen):
+def displayEdge(searchExe, e, dir, nodesSeen, card=None):
     info = searchExe.api.TF.info
     _msgCache = searchExe._msgCache
     qnodes = searchExe.qnodes
@@ -220,8 +270,9 @@ def displayEdge(searchExe, e, dir, nodesSeen):
         if seen
         else f"{spreads.get(e, -1) if dir == 1 else spreadsC.get(e, -1):8.1f}"
     )
+    cardRep = "" if card is None else f"  {card}"
     info(
-        "edge {:>8}-{:<13} {:^8} {:>2}-{:<13} {} choices{}".format(
+        "edge {:>8}-{:<13} {:^8} {:>2}-{:<13} {} choices{}{}".format(
             ",".join(str(x) for x in f),
             ",".join(set(qnodes[x][0] for x in f)),
             ",".join(relations[x]["acro"] for x in rela),
@@ -229,6 +280,7 @@ def displayEdge(searchExe, e, dir, nodesSeen):
             ",".join(qnodes[x][0] for x in set(t)),
             spread,
             thinRep,
+            cardRep,
         ),
         tm=False,
         cache=_msgCache,
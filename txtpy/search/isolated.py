@@ -0,0 +1,46 @@
+from ..core.timestamp import Timestamp
+
+# ISOLATED QUERIES ###
+
+# A search mutates the message state of TF (silence, indentation, cached
+# messages). When several searches run at the same time, e.g. in threads
+# serving an asyncio application, each of them gets a view on the api
+# with its own message state. Everything else is shared with the real api.
+
+MESSAGE_METHODS = """
+    silentOn
+    silentOff
+    isSilent
+    setSilent
+    info
+    warning
+    error
+    cache
+    reset
+    indent
+""".strip().split()
+
+
+class QueryFabric(object):
+
+    def __init__(self, TF, silent=True):
+        self._TF = TF
+        tmObj = Timestamp()
+        tmObj.setSilent(silent)
+        self.tmObj = tmObj
+        for name in MESSAGE_METHODS:
+            setattr(self, name, getattr(tmObj, name))
+        self.loadLog = tmObj.cache
+
+    def __getattr__(self, name):
+        return getattr(self._TF, name)
+
+
+class QueryApi(object):
+
+    def __init__(self, api, silent=True):
+        self._api = api
+        self.TF = QueryFabric(api.TF, silent=silent)
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
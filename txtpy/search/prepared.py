@@ -0,0 +1,101 @@
+import threading
+
+from .searchexe import SearchExe
+from .graph import connectedness
+from .isolated import QueryApi
+
+# PREPARED TEMPLATES ###
+
+# A prepared template has been parsed and validated once,
+# and its relations have been set up.
+# Searches with it skip all that, and start with spinning the atoms.
+#
+# What a template means depends a bit on the custom sets:
+# a set name may be used as node type, and relations behave differently
+# for sets of slots, sets of non-slots and mixed sets.
+# So a prepared template keeps a parsed version (a front)
+# for every combination of set names and their kinds of nodes.
+# Every front has its own setInfo, the relations of the front remember in it
+# whether a set holds slots or not.
+# Templates with errors are not kept, so that their errors are reported
+# by every search.
+
+
+class PreparedQuery(object):
+
+    def __init__(self, S, searchTemplate, fingerprint=None):
+        self.S = S
+        self.template = searchTemplate
+        self.fingerprint = fingerprint
+        self.fronts = {}
+        self.lock = threading.Lock()
+
+    def run(
+        self,
+        limit=None,
+        sets=None,
+        shallow=False,
+        silent=True,
+        workers=None,
+        cache=False,
+        profile=False,
+        sort=False,
+    ):
+
+        return self.S.search(
+            self.template,
+            limit=limit,
+            sets=sets,
+            shallow=shallow,
+            silent=silent,
+            here=False,
+            workers=workers,
+            cache=cache,
+            profile=profile,
+            sort=sort,
+            _prepared=self,
+        )
+
+    def front(self, sets):
+
+        key = self._setsKey(sets)
+        with self.lock:
+            front = self.fronts.get(key, None)
+        if front is not None:
+            return front
+
+        # parsing happens with its own message state, without output
+        front = SearchExe(
+            QueryApi(self.S.api),
+            self.template,
+            outerTemplate=self.template,
+            sets=sets,
+            silent=True,
+            _msgCache=[],
+            setInfo={},
+        )
+        front._parse()
+        if front.good:
+            connectedness(front)
+        if not front.good:
+            return None
+        with self.lock:
+            self.fronts[key] = front
+        return front
+
+    def _setsKey(self, sets):
+
+        if not sets:
+            return ()
+        maxSlot = self.S.api.F.otype.maxSlot
+        key = []
+        for (name, nodes) in sorted(sets.items()):
+            kind = (
+                True
+                if not nodes or max(nodes) <= maxSlot
+                else False
+                if min(nodes) > maxSlot
+                else None
+            )
+            key.append((name, kind))
+        return tuple(key)
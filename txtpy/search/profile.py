@@ -0,0 +1,193 @@
+from time import perf_counter, process_time
+
+# PROFILING A SEARCH ###
+
+# A profile records where the time of a search goes:
+#
+#   phases: wall and cpu time of syntax, semantics, spinAtoms, spinEdges,
+#           stitch (making the plan) and deliver (fetching the results);
+#   yarns:  the yarn sizes per query node after spinning the atoms
+#           and after spinning the edges;
+#   spins:  every spin of an edge, with the yarn sizes before and after;
+#   steps:  for every step in the stitch plan: how many partial results
+#           entered it, how often the relation was called,
+#           how many candidates were tried, how many passed,
+#           and how many were rejected (backtracks).
+#
+# The relation counts are only made when profiling,
+# by wrapping the relation functions of the stitcher.
+# When the stitching happens in parallel workers,
+# the counts of the workers are not seen.
+#
+# When the results have been delivered, the profile is complete,
+# and the hook (if any) is called with it.
+# Results that are not fetched completely are counted up to the point
+# where fetching stopped.
+
+PHASES = """
+    syntax
+    semantics
+    spinAtoms
+    spinEdges
+    stitch
+    deliver
+""".strip().split()
+
+
+class SearchProfile(object):
+
+    def __init__(self, template, hook=None):
+        self.template = template
+        self.hook = hook
+        self.phases = {}
+        self.yarns = {}
+        self.spins = []
+        self.steps = []
+        self.counters = None
+        self.nResults = 0
+        self.cached = False
+        self.complete = False
+        self.finished = False
+        self._started = {}
+
+    def start(self, phase):
+
+        self._started[phase] = (perf_counter(), process_time())
+
+    def stop(self, phase):
+
+        (wall, cpu) = self._started.pop(phase)
+        times = self.phases.setdefault(phase, [0.0, 0.0])
+        times[0] += perf_counter() - wall
+        times[1] += process_time() - cpu
+
+    def timed(self, phase, func, *args):
+
+        self.start(phase)
+        try:
+            return func(*args)
+        finally:
+            self.stop(phase)
+
+    def deliver(self, searchExe, queryResults):
+        # pass the results through, while timing the fetching of each result
+
+        nResults = 0
+        times = self.phases.setdefault("deliver", [0.0, 0.0])
+        queryResults = iter(queryResults)
+        complete = False
+        try:
+            while True:
+                wall = perf_counter()
+                cpu = process_time()
+                try:
+                    r = next(queryResults)
+                except StopIteration:
+                    complete = True
+                    break
+                finally:
+                    times[0] += perf_counter() - wall
+                    times[1] += process_time() - cpu
+                nResults += 1
+                yield r
+        finally:
+            self.finish(searchExe, nResults, complete=complete)
+
+    def finish(self, searchExe, nResults, complete=True):
+
+        if self.finished:
+            return
+        self.finished = True
+        self.nResults = nResults
+        self.complete = complete
+        counts = getattr(searchExe, "stepCounts", None) if searchExe.good else None
+        counters = self.counters
+        steps = []
+        if counts is not None and counters is not None:
+            for (e, (calls, candidates)) in enumerate(counters):
+                passed = counts[e + 1]
+                steps.append(
+                    dict(
+                        entered=counts[e],
+                        calls=calls,
+                        candidates=candidates,
+                        passed=passed,
+                        backtracks=candidates - passed,
+                    )
+                )
+        self.steps = steps
+        hook = self.hook
+        if hook is not None:
+            hook(self)
+
+    def resultsPerSecond(self):
+
+        wall = sum(self.phases.get(phase, (0, 0))[0] for phase in ("stitch", "deliver"))
+        return self.nResults / wall if wall else None
+
+    def asDict(self):
+
+        return dict(
+            template=self.template,
+            phases={
+                phase: dict(wall=wall, cpu=cpu)
+                for (phase, (wall, cpu)) in self.phases.items()
+            },
+            yarns=self.yarns,
+            spins=self.spins,
+            steps=self.steps,
+            results=self.nResults,
+            resultsPerSecond=self.resultsPerSecond(),
+            cached=self.cached,
+            complete=self.complete,
+        )
+
+    def show(self, TF):
+
+        info = TF.info
+        info("Phase        wall       cpu", tm=False)
+        for phase in PHASES:
+            if phase in self.phases:
+                (wall, cpu) = self.phases[phase]
+                info(f"{phase:<10} {wall:>7.3f}s {cpu:>7.3f}s", tm=False)
+        for (stage, sizes) in self.yarns.items():
+            info(f"yarns after {stage:<9}: {sizes}", tm=False)
+        for (i, step) in enumerate(self.steps):
+            info(
+                "step {:>2}: {entered:>9} in, {calls:>9} calls, {candidates:>9} tried,"
+                " {passed:>9} passed, {backtracks:>9} backtracks".format(i, **step),
+                tm=False,
+            )
+        rate = self.resultsPerSecond()
+        info(
+            "{} results{}{}".format(
+                self.nResults,
+                "" if self.complete else " (not all fetched)",
+                "" if rate is None else f", {rate:.0f} per second",
+            ),
+            tm=False,
+        )
+
+
+def countedRelation(r, nparams, newTarget, counter, tries=True):
+    # counter = [calls, candidates]:
+    # a relation with one parameter yields the candidates for the target;
+    # if the target is already known, only that one candidate is tried.
+
+    if nparams == 1:
+
+        def counted(n):
+            result = tuple(r(n) or ())
+            counter[0] += 1
+            counter[1] += len(result) if newTarget else 1
+            return result
+
+    else:
+
+        def counted(n, m):
+            counter[0] += 1
+            if tries:
+                counter[1] += 1
+            return r(n, m)
+
+    return counted
@@ -1,8 +1,10 @@
 
 import collections
+import threading
 from array import array
 import types
 import re
+from bisect import bisect_left, bisect_right
 from itertools import chain
 
 from ..core.data import WARP
@@ -57,6 +59,7 @@ def basicRelations(searchExe, api):
     ClevDown = C.levDown.data
     ClevUp = C.levUp.data
     (CfirstSlots, ClastSlots) = C.boundary.data
+    (Cfirsts, Clasts, Cgapped, CbyType) = C.intervals.data
     Eoslots = E.oslots.data
     slotType = F.otype.slotType
     maxSlot = F.otype.maxSlot
@@ -65,6 +68,31 @@ def basicRelations(searchExe, api):
     setInfo = searchExe.setInfo
     searchExe.featureValueIndex = {}
     Sindex = searchExe.featureValueIndex
+    # the relation functions of a prepared template are used by all its searches,
+    # also concurrent ones, so the index is filled under a lock
+    SindexLock = threading.RLock()
+
+    def featureIndex(key, make):
+        with SindexLock:
+            index = Sindex.get(key, None)
+            if index is None:
+                index = make()
+                Sindex[key] = index
+        return index
+
+    def valueIndex(f):
+        return featureIndex(f, lambda: makeIndex(Fs(f).data))
+
+    def matchIndex(f, fR, rRe):
+        def make():
+            indFR = {}
+            for (v, ns) in valueIndex(f).items():
+                vR = rRe.sub("", v)
+                for n in ns:
+                    indFR.setdefault(vR, set()).add(n)
+            return indFR
+
+        return featureIndex(fR, make)
 
     def isSlotType(nType):
         if sets is not None and nType in sets:
@@ -83,6 +111,143 @@ def basicRelations(searchExe, api):
             return None
         return nType == slotType
 
+    # the interval index of a node type can be used if it is not a custom set
+
+    def isIndexed(nType):
+        return (sets is None or nType not in sets) and nType in CbyType
+
+    def overlapping(nType, b, e):
+        # the nodes of type nType whose slot interval overlaps with b-e
+        (nodes, tFirsts, maxLen) = CbyType[nType]
+        lo = bisect_left(tFirsts, b - maxLen)
+        hi = bisect_right(tFirsts, e)
+        return [m for m in nodes[lo:hi] if Clasts[m - 1] >= b]
+
+    def slotSet(n):
+        return frozenset(Eoslots[n - maxSlotP] if n > maxSlot else (n,))
+
+    # spinning for relations between slot positions:
+    # the yarns are reduced by comparing the positions of their nodes
+    # with the positions of the nodes in the other yarn, in one pass per yarn.
+    # Nodes without slots are left out.
+    # The relations :: and :k: compare two positions at once; matching those
+    # pairs is slower than the generic spin through the relation itself
+    # (see `python -m txtpy.bench spin`), so they keep the generic spin.
+
+    def firstOf(n):
+        return Cfirsts[n - 1]
+
+    def lastOf(n):
+        return Clasts[n - 1]
+
+    def afterLastOf(n):
+        return Clasts[n - 1] + 1
+
+    def beforeFirstOf(n):
+        return Cfirsts[n - 1] - 1
+
+    def rankOf(n):
+        return Crank[n - 1]
+
+    def nearNodes(y, key, yOther, keyOther, k):
+        # the nodes in y whose key is within k of the key of a node in yOther:
+        # mark the positions of the other nodes, widened by k on both sides
+        size = maxSlot + 2
+        marks = bytearray(size)
+        for m in yOther:
+            if Cfirsts[m - 1]:
+                marks[keyOther(m)] = 1
+        if k:
+            bits = int.from_bytes(marks, "little")
+            near = bits
+            for i in range(1, k + 1):
+                near |= (bits << (8 * i)) | (bits >> (8 * i))
+            marks = near.to_bytes(size + k, "little")[0:size]
+        return {n for n in y if Cfirsts[n - 1] and marks[key(n)]}
+
+    def spinNear(keyF, keyT, k=0):
+        # related nodes have keys that differ at most k
+        def doyarns(yF, yT):
+            return (
+                nearNodes(yF, keyF, yT, keyT, k),
+                nearNodes(yT, keyT, yF, keyF, k),
+            )
+
+        return doyarns
+
+    def spinLess(keyF, keyT, converse=False, withSlots=True):
+        # related nodes n, m have keyF(n) < keyT(m),
+        # or, for the converse, keyF(n) > keyT(m)
+        def doyarns(yF, yT):
+            if withSlots:
+                yF = [n for n in yF if Cfirsts[n - 1]]
+                yT = [m for m in yT if Cfirsts[m - 1]]
+            if not yF or not yT:
+                return (set(), set())
+            if converse:
+                fMax = max(keyF(n) for n in yF)
+                tMin = min(keyT(m) for m in yT)
+                return (
+                    {n for n in yF if keyF(n) > tMin},
+                    {m for m in yT if keyT(m) < fMax},
+                )
+            fMin = min(keyF(n) for n in yF)
+            tMax = max(keyT(m) for m in yT)
+            return (
+                {n for n in yF if keyF(n) < tMax},
+                {m for m in yT if keyT(m) > fMin},
+            )
+
+        return doyarns
+
+    def spinCanonicalBefore(fTp, tTp):
+        return spinLess(rankOf, rankOf, withSlots=False)
+
+    def spinCanonicalAfter(fTp, tTp):
+        return spinLess(rankOf, rankOf, converse=True, withSlots=False)
+
+    def spinSlotBefore(fTp, tTp):
+        return spinLess(lastOf, firstOf)
+
+    def spinSlotAfter(fTp, tTp):
+        return spinLess(firstOf, lastOf, converse=True)
+
+    def spinSameFirstSlot(fTp, tTp):
+        return spinNear(firstOf, firstOf)
+
+    def spinSameLastSlot(fTp, tTp):
+        return spinNear(lastOf, lastOf)
+
+    def spinAdjBefore(fTp, tTp):
+        return spinNear(afterLastOf, firstOf)
+
+    def spinAdjAfter(fTp, tTp):
+        return spinNear(beforeFirstOf, lastOf)
+
+    def spinNearFirstSlot(k):
+        def zz(fTp, tTp):
+            return spinNear(firstOf, firstOf, k)
+
+        return zz
+
+    def spinNearLastSlot(k):
+        def zz(fTp, tTp):
+            return spinNear(lastOf, lastOf, k)
+
+        return zz
+
+    def spinNearBefore(k):
+        def zz(fTp, tTp):
+            return spinNear(afterLastOf, firstOf, k)
+
+        return zz
+
+    def spinNearAfter(k):
+        def zz(fTp, tTp):
+            return spinNear(beforeFirstOf, lastOf, k)
+
+        return zz
+
     # EQUAL
 
     def spinEqual(fTp, tTp):
@@ -158,15 +323,19 @@ def basicRelations(searchExe, api):
 
         else:
 
+            def slotKey(n):
+                # ungapped nodes are identified by their first and last slot
+                if Cgapped[n - 1]:
+                    return slotSet(n)
+                return (Cfirsts[n - 1], Clasts[n - 1])
+
             def doyarns(yF, yT):
                 sindexF = {}
                 for n in yF:
-                    s = frozenset(Eoslots[n - maxSlotP] if n > maxSlot else (n,))
-                    sindexF.setdefault(s, set()).add(n)
+                    sindexF.setdefault(slotKey(n), set()).add(n)
                 sindexT = {}
                 for m in yT:
-                    s = frozenset(Eoslots[m - maxSlotP] if m > maxSlot else (m,))
-                    sindexT.setdefault(s, set()).add(m)
+                    sindexT.setdefault(slotKey(m), set()).add(m)
                 nyS = set(sindexF.keys()) & set(sindexT.keys())
                 nyF = set(chain.from_iterable(sindexF[s] for s in nyS))
                 nyT = set(chain.from_iterable(sindexT[s] for s in nyS))
@@ -179,6 +348,24 @@ def basicRelations(searchExe, api):
         isSlotT = isSlotType(tTp)
         if isSlotF and isSlotT:
             return _l_eq
+        elif isIndexed(tTp):
+            (tNodes, tFirsts, maxLen) = CbyType[tTp]
+
+            def xx(n):
+                b = Cfirsts[n - 1]
+                if not b:
+                    yield n
+                    return
+                e = Clasts[n - 1]
+                nGapped = Cgapped[n - 1]
+                for m in tNodes[bisect_left(tFirsts, b) : bisect_right(tFirsts, b)]:
+                    if Clasts[m - 1] != e or Cgapped[m - 1] != nGapped:
+                        continue
+                    if nGapped and slotSet(m) != slotSet(n):
+                        continue
+                    yield m
+
+            return xx
         else:
 
             def xx(n):
@@ -244,31 +431,33 @@ def basicRelations(searchExe, api):
                 return xx
         else:
 
-            def doyarns(yF, yT):
-                REDUCE_FACTOR = 0.4
-                SIZE_LIMIT = 10000
-                sindexF = {}
-                for n in yF:
-                    for s in Eoslots[n - maxSlotP] if n > maxSlot else (n,):
-                        sindexF.setdefault(s, set()).add(n)
-                sindexT = {}
-                for m in yT:
-                    for s in Eoslots[m - maxSlotP] if m > maxSlot else (m,):
-                        sindexT.setdefault(s, set()).add(m)
-                nyS = set(sindexF.keys()) & set(sindexT.keys())
-
-                lsF = len(sindexF)
-                lsT = len(sindexT)
-                lsI = len(nyS)
-                if lsF == lsT:  # spinning is completely useless
-                    return (yF, yT)
-                if lsI > REDUCE_FACTOR * lsT and lsT > SIZE_LIMIT:
-                    # spinning is not worth it
-                    return (yF, yT)
+            def cover(y):
+                # the slot intervals of the nodes in y, merged and sorted
+                merged = []
+                for (b, e) in sorted((Cfirsts[n - 1], Clasts[n - 1]) for n in y):
+                    if not b:
+                        continue
+                    if merged and b <= merged[-1][1] + 1:
+                        if e > merged[-1][1]:
+                            merged[-1][1] = e
+                    else:
+                        merged.append([b, e])
+                return ([b for (b, e) in merged], merged)
+
+            def hits(covered, y):
+                # the nodes in y whose interval meets the covered intervals
+                # gapped nodes may not overlap at all, but the relation
+                # itself will be checked later
+                (starts, merged) = covered
+                result = set()
+                for n in y:
+                    i = bisect_right(starts, Clasts[n - 1]) - 1
+                    if i >= 0 and merged[i][1] >= Cfirsts[n - 1]:
+                        result.add(n)
+                return result
 
-                nyF = set(chain.from_iterable(sindexF[s] for s in nyS))
-                nyT = set(chain.from_iterable(sindexT[s] for s in nyS))
-                return (nyF, nyT)
+            def doyarns(yF, yT):
+                return (hits(cover(yT), yF), hits(cover(yF), yT))
 
             return doyarns
 
@@ -285,6 +474,25 @@ def basicRelations(searchExe, api):
             def func(n):
                 return chain(ClevUp[n - 1], (n,))
             return func
+        elif isIndexed(tTp):
+
+            def xx(n):
+                b = Cfirsts[n - 1]
+                if not b:
+                    return ()
+                nGapped = Cgapped[n - 1]
+                nSlots = None
+                result = []
+                for m in overlapping(tTp, b, Clasts[n - 1]):
+                    if nGapped or Cgapped[m - 1]:
+                        if nSlots is None:
+                            nSlots = slotSet(n)
+                        if nSlots.isdisjoint(Eoslots[m - maxSlotP]):
+                            continue
+                    result.append(m)
+                return result
+
+            return xx
         else:
 
             def xx(n):
@@ -312,7 +520,9 @@ def basicRelations(searchExe, api):
             return func
         else:
             def func(n, m):
-                return frozenset(Eoslots[n - maxSlotP] if n > maxSlot else (n,)) != frozenset(Eoslots[m - maxSlotP] if m > maxSlot else (m,))
+                if Cgapped[n - 1] or Cgapped[m - 1]:
+                    return slotSet(n) != slotSet(m)
+                return Cfirsts[n - 1] != Cfirsts[m - 1] or Clasts[n - 1] != Clasts[m - 1]
             return func
 
     # DISJOINT SLOTS
@@ -332,7 +542,13 @@ def basicRelations(searchExe, api):
             return func
         else:
             def func(n, m):
-                return len(frozenset(Eoslots[n - maxSlotP] if n > maxSlot else (n,)) & frozenset(Eoslots[m - maxSlotP] if m > maxSlot else (m,))) == 0
+                if Clasts[n - 1] < Cfirsts[m - 1] or Clasts[m - 1] < Cfirsts[n - 1]:
+                    return True
+                if not Cfirsts[n - 1]:
+                    return True
+                if not Cgapped[n - 1] and not Cgapped[m - 1]:
+                    return False
+                return slotSet(n).isdisjoint(slotSet(m))
             return func
 
     # EMBEDDED IN
@@ -757,7 +973,7 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n == maxSlot:
                         return ()
-                    myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                    myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                     if myNext > maxSlot:
                         return ()
                     return (myNext,)
@@ -767,7 +983,7 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n == maxSlot:
                         return ()
-                    myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                    myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                     if myNext > maxSlot:
                         return ()
                     return chain(CfirstSlots[myNext - 1], (myNext,))
@@ -777,7 +993,7 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n == maxSlot:
                         return ()
-                    myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                    myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                     if myNext > maxSlot:
                         return ()
                     return CfirstSlots[myNext - 1]
@@ -800,8 +1016,8 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n <= 1:
                         return ()
-                    myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
-                    if myPrev <= 1:
+                    myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
+                    if myPrev < 1:
                         return ()
                     return (myPrev,)
 
@@ -810,8 +1026,8 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n <= 1:
                         return ()
-                    myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
-                    if myPrev <= 1:
+                    myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
+                    if myPrev < 1:
                         return ()
                     return chain((myPrev,), ClastSlots[myPrev - 1])
 
@@ -820,8 +1036,8 @@ def basicRelations(searchExe, api):
                 def xx(n):
                     if n <= 1:
                         return ()
-                    myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
-                    if myPrev <= 1:
+                    myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
+                    if myPrev < 1:
                         return ()
                     return ClastSlots[myPrev - 1]
 
@@ -841,7 +1057,7 @@ def basicRelations(searchExe, api):
                 if isSlotT:
 
                     def xx(n):
-                        myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                        myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                         return range(
                             max((1, myNext - k)), min((maxSlot, myNext + k)) + 1
                         )
@@ -849,7 +1065,7 @@ def basicRelations(searchExe, api):
                 elif isSlotT is None:
 
                     def xx(n):
-                        myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                        myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                         near = range(
                             max((1, myNext - k)), min((maxSlot, myNext + k)) + 1
                         )
@@ -861,7 +1077,7 @@ def basicRelations(searchExe, api):
                 else:
 
                     def xx(n):
-                        myNext = n + 1 if n < maxSlot else Eoslots[n - maxSlotP][-1] + 1
+                        myNext = n + 1 if n <= maxSlot else Eoslots[n - maxSlotP][-1] + 1
                         near = range(
                             max((1, myNext - k)), min((maxSlot, myNext + k)) + 1
                         )
@@ -885,7 +1101,7 @@ def basicRelations(searchExe, api):
                 if isSlotT:
 
                     def xx(n):
-                        myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
+                        myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
                         return tuple(
                             range(max((1, myPrev - k)), min((maxSlot, myPrev + k)) + 1)
                         )
@@ -893,7 +1109,7 @@ def basicRelations(searchExe, api):
                 elif isSlotT is None:
 
                     def xx(n):
-                        myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
+                        myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
                         near = range(
                             max((1, myPrev - k)), min((maxSlot, myPrev + k)) + 1
                         )
@@ -904,7 +1120,7 @@ def basicRelations(searchExe, api):
                 else:
 
                     def xx(n):
-                        myPrev = n - 1 if n < maxSlot else Eoslots[n - maxSlotP][0] - 1
+                        myPrev = n - 1 if n <= maxSlot else Eoslots[n - maxSlotP][0] - 1
                         near = range(
                             max((1, myPrev - k)), min((maxSlot, myPrev + k)) + 1
                         )
@@ -918,13 +1134,8 @@ def basicRelations(searchExe, api):
 
     def spinLeftFisRightG(f, g):
         def zz(fTp, tTp):
-            if f not in Sindex:
-                Sindex[f] = makeIndex(Fs(f).data)
-            if f != g:
-                if g not in Sindex:
-                    Sindex[g] = makeIndex(Fs(g).data)
-            indF = Sindex[f]
-            indG = Sindex[g]
+            indF = valueIndex(f)
+            indG = indF if f == g else valueIndex(g)
             commonValues = set(indF) if f == g else set(indF) & set(indG)
 
             def doyarns(yF, yT):
@@ -1007,27 +1218,8 @@ def basicRelations(searchExe, api):
             fR = f"{f}~{rPat}"
             gR = f"{g}~{rPat}"
 
-            if fR not in Sindex:
-                if f not in Sindex:
-                    Sindex[f] = makeIndex(Fs(f).data)
-                indFR = {}
-                for (v, ns) in Sindex[f].items():
-                    vR = rRe.sub("", v)
-                    for n in ns:
-                        indFR.setdefault(vR, set()).add(n)
-                Sindex[fR] = indFR
-            if gR not in Sindex:
-                if g not in Sindex:
-                    Sindex[g] = makeIndex(Fs(g).data)
-                indGR = {}
-                for (v, ns) in Sindex[g].items():
-                    vR = rRe.sub("", v)
-                    for n in ns:
-                        indGR.setdefault(vR, set()).add(n)
-                Sindex[gR] = indGR
-
-            indFR = Sindex[fR]
-            indGR = Sindex[gR]
+            indFR = matchIndex(f, fR, rRe)
+            indGR = matchIndex(g, gR, rRe)
 
             commonValues = set(indFR) & set(indGR)
 
@@ -1340,13 +1532,13 @@ def basicRelations(searchExe, api):
         (
             (
                 "<",
-                0.500,
+                spinCanonicalBefore,
                 canonicalBeforeR,
                 "left before right (in canonical node ordering)",
             ),
             (
                 ">",
-                0.500,
+                spinCanonicalAfter,
                 canonicalAfterR,
                 "left after right (in canonical node ordering)",
             ),
@@ -1372,16 +1564,16 @@ def basicRelations(searchExe, api):
             ("]]", True, inR, "left embedded in right"),
         ),
         (
-            ("<<", 0.490, slotBeforeR, "left completely before right"),
-            (">>", 0.490, slotAfterR, "left completely after right"),
+            ("<<", spinSlotBefore, slotBeforeR, "left completely before right"),
+            (">>", spinSlotAfter, slotAfterR, "left completely after right"),
         ),
         (
-            ("=:", True, sameFirstSlotR, "left and right start at the same slot"),
-            ("=:", True, sameFirstSlotR, None),
+            ("=:", spinSameFirstSlot, sameFirstSlotR, "left and right start at the same slot"),
+            ("=:", spinSameFirstSlot, sameFirstSlotR, None),
         ),
         (
-            (":=", True, sameLastSlotR, "left and right end at the same slot"),
-            (":=", True, sameLastSlotR, None),
+            (":=", spinSameLastSlot, sameLastSlotR, "left and right end at the same slot"),
+            (":=", spinSameLastSlot, sameLastSlotR, None),
         ),
         (
             (
@@ -1393,26 +1585,26 @@ def basicRelations(searchExe, api):
             ("::", True, sameBoundaryR, None),
         ),
         (
-            ("<:", True, adjBeforeR, "left immediately before right"),
-            (":>", True, adjAfterR, "left immediately after right"),
+            ("<:", spinAdjBefore, adjBeforeR, "left immediately before right"),
+            (":>", spinAdjAfter, adjAfterR, "left immediately after right"),
         ),
         (
             (
                 "=k:",
-                True,
+                spinNearFirstSlot,
                 nearFirstSlotR,
                 "left and right start at k-nearly the same slot",
             ),
-            ("=k:", True, nearFirstSlotR, None),
+            ("=k:", spinNearFirstSlot, nearFirstSlotR, None),
         ),
         (
             (
                 ":k=",
-                True,
+                spinNearLastSlot,
                 nearLastSlotR,
                 "left and right end at k-nearly the same slot",
             ),
-            (":k=", True, nearLastSlotR, None),
+            (":k=", spinNearLastSlot, nearLastSlotR, None),
         ),
         (
             (
@@ -1424,8 +1616,8 @@ def basicRelations(searchExe, api):
             (":k:", True, nearBoundaryR, None),
         ),
         (
-            ("<k:", True, nearBeforeR, "left k-nearly before right"),
-            (":k>", True, nearAfterR, "left k-nearly after right"),
+            ("<k:", spinNearBefore, nearBeforeR, "left k-nearly before right"),
+            (":k>", spinNearAfter, nearAfterR, "left k-nearly after right"),
         ),
         (
             (".f.", spinLeftFisRightG, leftFisRightGR, "left.f = right.f"),
@@ -1548,19 +1740,22 @@ def add_K_Relations(searchExe, varRels):
             r = relations[j]
             ri = relations[ji]
             lr = len(relations)
+            # slot position relations with a dedicated spin make it per k
+            spin = r["spin"](k) if callable(r["spin"]) else r["spin"]
+            spini = ri["spin"](k) if callable(ri["spin"]) else ri["spin"]
             relations.extend(
                 [
                     dict(
                         name=acro,
                         acro=newAcro,
-                        spin=r["spin"],
+                        spin=spin,
                         func=r["func"](k),
                         desc=r["desc"],
                     ),
                     dict(
                         name=acroi,
                         acro=newAcroi,
-                        spin=ri["spin"],
+                        spin=spini,
                         func=ri["func"](k),
                         desc=ri["desc"],
                     ),
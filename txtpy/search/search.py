@@ -1,7 +1,26 @@
 
+import asyncio
+import threading
+from collections import OrderedDict
+from itertools import islice
+
 from ..core.helpers import console, wrapMessages
 from .searchexe import SearchExe
-from ..parameters import YARN_RATIO, TRY_LIMIT_FROM, TRY_LIMIT_TO
+from .cache import ResultCache, QuantifierCache, featuresFingerprint
+from .isolated import QueryApi
+from .profile import SearchProfile
+from .prepared import PreparedQuery
+from .stitch import StitchPool
+from ..parameters import (
+    YARN_RATIO,
+    TRY_LIMIT_FROM,
+    TRY_LIMIT_TO,
+    COMPILE_STITCH,
+    PREPARED_CACHE_SIZE,
+)
+
+# number of results that asearch() delivers at a time
+BATCH = 1000
 
 
 class Search(object):
@@ -11,11 +30,20 @@ class Search(object):
         self.silent = silent
         self.exe = None
         self.perfDefaults = dict(
-            yarnRatio=YARN_RATIO, tryLimitFrom=TRY_LIMIT_FROM, tryLimitTo=TRY_LIMIT_TO,
+            yarnRatio=YARN_RATIO,
+            tryLimitFrom=TRY_LIMIT_FROM,
+            tryLimitTo=TRY_LIMIT_TO,
+            compileStitch=COMPILE_STITCH,
         )
         self.perfParams = {}
         self.perfParams.update(self.perfDefaults)
         SearchExe.setPerfParams(self.perfParams)
+        self.resultCache = ResultCache(api)
+        self.quantifierCache = QuantifierCache(api)
+        self.preparedQueries = OrderedDict()
+        self.preparedLock = threading.Lock()
+        self.profileExport = None
+        self.pool = None
 
     def tweakPerformance(self, silent=False, **kwargs):
 
@@ -56,9 +84,17 @@ class Search(object):
         shallow=False,
         silent=True,
         here=True,
+        workers=None,
+        cache=False,
+        profile=False,
+        sort=False,
         _msgCache=False,
+        _prepared=None,
     ):
 
+        profile = self._profile(searchTemplate, profile)
+        if _prepared is None:
+            _prepared = self.prepare(searchTemplate)
         exe = SearchExe(
             self.api,
             searchTemplate,
@@ -70,19 +106,112 @@ class Search(object):
             silent=silent,
             _msgCache=_msgCache,
             setInfo={},
+            workers=workers,
+            profile=profile,
+            sort=sort,
+            front=_prepared.front(sets),
         )
         if here:
             self.exe = exe
-        queryResults = exe.search(limit=limit)
+        if cache and not shallow:
+            queryResults = self.resultCache.search(exe)
+            if profile is not None and exe.good and not profile.finished:
+                profile.cached = True
+                profile.finish(exe, len(queryResults))
+            if sort and exe.good:
+                queryResults = tuple(sorted(queryResults, key=self.api.N.sortKeyTuple))
+            if limit is not None and exe.good:
+                queryResults = queryResults[0:limit]
+        else:
+            queryResults = exe.search(limit=limit)
+        extra = () if profile is None else (profile,)
         if type(_msgCache) is list:
             messages = wrapMessages(_msgCache)
-            return (queryResults, messages) if here else (queryResults, messages, exe)
-        return queryResults
+            return (
+                (queryResults, messages) if here else (queryResults, messages, exe)
+            ) + extra
+        return (queryResults, *extra) if extra else queryResults
+
+    def exportProfiles(self, hook=None):
+        # hook is called with every completed profile,
+        # i.e. of searches with profile=True, after their results are fetched
+        self.profileExport = hook
+
+    def prepare(self, searchTemplate):
+        # Prepared templates are kept in memory, the most recently used ones.
+        # They are dropped when the loaded features change.
+
+        fingerprint = featuresFingerprint(self.api)
+        preparedQueries = self.preparedQueries
+        with self.preparedLock:
+            prepared = preparedQueries.get(searchTemplate, None)
+            if prepared is None or prepared.fingerprint != fingerprint:
+                prepared = PreparedQuery(self, searchTemplate, fingerprint=fingerprint)
+                preparedQueries[searchTemplate] = prepared
+            preparedQueries.move_to_end(searchTemplate)
+            while len(preparedQueries) > max((PREPARED_CACHE_SIZE, 1)):
+                preparedQueries.popitem(last=False)
+        return prepared
+
+    def stitchPool(self, workers):
+        # The pool of processes for parallel stitching.
+        # It is made when it is first needed, and made again when the number
+        # of workers or the loaded features change.
+
+        fingerprint = featuresFingerprint(self.api)
+        pool = self.pool
+        if pool is not None and (
+            pool.workers != workers or pool.fingerprint != fingerprint
+        ):
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = StitchPool(self.api, workers, fingerprint=fingerprint)
+            self.pool = pool
+        return pool
+
+    def _profile(self, searchTemplate, profile):
+
+        if not profile:
+            return None
+        return SearchProfile(searchTemplate, hook=self.profileExport)
+
+    def cacheResults(self, limit=None, location=None, clear=False, diskLimit=None):
+
+        TF = self.api.TF
+        if location is True:
+            location = f"{TF.features['otype'].binDir}/results"
+        resultCache = self.resultCache
+        if clear:
+            resultCache.clear(disk=True)
+        self.resultCache = ResultCache(
+            self.api, limit=limit, location=location, diskLimit=diskLimit
+        )
+        TF.info(
+            "Caching search results: {} in memory{}".format(
+                self.resultCache.limit,
+                ""
+                if location is None
+                else ", up to {} MB on disk in {}".format(
+                    self.resultCache.diskLimit // (1024 * 1024), location
+                ),
+            ),
+            tm=False,
+        )
 
     def study(
-        self, searchTemplate, strategy=None, sets=None, shallow=False, here=True,
+        self,
+        searchTemplate,
+        strategy=None,
+        sets=None,
+        shallow=False,
+        here=True,
+        workers=None,
+        profile=False,
+        sort=False,
     ):
 
+        profile = self._profile(searchTemplate, profile)
         exe = SearchExe(
             self.api,
             searchTemplate,
@@ -94,10 +223,15 @@ class Search(object):
             silent=False,
             showQuantifiers=True,
             setInfo={},
+            workers=workers,
+            profile=profile,
+            sort=sort,
+            front=self.prepare(searchTemplate).front(sets),
         )
         if here:
             self.exe = exe
-        return exe.study(strategy=strategy)
+        exe.study(strategy=strategy)
+        return profile
 
     def fetch(self, limit=None, _msgCache=False):
 
@@ -114,15 +248,179 @@ class Search(object):
                 return (queryResults, messages)
             return queryResults
 
-    def count(self, progress=None, limit=None):
+    def count(self, progress=None, limit=None, workers=None):
 
         exe = self.exe
         if exe is None:
             error = self.api.TF.error
             error('Cannot count if there is no previous "study()"')
         else:
+            if workers is not None:
+                exe.workers = workers
             exe.count(progress=progress, limit=limit)
 
+    # ASYNCHRONOUS SEARCH ###
+
+    # The work is done in an executor (by default the thread pool of the loop),
+    # so that the event loop stays responsive.
+    # Every query has its own message state and performance parameters,
+    # and does not touch S.exe, so queries can run concurrently.
+    # Results come in batches; when the consumer stops or is cancelled,
+    # no further batches are computed.
+    # A template with errors raises a ValueError with the error messages.
+    # There is no parallel stitching: that only happens in the main thread.
+
+    async def asearch(
+        self,
+        searchTemplate,
+        limit=None,
+        sets=None,
+        batch=None,
+        workers=None,
+        cache=False,
+        profile=False,
+        sort=False,
+        executor=None,
+    ):
+
+        if workers is not None and workers > 1:
+            # parallel stitching forks, which is not safe outside the main thread
+            raise ValueError(f"asearch() stitches with 1 worker, not with {workers}")
+        loop = asyncio.get_running_loop()
+        exe = self._isolatedExe(
+            searchTemplate,
+            sets=sets,
+            workers=workers,
+            profile=self._profile(searchTemplate, profile),
+            sort=sort,
+        )
+        if batch is None:
+            batch = BATCH
+
+        # lazily loaded features that this query uses stay loaded until it ends
+        residency = self.api.TF.residency
+        pinned = set()
+
+        def pinning(func):
+            if residency is None:
+                return func
+
+            def pinnedFunc():
+                with residency.using(pinned):
+                    return func()
+
+            return pinnedFunc
+
+        def unpin():
+            if residency is not None:
+                residency.unpin(pinned)
+
+        @pinning
+        def start():
+            if cache:
+                queryResults = self.resultCache.search(exe)
+                profile = exe.profile
+                if profile is not None and exe.good and not profile.finished:
+                    profile.cached = True
+                    profile.finish(exe, len(queryResults))
+                if sort and exe.good:
+                    queryResults = sorted(queryResults, key=self.api.N.sortKeyTuple)
+                return queryResults
+            return exe.search()
+
+        def afterwards(future, func):
+            # func runs when the executor is done with the future,
+            # also when the awaiting task has been cancelled before that
+
+            def done(future):
+                if not future.cancelled():
+                    future.exception()
+                func()
+
+            if future.done():
+                done(future)
+            else:
+                future.add_done_callback(done)
+
+        # the work in the executor cannot be cancelled, so we await it shielded:
+        # when the task is cancelled, the executor may still be busy with it
+        pending = loop.run_in_executor(executor, start)
+        try:
+            queryResults = await asyncio.shield(pending)
+        except BaseException:
+            afterwards(pending, unpin)
+            raise
+        if not exe.good:
+            unpin()
+            messages = "".join(
+                msgRep + ("\n" if nl else "") for (error, nl, msgRep) in exe._msgCache
+            )
+            raise ValueError(f"Bad search template:\n{messages}")
+        results = iter(queryResults)
+        if limit is not None:
+            results = islice(results, limit)
+
+        @pinning
+        def nextBatch():
+            return tuple(islice(results, batch))
+
+        def finish():
+            close = getattr(queryResults, "close", None)
+            if close is not None:
+                close()
+            unpin()
+
+        pending = None
+        try:
+            while True:
+                pending = loop.run_in_executor(executor, nextBatch)
+                theseResults = await asyncio.shield(pending)
+                if not theseResults:
+                    break
+                yield theseResults
+        finally:
+            if pending is None:
+                finish()
+            else:
+                afterwards(pending, finish)
+
+    async def acount(
+        self, searchTemplate, limit=None, sets=None, workers=None, executor=None
+    ):
+
+        nResults = 0
+        async for theseResults in self.asearch(
+            searchTemplate,
+            limit=limit,
+            sets=sets,
+            workers=workers,
+            executor=executor,
+        ):
+            nResults += len(theseResults)
+        return nResults
+
+    def _isolatedExe(
+        self, searchTemplate, sets=None, workers=None, profile=None, sort=False
+    ):
+
+        return SearchExe(
+            QueryApi(self.api),
+            searchTemplate,
+            outerTemplate=searchTemplate,
+            quKind=None,
+            offset=0,
+            sets=sets,
+            shallow=False,
+            silent=True,
+            _msgCache=[],
+            setInfo={},
+            workers=workers,
+            perfParams=dict(self.perfParams),
+            profile=profile,
+            sort=sort,
+            front=self.prepare(searchTemplate).front(sets),
+        )
+
     def showPlan(self, details=False):
 
         exe = self.exe
@@ -10,6 +10,43 @@ from .stitch import setStrategy, stitch
 PROGRESS = 100
 LIMIT = 1000
 
+# the state that a prepared template passes on to the searches that use it:
+# the relations, and the outcome of syntax and semantics.
+# Every search gets its own copy of the containers, not the front's own ones,
+# because the front is used by all later and concurrent searches of the template.
+RELATION_STATE = """
+    relations
+    relationFromName
+    relationLegend
+    converse
+    edgeMap
+    nodeMap
+    featureValueIndex
+""".strip().split()
+
+PARSED_STATE = """
+    good
+    searchLines
+    tokens
+    badSyntax
+    badSemantics
+    qnodes
+    qnames
+    qedgesRaw
+    nodeLine
+    edgeLine
+""".strip().split()
+
+
+def ownCopy(name, value):
+    # a shallow copy of a container of the front,
+    # nodeMap holds sets that semantics may add to
+
+    if name == "nodeMap":
+        return {k: set(v) for (k, v) in value.items()}
+    tp = type(value)
+    return tp(value) if tp in {list, dict, set} else value
+
 
 class SearchExe(object):
     perfParams = {}
@@ -31,7 +68,13 @@ class SearchExe(object):
         silent=True,
         showQuantifiers=False,
         _msgCache=False,
-        setInfo={},
+        setInfo=None,
+        workers=None,
+        perfParams=None,
+        profile=None,
+        universe=None,
+        sort=False,
+        front=None,
     ):
         self.api = api
         TF = api.TF
@@ -49,8 +92,23 @@ class SearchExe(object):
         self.showQuantifiers = showQuantifiers
         self._msgCache = _msgCache if type(_msgCache) is list else -1 if _msgCache else 0
         self.good = True
-        self.setInfo = setInfo
-        basicRelations(self, api)
+        # the outcome of parsing the template, once it has been parsed
+        self.parsed = None
+        self.setInfo = {} if setInfo is None else setInfo
+        self.workers = workers
+        if perfParams is not None:
+            self.perfParams = perfParams
+        self.profile = profile
+        self.universe = universe
+        # sorted results start the plan at the first node of the template
+        self.sort = sort and not self.shallow
+        self.planRoot = 0 if self.sort else None
+        self.front = front
+        if front is None:
+            basicRelations(self, api)
+        else:
+            for name in RELATION_STATE:
+                setattr(self, name, ownCopy(name, getattr(front, name)))
 
     # API METHODS ###
 
@@ -89,18 +147,20 @@ class SearchExe(object):
             f"Setting up search space for {len(self.qnodes)} objects ...",
             cache=_msgCache,
         )
-        spinAtoms(self)
+        self._timed("spinAtoms", spinAtoms)
+        self._yarnSizes("atoms")
         info(
             f"Constraining search space with {len(self.qedges)} relations ...",
             cache=_msgCache,
         )
-        spinEdges(self)
+        self._timed("spinEdges", spinEdges)
+        self._yarnSizes("edges")
         info(f"\t{len(self.thinned)} edges thinned", cache=_msgCache)
         info(
             f"Setting up retrieval plan with strategy {self.strategyName} ...",
             cache=_msgCache,
         )
-        stitch(self)
+        self._timed("stitch", stitch)
         if self.good:
             yarnContent = sum(len(y) for y in self.yarns.values())
             info(f"Ready to deliver results from {yarnContent} nodes", cache=_msgCache)
@@ -108,16 +168,24 @@ class SearchExe(object):
             info("See S.showPlan() to interpret the results", tm=False, cache=_msgCache)
 
     def fetch(self, limit=None):
-        if not self.good:
-            queryResults = set() if self.shallow else []
-        elif self.shallow:
-            queryResults = self.results
+        profile = self.profile
+        if not self.good or self.shallow:
+            queryResults = (
+                self.results if self.good else set() if self.shallow else []
+            )
+            if profile is not None:
+                profile.finish(self, len(queryResults))
         else:
+            allResults = (
+                self.results()
+                if profile is None
+                else profile.deliver(self, self.results())
+            )
             if limit is None:
-                queryResults = self.results()
+                queryResults = allResults
             else:
                 queryResults = []
-                for r in self.results():
+                for r in allResults:
                     queryResults.append(r)
                     if len(queryResults) == limit:
                         break
@@ -185,8 +253,34 @@ class SearchExe(object):
     # TOP-LEVEL IMPLEMENTATION METHODS
 
     def _parse(self):
-        syntax(self)
-        semantics(self)
+        # the result cache may have parsed the template already,
+        # parsing again would repeat the error messages
+        if self.parsed is not None:
+            self.good = self.parsed
+            return
+        front = self.front
+        if front is not None:
+            for name in PARSED_STATE:
+                setattr(self, name, ownCopy(name, getattr(front, name)))
+            # planning may add edges
+            self.qedges = list(front.qedges)
+        else:
+            self._timed("syntax", syntax)
+            self._timed("semantics", semantics)
+        self.parsed = self.good
+
+    def _timed(self, phase, func):
+        profile = self.profile
+        if profile is None:
+            func(self)
+        else:
+            profile.timed(phase, func, self)
+
+    def _yarnSizes(self, stage):
+        profile = self.profile
+        if profile is not None:
+            yarns = self.yarns
+            profile.yarns[stage] = tuple(len(yarns[q]) for q in range(len(self.qnodes)))
 
     def _prepare(self):
         if not self.good:
@@ -196,4 +290,10 @@ class SearchExe(object):
         self.spreadsC = {}
         self.uptodate = {}
         self.results = None
-        connectedness(self)
+        self.stepCounts = None
+        self.stepCountsComplete = False
+        front = self.front
+        if front is None:
+            connectedness(self)
+        else:
+            self.components = front.components
@@ -1,6 +1,5 @@
 
 import types
-from random import randrange
 from inspect import signature
 
 from .syntax import (
@@ -13,11 +12,114 @@ from .syntax import (
     QOR,
     QEND,
 )
-from ..core.helpers import project
+from ..core.mapped import MappedNodeData
+from .yarn import Yarn
 
 # SPINNING ###
 
 
+# conditions that cost more than this factor times the current
+# number of candidates are checked node by node instead of via the index
+INDEX_RATIO = 4
+
+
+def _valueCondition(data, val):
+    # Translate a feature condition into the values that satisfy it,
+    # plus whether nodes without a value satisfy it.
+    # Returns None if the condition is satisfied by all nodes.
+
+    index = data.nodesByValue()
+    if val is None:
+        return ((), True)
+    if val is True:
+        return (tuple(index), False)
+    if isinstance(val, types.FunctionType):
+        return (tuple(v for v in index if val(v)), bool(val(None)))
+    if isinstance(val, reTp):
+        return (tuple(v for v in index if val.search(v)), False)
+    (ident, values) = val
+    if ident is None and values is True:
+        return None
+    if ident:
+        return (tuple(v for v in values if v in index), None in values)
+    return (tuple(v for v in index if v not in values), None not in values)
+
+
+def _prefilter(Fs, nodeSet, featureList):
+    # Narrow down the candidate nodes by means of the value index
+    # of compactly stored features.
+    # Conditions are translated into sets of values, which are looked up
+    # in the index, and intersected with the candidates,
+    # the most selective condition first.
+    # Conditions that cannot be handled in this way, or that would cost
+    # more than checking the candidates one by one, are returned,
+    # to be checked node by node.
+
+    isRange = type(nodeSet) is range
+    if isRange:
+        (b, e) = (nodeSet.start, nodeSet.stop - 1)
+    elif not isinstance(nodeSet, (set, frozenset, Yarn)):
+        nodeSet = set(nodeSet)
+    size = len(nodeSet)
+
+    remaining = []
+    conditions = []
+    for (ft, val) in featureList:
+        data = Fs(ft).data
+        if type(data) is not MappedNodeData:
+            remaining.append((ft, val))
+            continue
+        condition = _valueCondition(data, val)
+        if condition is None:
+            continue
+        (goodValues, withMissing) = condition
+        index = data.nodesByValue()
+        if withMissing:
+            # negative condition: we exclude the nodes with the other values
+            goodValues = set(goodValues)
+            values = tuple(v for v in index if v not in goodValues)
+            amount = sum(len(index[v]) for v in values)
+            estimate = size - amount
+        else:
+            values = goodValues
+            amount = sum(len(index[v]) for v in values)
+            estimate = amount
+        conditions.append((estimate, amount, ft, val, data, values, withMissing))
+
+    candidates = None
+    for (estimate, amount, ft, val, data, values, withMissing) in sorted(
+        conditions, key=lambda x: x[0]
+    ):
+        if candidates is not None and amount > INDEX_RATIO * len(candidates):
+            remaining.append((ft, val))
+            continue
+        nodes = set()
+        if isRange:
+            for v in values:
+                nodes.update(data.nodesIn(v, b, e))
+        else:
+            index = data.nodesByValue()
+            for v in values:
+                nodes.update(n for n in index[v] if n in nodeSet)
+        if withMissing:
+            # a range of nodes is not copied into a set first
+            candidates = (
+                candidates - nodes
+                if candidates is not None
+                else nodeSet - nodes
+                if type(nodeSet) is Yarn
+                else {n for n in nodeSet if n not in nodes}
+            )
+        else:
+            candidates = nodes if candidates is None else candidates & nodes
+        if not candidates:
+            return (candidates, [])
+
+    if candidates is None:
+        candidates = nodeSet
+    return (candidates, sorted(remaining))
+
+
 def _spinAtom(searchExe, q):
     F = searchExe.api.F
     Fs = searchExe.api.Fs
@@ -27,11 +129,29 @@ def _spinAtom(searchExe, q):
     (otype, features, src, quantifiers) = qnodes[q]
     featureList = sorted(features.items())
     yarn = set()
-    nodeSet = sets[otype] if sets is not None and otype in sets else F.otype.s(otype)
+    size = F.otype.maxNode + 1
+    universe = searchExe.universe
+    if q == 0 and universe is not None:
+        # the atom of a quantifier: the parent has spun it already
+        nodeSet = universe
+        featureList = []
+    else:
+        nodeSet = (
+            Yarn.fromNodes(sets[otype], size)
+            if sets is not None and otype in sets
+            else F.otype.s(otype)
+        )
+    (nodeSet, featureList) = _prefilter(Fs, nodeSet, featureList)
+    if not featureList:
+        # the candidates become the yarn as they are,
+        # a range of nodes is not copied into a set first
+        yarn = nodeSet
+        nodeSet = ()
+    fValues = {ft: Fs(ft).v for (ft, val) in featureList}
     for n in nodeSet:
         good = True
         for (ft, val) in featureList:
-            fval = Fs(ft).v(n)
+            fval = fValues[ft](n)
             if val is None:
                 if fval is not None:
                     good = False
@@ -62,6 +182,7 @@ def _spinAtom(searchExe, q):
                         break
         if good:
             yarn.add(n)
+    yarn = Yarn.fromNodes(yarn, size)
     if quantifiers:
         for quantifier in quantifiers:
             yarn = _doQuantifier(searchExe, yarn, src, quantifier)
@@ -70,6 +191,7 @@ def _spinAtom(searchExe, q):
 
 def _doQuantifier(searchExe, yarn, atom, quantifier):
     from .searchexe import SearchExe
+    from .stitch import _stitchers
 
     (quKind, quTemplates, parentName, ln) = quantifier
     TF = searchExe.api.TF
@@ -79,7 +201,9 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
     showQuantifiers = searchExe.showQuantifiers
     silent = searchExe.silent
     level = searchExe.level
+    # the yarn is a Yarn, and so are the outcomes
     universe = yarn
+    size = len(yarn.bits)
     cleanAtom = cleanParent(atom, parentName)
     offset = searchExe.offset + ln
 
@@ -87,22 +211,54 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
         indent(level=level + 1, reset=True)
         info(f'"Quantifier on "{cleanAtom}"', cache=_msgCache)
 
-    if quKind == QWITHOUT:
-        queryN = "\n".join((cleanAtom, quTemplates[0]))
+    # The sub-searches start with the atom, restricted to the yarn
+    # that has been spun for it so far.
+    # The outcome only depends on the sub-templates and that yarn,
+    # so it is remembered for later quantifiers and queries.
+
+    quCache = _quantifierCache(searchExe)
+    quKey = (
+        None
+        if quCache is None
+        else quCache.key(searchExe, quKind, cleanAtom, quTemplates, universe)
+    )
+    remembered = None if quKey is None else quCache.get(quKey)
+    if remembered is not None:
+        resultYarn = Yarn.fromNodes(remembered, size)
+        if showQuantifiers:
+            indent(level=level + 1)
+            info(
+                f"reduction from {len(yarn)} to {len(resultYarn)} nodes (remembered)",
+                cache=_msgCache,
+            )
+            indent(level=0)
+        return resultYarn
+
+    subExes = []
+
+    def subSearch(query, subKind, subOffset, shallow):
         exe = SearchExe(
             searchExe.api,
-            queryN,
+            query,
             outerTemplate=searchExe.outerTemplate,
-            quKind=quKind,
+            quKind=subKind,
+            offset=subOffset,
             level=level + 1,
-            offset=offset,
             sets=searchExe.sets,
-            shallow=True,
+            shallow=shallow,
             showQuantifiers=showQuantifiers,
             silent=silent,
             _msgCache=_msgCache,
             setInfo=searchExe.setInfo,
+            perfParams=searchExe.perfParams,
+            universe=universe,
         )
+        subExes.append(exe)
+        return exe
+
+    if quKind == QWITHOUT:
+        queryN = "\n".join((cleanAtom, quTemplates[0]))
+        exe = subSearch(queryN, quKind, offset, True)
         if showQuantifiers:
             indent(level=level + 2, reset=True)
             info(f"{quKind}\n{queryN}\n{QEND}", tm=False, cache=_msgCache)
@@ -112,65 +268,55 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
             indent(level=level + 2)
             info(f"{len(noResults)} nodes to exclude", cache=_msgCache)
     elif quKind == QWHERE:
-        # compute the atom+antecedent:
-        #   as result tuples
+        # a semi-join:
+        # the atom+antecedent tuples are stitched atom node by atom node,
+        # and for every atom node only until the first of its tuples
+        # that is not an atom+antecedent+consequent tuple.
+        # The plan of atom+antecedent starts with the atom for that.
         queryA = "\n".join((cleanAtom, quTemplates[0]))
-        exe = SearchExe(
-            searchExe.api,
-            queryA,
-            outerTemplate=searchExe.outerTemplate,
-            quKind=quKind,
-            offset=offset,
-            level=level + 1,
-            sets=searchExe.sets,
-            shallow=False,
-            showQuantifiers=showQuantifiers,
-            silent=silent,
-            _msgCache=_msgCache,
-            setInfo=searchExe.setInfo,
-        )
+        exe = subSearch(queryA, quKind, offset, False)
+        exe.planRoot = 0
         if showQuantifiers:
             indent(level=level + 2, reset=True)
             info(f"{quKind}\n{queryA}", tm=False, cache=_msgCache)
-        aResultTuples = exe.search(limit=-1)
-        if showQuantifiers:
-            indent(level=level + 2)
-            info(f"{len(aResultTuples)} matching nodes", cache=_msgCache)
-        if not aResultTuples:
+        wasSilent = TF.isSilent()
+        TF.setSilent(True)
+        exe.study()
+        TF.setSilent(wasSilent)
+        atomYarn = exe.yarns[0] if exe.good else ()
+        if not atomYarn:
+            if showQuantifiers:
+                indent(level=level + 2)
+                info("0 matching nodes", cache=_msgCache)
             resultYarn = yarn
         else:
-            sizeA = len(aResultTuples[0])
+            sizeA = len(exe.qnodes)
 
             # compute the atom+antecedent+consequent:
             #   as shallow result tuples (same length as atom+antecedent)
             queryAH = "\n".join((cleanAtom, *quTemplates))
             offset += len(quTemplates[0].split("\n"))
-            exe = SearchExe(
-                searchExe.api,
-                queryAH,
-                outerTemplate=searchExe.outerTemplate,
-                quKind=QHAVE,
-                offset=offset,
-                level=level + 1,
-                sets=searchExe.sets,
-                shallow=sizeA,
-                showQuantifiers=showQuantifiers,
-                silent=silent,
-                _msgCache=_msgCache,
-                setInfo=searchExe.setInfo,
-            )
+            exeAH = subSearch(queryAH, QHAVE, offset, sizeA)
             if showQuantifiers:
                 indent(level=level + 2, reset=True)
                 info(f"{QHAVE}\n{queryAH}\n{QEND}", tm=False, cache=_msgCache)
-            ahResults = exe.search()
+            ahResults = exeAH.search()
             if showQuantifiers:
                 indent(level=level + 2)
                 info(f"{len(ahResults)} matching nodes", cache=_msgCache)
 
-            # determine the shallow tuples that correspond to
-            #   atom+antecedent but not consequent
-            #   and then take the projection to their first components
-            resultsAnotH = project(set(aResultTuples) - ahResults, 1)
+            # determine the atoms with an atom+antecedent tuple
+            # that is not an atom+antecedent+consequent tuple
+            resultsAnotH = set()
+            if exe.stitchPlan[1]:
+                deliver = _stitchers(exe)[0]
+                for n in atomYarn:
+                    for aTuple in deliver(remap=True, firstYarn=(n,)):
+                        if aTuple not in ahResults:
+                            resultsAnotH.add(n)
+                            break
+            else:
+                resultsAnotH = {n for n in atomYarn if (n,) not in ahResults}
             if showQuantifiers:
                 indent(level=level + 2)
                 info(
@@ -183,24 +329,11 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
             resultYarn = universe - resultsAnotH
     elif quKind == QWITH:
         # compute the atom+alternative for all alternatives and union them
-        resultYarn = set()
+        resultYarn = Yarn(bytearray(size))
         nAlts = len(quTemplates)
         for (i, alt) in enumerate(quTemplates):
             queryAlt = "\n".join((cleanAtom, alt))
-            exe = SearchExe(
-                searchExe.api,
-                queryAlt,
-                outerTemplate=searchExe.outerTemplate,
-                quKind=quKind if i == 0 else QOR,
-                offset=offset,
-                level=level + 1,
-                sets=searchExe.sets,
-                shallow=True,
-                showQuantifiers=showQuantifiers,
-                silent=silent,
-                _msgCache=_msgCache,
-                setInfo=searchExe.setInfo,
-            )
+            exe = subSearch(queryAlt, quKind if i == 0 else QOR, offset, True)
             offset += len(alt.split("\n")) + 1
             if showQuantifiers:
                 indent(level=level + 2, reset=True)
@@ -209,8 +342,7 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
                     tm=False,
                     cache=_msgCache,
                 )
-            altResults = exe.search()
-            altResults &= universe
+            altResults = universe & exe.search()
             nAlt = len(altResults)
             nYarn = len(resultYarn)
             resultYarn |= altResults
@@ -224,15 +356,55 @@ def _doQuantifier(searchExe, yarn, atom, quantifier):
         indent(level=level + 1)
         info(f"reduction from {len(yarn)} to {len(resultYarn)} nodes", cache=_msgCache)
         indent(level=0)
+    if quKey is not None and all(exe.good for exe in subExes):
+        # the nodes take less memory than the bits
+        quCache.put(quKey, resultYarn.nodes())
     return resultYarn
 
 
+def _quantifierCache(searchExe):
+    S = getattr(searchExe.api, "S", None)
+    return getattr(S, "quantifierCache", None)
+
+
 def spinAtoms(searchExe):
     qnodes = searchExe.qnodes
     for q in range(len(qnodes)):
         _spinAtom(searchExe, q)
 
 
+def _sample(nodes, limit):
+    # a deterministic sample: evenly spread over the nodes in node order
+    nodes = sorted(nodes)
+    if len(nodes) <= limit:
+        return nodes
+    step = len(nodes) / limit
+    return [nodes[int(i * step)] for i in range(limit)]
+
+
+def _statSpread(searchExe, rela, f, t):
+    # The spread of a relation according to the statistics of the corpus,
+    # for the relations for which these are known.
+    # The spread for the type of t is scaled down to the yarn of t.
+    # Returns None if the statistics have nothing to say.
+
+    (typeCounts, embedCounts) = searchExe.api.C.stats.data
+    acro = searchExe.relations[rela]["acro"]
+    if acro not in {"]]", "[[", "="}:
+        return None
+    fType = searchExe.qnodes[f][0]
+    tType = searchExe.qnodes[t][0]
+    fCount = typeCounts.get(fType, None)
+    tCount = typeCounts.get(tType, None)
+    if not fCount or not tCount:
+        return None
+    yarnFraction = len(searchExe.yarns[t]) / tCount
+    if acro == "=":
+        return yarnFraction if fType == tType else 0
+    pair = (fType, tType) if acro == "]]" else (tType, fType)
+    return embedCounts.get(pair, 0) / fCount * yarnFraction
+
+
 def estimateSpreads(searchExe, both=False):
     TRY_LIMIT_F = searchExe.perfParams["tryLimitFrom"]
     TRY_LIMIT_T = searchExe.perfParams["tryLimitTo"]
@@ -258,13 +430,13 @@ def estimateSpreads(searchExe, both=False):
                 # fixed estimates
                 dest[e] = len(yarnT) * s
                 continue
-            yarnF = list(yarnF)
-            yarnT = yarns[tt]
-            yarnFl = len(yarnF)
-            if yarnFl < TRY_LIMIT_F:
-                triesn = yarnF
-            else:
-                triesn = set(yarnF[randrange(yarnFl)] for n in range(TRY_LIMIT_F))
+            spread = _statSpread(searchExe, trela, tf, tt)
+            if spread is not None:
+                dest[e] = spread
+                continue
+
+            # estimates by trying a sample of the nodes
+            triesn = _sample(yarnF, TRY_LIMIT_F)
 
             if len(triesn) == 0:
                 dest[e] = 0
@@ -278,15 +450,8 @@ def estimateSpreads(searchExe, both=False):
                         totalSpread += len(mFromN)
                 else:
                     yarnTl = len(yarnT)
-                    yarnTL = list(yarnT)
+                    triesm = _sample(yarnT, TRY_LIMIT_T)
                     for n in triesn:
-                        triesm = (
-                            yarnT
-                            if yarnTl < TRY_LIMIT_T
-                            else set(
-                                yarnTL[randrange(yarnTl)] for m in range(TRY_LIMIT_T)
-                            )
-                        )
                         if len(triesm) == 0:
                             thisSpread = 0
                         else:
@@ -337,10 +502,13 @@ def _spinEdge(searchExe, e):
     # condition for skipping: spread times length from-yarn >= SPIN_LIMIT
     yarnFl = len(yarnF)
     yarnTl = len(yarnT)
+    # if the estimated spread is 0, spinning is likely to remove a lot
     thisYarnRatio = (
-        max((yarnFl / yarnTl, yarnTl / yarnFl)) / spreads[e]
-        if yarnFl and yarnTl and spreads[e]
-        else -YARN_RATIO
+        -YARN_RATIO
+        if not yarnFl or not yarnTl
+        else YARN_RATIO
+        if not spreads[e]
+        else max((yarnFl / yarnTl, yarnTl / yarnFl)) / spreads[e]
     )
     if thisYarnRatio < YARN_RATIO:
         return False
@@ -358,29 +526,7 @@ def _spinEdge(searchExe, e):
         (newYarnF, newYarnT) = s(qnodes[f][0], qnodes[t][0])(yarnF, yarnT)
     else:
         r = relations[rela]["func"](qnodes[f][0], qnodes[t][0])
-        nparams = len(signature(r).parameters)
-        newYarnF = set()
-        newYarnT = set()
-
-        if nparams == 1:
-            for n in yarnF:
-                found = False
-                for m in r(n):
-                    if m not in yarnT:
-                        continue
-                    newYarnT.add(m)
-                    found = True
-                if found:
-                    newYarnF.add(n)
-        else:
-            for n in yarnF:
-                found = False
-                for m in yarnT:
-                    if r(n, m):
-                        newYarnT.add(m)
-                        found = True
-                if found:
-                    newYarnF.add(n)
+        (newYarnF, newYarnT) = spinByRelation(r, yarnF, yarnT)
 
     affectedF = len(newYarnF) != len(yarns[f])
     affectedT = len(newYarnT) != len(yarns[t])
@@ -391,17 +537,50 @@ def _spinEdge(searchExe, e):
             continue
         if (affectedF and f in {of, ot}) or (affectedT and t in {of, ot}):
             uptodate[oe] = False
-    searchExe.yarns[f] = newYarnF
-    searchExe.yarns[t] = newYarnT
+    size = len(yarnF.bits)
+    searchExe.yarns[f] = Yarn.fromNodes(newYarnF, size)
+    searchExe.yarns[t] = Yarn.fromNodes(newYarnT, size)
 
     return affectedF or affectedT
 
 
+def spinByRelation(r, yarnF, yarnT):
+    # the generic spin: the nodes of both yarns that take part in the relation,
+    # found by the relation function itself
+
+    nparams = len(signature(r).parameters)
+    newYarnF = set()
+    newYarnT = set()
+
+    if nparams == 1:
+        bitsT = yarnT.bits
+        for n in yarnF:
+            found = False
+            for m in r(n):
+                if not bitsT[m]:
+                    continue
+                newYarnT.add(m)
+                found = True
+            if found:
+                newYarnF.add(n)
+    else:
+        for n in yarnF:
+            found = False
+            for m in yarnT:
+                if r(n, m):
+                    newYarnT.add(m)
+                    found = True
+            if found:
+                newYarnF.add(n)
+    return (newYarnF, newYarnT)
+
+
 def spinEdges(searchExe):
     qnodes = searchExe.qnodes
     qedges = searchExe.qedges
     yarns = searchExe.yarns
     uptodate = searchExe.uptodate
+    profile = searchExe.profile
     thinned = {}
 
     estimateSpreads(searchExe, both=True)
@@ -416,7 +595,10 @@ def spinEdges(searchExe):
             break
         e = _chooseEdge(searchExe)
         (f, rela, t) = qedges[e]
+        before = (len(yarns[f]), len(yarns[t]))
         affected = _spinEdge(searchExe, e)
+        if profile is not None:
+            profile.spins.append((e, before, (len(yarns[f]), len(yarns[t]))))
         if affected:
             thinned[e] = 1
         it += 1
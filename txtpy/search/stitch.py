@@ -1,9 +1,23 @@
 
+import os
 import types
-from itertools import chain
+import atexit
+import pickle
+import tempfile
+import threading
+import multiprocessing
+from functools import lru_cache
+from itertools import chain, count
 from inspect import signature
 from .spin import estimateSpreads
 from .graph import multiEdges
+from .profile import countedRelation
+from .yarn import Yarn
+from ..parameters import PICKLE_PROTOCOL
+
+# number of shards per worker in parallel stitching:
+# more shards give a smoother stream of results and a better load balance
+SHARDS_PER_WORKER = 8
 
 # STITCHING: STRATEGIES ###
 
@@ -15,6 +29,12 @@ STRATEGY = """
     big_choice_first
 """.strip().split()
 
+# the strategies that can start the plan with a given node
+ROOTED_STRATEGY = """
+    small_choice_multi
+    small_choice_first
+""".strip().split()
+
 
 def setStrategy(searchExe, strategy, keep=False):
     error = searchExe.api.TF.error
@@ -176,7 +196,7 @@ def _small_choice_first(searchExe):
     qedges = searchExe.qedges
     qnodes = searchExe.qnodes
 
-    newNodes = {sorted(range(len(qnodes)), key=lambda x: len(searchExe.yarns[x]))[0]}
+    newNodes = {_planStart(searchExe)}
     newEdges = []
     doneEdges = set()
 
@@ -270,7 +290,7 @@ def _small_choice_multi(searchExe):
         spreads[curE] = minSpread / 10
         curE += 1
 
-    newNodes = {sorted(range(len(qnodes)), key=lambda x: len(yarns[x]))[0]}
+    newNodes = {_planStart(searchExe)}
     newEdges = []
     doneEdges = set()
 
@@ -353,6 +373,16 @@ def _small_choice_multi(searchExe):
     searchExe.removedEdges = removedEdges
 
 
+def _planStart(searchExe):
+    # the node with the smallest yarn,
+    # unless the plan must start with a given node
+    planRoot = searchExe.planRoot
+    if planRoot is not None:
+        return planRoot
+    yarns = searchExe.yarns
+    return sorted(range(len(searchExe.qnodes)), key=lambda x: len(yarns[x]))[0]
+
+
 def _by_yarn_size(searchExe):
 
     # This strategy is like small choice first,
@@ -386,7 +416,7 @@ def _by_yarn_size(searchExe):
         spre = spr[e]
         return spre * yFl * yTl
 
-    newNodes = {sorted(range(len(qnodes)), key=lambda x: len(searchExe.yarns[x]))[0]}
+    newNodes = {_planStart(searchExe)}
     newEdges = []
     doneEdges = set()
 
@@ -505,6 +535,11 @@ def _stitchPlan(searchExe, strategy=None):
     setStrategy(searchExe, strategy, keep=True)
     if not searchExe.good:
         return
+    if (
+        searchExe.planRoot is not None
+        and searchExe.strategyName not in ROOTED_STRATEGY
+    ):
+        setStrategy(searchExe, ROOTED_STRATEGY[0])
 
     good = True
 
@@ -566,13 +601,8 @@ In plan    : {newCedgesO}""",
 
 
 def _stitchResults(searchExe):
-    qnodes = searchExe.qnodes
-    qedges = searchExe.qedges
-    plan = searchExe.stitchPlan
-    relations = searchExe.relations
-    converse = searchExe.converse
     yarns = searchExe.yarns
-    firstMulti = searchExe.firstMulti
+    plan = searchExe.stitchPlan
 
     planEdges = plan[1]
     if len(planEdges) == 0:
@@ -581,16 +611,70 @@ def _stitchResults(searchExe):
         yarn = yarns[0]
 
         def deliver(remap=True):
-            for n in yarn:
+            for n in _rankSorted(searchExe, yarn) if searchExe.sort else yarn:
                 yield (n,)
 
         if searchExe.shallow:
-            results = yarn
+            results = set(yarn)
         else:
             results = deliver
         searchExe.results = results
         return
 
+    (deliver, delivered, firstYarn) = _stitchers(searchExe)
+    shallow = searchExe.shallow
+
+    if shallow:
+        pool = _stitchPool(searchExe, firstYarn)
+        if pool:
+            resultSet = set()
+            for shardResults in _stitchParallel(searchExe, pool, firstYarn):
+                resultSet |= shardResults
+            searchExe.results = resultSet
+        else:
+            searchExe.results = delivered()
+    else:
+
+        # in sorted mode, the plan starts with the first node of the template,
+        # and its yarn is stitched in canonical order,
+        # also when the stitching is parallel
+
+        sort = searchExe.sort
+
+        def results(remap=True):
+            pool = _stitchPool(searchExe, firstYarn)
+            canonical = sort and remap
+            if not pool:
+                if not canonical:
+                    return deliver(remap=remap)
+                return _canonicalOrder(
+                    searchExe,
+                    deliver(remap=True, firstYarn=_rankSorted(searchExe, firstYarn)),
+                )
+            queryResults = _flattened(
+                _stitchParallel(searchExe, pool, firstYarn, remap=remap)
+            )
+            if not canonical:
+                return queryResults
+            return _canonicalOrder(searchExe, queryResults)
+
+        searchExe.results = results
+
+
+def _stitchers(searchExe):
+    # the functions that deliver the results and the shallow results,
+    # and the yarn of the first node in the plan
+
+    qnodes = searchExe.qnodes
+    qedges = searchExe.qedges
+    plan = searchExe.stitchPlan
+    relations = searchExe.relations
+    converse = searchExe.converse
+    yarns = searchExe.yarns
+    firstMulti = searchExe.firstMulti
+
+    planEdges = plan[1]
+
     # The next function is optimized, and the lookup of functions and data
     # should be as direct as possible.
     # Because deliver() below fetches the results,
@@ -634,6 +718,11 @@ def _stitchResults(searchExe):
 
     # We start compiling and permuting
 
+    profile = searchExe.profile
+    counters = []
+    if profile is not None:
+        profile.counters = counters
+
     edgesCompiled = []
     qPermuted = []  # row of nodes in the order as will be created during stitching
     qPermutedPos = (
@@ -667,6 +756,18 @@ def _stitchResults(searchExe):
             # have been stitched
             qPermuted.append(f)
             qPermutedPos[f] = len(qPermuted) - 1
+        if profile is not None:
+            counter = [0, 0]
+            counters.append(counter)
+            newTarget = t not in qPermuted
+            r = (
+                tuple(
+                    countedRelation(ri, 2, newTarget, counter, tries=j == 0)
+                    for (j, ri) in enumerate(r)
+                )
+                if isMulti
+                else countedRelation(r, nparams, newTarget, counter)
+            )
         if t not in qPermuted:
             qPermuted.append(t)
             qPermutedPos[t] = len(qPermuted) - 1
@@ -682,15 +783,23 @@ def _stitchResults(searchExe):
 
     shallow = searchExe.shallow
 
-    def deliver(remap=True):
+    def deliver(remap=True, firstYarn=None):
         stitch = [None for q in range(len(qPermuted))]
         lStitch = len(stitch)
         qs = tuple(range(lStitch))
         edgesC = edgesCompiled
         yarnsP = yarnsPermuted
+        bitsP = [yarn.bits for yarn in yarnsPermuted]
+
+        # the number of partial results that reach each step of the plan,
+        # to be compared with the estimates in showPlan()
+        counts = [0 for e in range(len(edgesC) + 1)]
+        searchExe.stepCounts = counts
+        searchExe.stepCountsComplete = False
 
         def stitchOn(e):
             if e >= len(edgesC):
+                counts[e] += 1
                 if remap:
                     yield tuple(stitch[qPermutedPos[q]] for q in qs)
                 else:
@@ -698,15 +807,17 @@ def _stitchResults(searchExe):
                 return
             (f, t, r, nparams, isMulti) = edgesC[e]
             yarnT = yarnsP[t]
+            bitsT = bitsP[t]
             if e == 0 and stitch[f] is None:
                 # this cannot happen for a multi-edge
-                yarnF = yarnsP[f]
+                yarnF = yarnsP[f] if firstYarn is None else firstYarn
                 for sN in yarnF:
                     stitch[f] = sN
                     for s in stitchOn(e):
                         yield s
                 return
 
+            counts[e] += 1
             sM = stitch[t]
 
             # case where sM is already in the graph: just check the conditions
@@ -750,7 +861,7 @@ def _stitchResults(searchExe):
                 sN = stitch[f]
                 if nparams == 1:
                     for m in r(sN) or ():
-                        if m in yarnT:
+                        if bitsT[m]:
                             stitch[t] = m
                             for s in stitchOn(e + 1):
                                 yield s
@@ -765,13 +876,15 @@ def _stitchResults(searchExe):
 
         for s in stitchOn(0):
             yield s
+        searchExe.stepCountsComplete = True
 
-    def delivered():
+    def delivered(firstYarn=None):
         tupleSize = len(qPermuted)
         shallowTupleSize = max(tupleSize, shallow)
         stitch = [None for q in range(tupleSize)]
         edgesC = edgesCompiled
         yarnsP = yarnsPermuted
+        bitsP = [yarn.bits for yarn in yarnsPermuted]
         resultQ = qPermutedPos[0]
         resultQmax = max(qPermutedPos[q] for q in range(shallowTupleSize))
         resultSet = set()
@@ -783,9 +896,10 @@ def _stitchResults(searchExe):
                 return
             (f, t, r, nparams, isMulti) = edgesC[e]
             yarnT = yarnsP[t]
+            bitsT = bitsP[t]
             if e == 0 and stitch[f] is None:
                 # this cannot happen for a multi-edge
-                yarnF = yarnsP[f]
+                yarnF = yarnsP[f] if firstYarn is None else firstYarn
                 if f == resultQmax:
                     for sN in yarnF:
                         if sN in resultSet:
@@ -853,7 +967,7 @@ def _stitchResults(searchExe):
                 sN = stitch[f]
                 if nparams == 1:
                     for m in r(sN):
-                        if m in yarnT:
+                        if bitsT[m]:
                             stitch[t] = m
                             for s in stitchOn(e + 1):
                                 yield s
@@ -877,7 +991,312 @@ def _stitchResults(searchExe):
 
         return resultSet
 
-    if shallow:
-        searchExe.results = delivered()
-    else:
-        searchExe.results = deliver
+    if not shallow and searchExe.perfParams.get("compileStitch", True):
+        compiled = _compiledDeliver(
+            searchExe,
+            edgesCompiled,
+            tuple(qPermutedPos[q] for q in range(len(qPermuted))),
+            yarnsPermuted,
+        )
+        if compiled is not None:
+            deliver = compiled
+
+    return (deliver, delivered, yarnsPermuted[0])
+
+
+# STITCHING: IN CANONICAL ORDER ###
+
+# If the first node of the plan is the first node of the template,
+# and its yarn is stitched in canonical order,
+# the results come in groups with the same first node, in canonical order.
+# Only the groups need to be sorted,
+# so the first results are there without producing all results.
+
+
+def _rankSorted(searchExe, yarn):
+    Crank = searchExe.api.C.rank.data
+    return sorted(yarn, key=lambda n: Crank[n - 1])
+
+
+def _canonicalOrder(searchExe, queryResults):
+    Crank = searchExe.api.C.rank.data
+
+    def sortKey(r):
+        return tuple(Crank[n - 1] for n in r)
+
+    group = []
+    current = None
+    for r in queryResults:
+        if r[0] != current:
+            if len(group) > 1:
+                group.sort(key=sortKey)
+            for s in group:
+                yield s
+            group = []
+            current = r[0]
+        group.append(r)
+    if len(group) > 1:
+        group.sort(key=sortKey)
+    for s in group:
+        yield s
+
+
+# STITCHING: COMPILED ###
+
+# For a plan, we generate a function with one nested loop per edge,
+# that does the same as deliver() above,
+# but without interpreting the compiled edges at every step.
+# The stitch is held in local variables s0, s1, ...,
+# and the relation functions, yarns and bits are locals as well.
+# The generated code only depends on the shape of the plan,
+# so it is compiled once per shape.
+# If the code cannot be compiled, e.g. because there are too many nested
+# loops, we fall back to deliver().
+# The code of the most recently used shapes is kept,
+# by an lru_cache, which searches in several threads can share.
+
+COMPILED_CACHE_SIZE = 256
+
+
+def _compiledDeliver(searchExe, edgesCompiled, resultOrder, yarnsPermuted):
+    shape = (
+        tuple(
+            (f, t, nparams, isMulti)
+            for (f, t, r, nparams, isMulti) in edgesCompiled
+        ),
+        resultOrder,
+    )
+    maker = _compileStitcher(shape)
+    if maker is None:
+        return None
+    return maker(
+        searchExe,
+        [r for (f, t, r, nparams, isMulti) in edgesCompiled],
+        yarnsPermuted,
+        [yarn.bits for yarn in yarnsPermuted],
+    )
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def _compileStitcher(shape):
+    (edges, resultOrder) = shape
+    nEdges = len(edges)
+    nNodes = len(resultOrder)
+
+    code = [
+        "def makeDeliver(searchExe, rels, yarns, bits):",
+    ]
+    for (e, (f, t, nparams, isMulti)) in enumerate(edges):
+        if isMulti:
+            for i in range(len(f)):
+                code.append(f"    r{e}_{i} = rels[{e}][{i}]")
+        else:
+            code.append(f"    r{e} = rels[{e}]")
+    for q in range(nNodes):
+        code.append(f"    y{q} = yarns[{q}]")
+        code.append(f"    b{q} = bits[{q}]")
+    code.extend(
+        [
+            "",
+            "    def deliver(remap=True, firstYarn=None):",
+            f"        counts = [0] * {nEdges + 1}",
+            "        searchExe.stepCounts = counts",
+            "        searchExe.stepCountsComplete = False",
+            "        for s0 in y0 if firstYarn is None else firstYarn:",
+        ]
+    )
+
+    bound = {0}
+    ind = " " * 12
+    for (e, (f, t, nparams, isMulti)) in enumerate(edges):
+        if isMulti:
+            if any(x not in bound for x in f):
+                return None
+            cond = " and ".join(f"r{e}_{i}(s{x}, s{t})" for (i, x) in enumerate(f))
+        else:
+            if f not in bound:
+                return None
+            cond = (
+                f"s{t} in r{e}(s{f})" if nparams == 1 else f"r{e}(s{f}, s{t})"
+            )
+        code.append(f"{ind}counts[{e}] += 1")
+        if t in bound:
+            code.append(f"{ind}if {cond}:")
+            ind += " " * 4
+            continue
+        if nparams == 1 and not isMulti:
+            code.append(f"{ind}for s{t} in r{e}(s{f}) or ():")
+            code.append(f"{ind}    if b{t}[s{t}]:")
+        else:
+            code.append(f"{ind}for s{t} in y{t}:")
+            code.append(f"{ind}    if {cond}:")
+        ind += " " * 8
+        bound.add(t)
+
+    if len(bound) != nNodes:
+        return None
+    remapped = "".join(f"s{q}, " for q in resultOrder)
+    plain = "".join(f"s{q}, " for q in range(nNodes))
+    code.extend(
+        [
+            f"{ind}counts[{nEdges}] += 1",
+            f"{ind}yield ({remapped}) if remap else ({plain})",
+            "        searchExe.stepCountsComplete = True",
+            "",
+            "    return deliver",
+        ]
+    )
+
+    namespace = {}
+    try:
+        exec(compile("\n".join(code), "<stitcher>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError):
+        return None
+    return namespace["makeDeliver"]
+
+
+# STITCHING: IN PARALLEL ###
+
+# The yarn of the first node in the plan is divided into shards,
+# in canonical order, and the shards are stitched by a pool of processes.
+# The pool belongs to the Search object: it is forked once, from the main thread,
+# when a search first asks for workers, and forked again when the number
+# of workers or the loaded features change.
+# So the workers share all data of the api with the main process.
+# Relation functions cannot be sent to a worker, so a worker builds the search
+# again from its template, and takes the plan and the yarns of the main process
+# from a file that is written once per parallel stitch.
+# The results of the shards are delivered in the order of the shards,
+# as soon as they are available.
+# Forking while other threads run is not safe, so searches in other threads,
+# such as asearch(), stitch sequentially.
+
+# the api and the last search that a worker has built;
+# every parallel stitch has its own key
+_workerApi = None
+_workerSearch = (None, None)
+_stitchKeys = count()
+
+
+class StitchPool(object):
+
+    def __init__(self, api, workers, fingerprint=None):
+        self.workers = workers
+        self.fingerprint = fingerprint
+        self.pool = multiprocessing.get_context("fork").Pool(
+            workers, initializer=_initWorker, initargs=(api,)
+        )
+        atexit.register(self.close)
+
+    def close(self):
+        atexit.unregister(self.close)
+        self.pool.terminate()
+
+
+def _initWorker(api):
+    global _workerApi
+
+    _workerApi = api
+
+
+def _stitchPool(searchExe, firstYarn):
+    workers = searchExe.workers
+    if (
+        not workers
+        or workers < 2
+        or len(firstYarn) < 2
+        or "fork" not in multiprocessing.get_all_start_methods()
+    ):
+        return None
+    if threading.current_thread() is not threading.main_thread():
+        searchExe.api.TF.warning(
+            "Parallel stitching only happens in the main thread, stitching with 1 worker",
+            cache=searchExe._msgCache,
+        )
+        return None
+    return searchExe.api.S.stitchPool(workers)
+
+
+def _workerStitchers(key, statePath):
+    # the stitchers of the search whose state is in statePath
+    global _workerSearch
+
+    from .searchexe import SearchExe
+
+    (lastKey, stitchers) = _workerSearch
+    if lastKey == key:
+        return stitchers
+    with open(statePath, "rb") as fh:
+        state = pickle.load(fh)
+    exe = SearchExe(
+        _workerApi,
+        state["template"],
+        sets=state["sets"],
+        shallow=state["shallow"],
+        silent=True,
+        _msgCache=[],
+        perfParams=state["perfParams"],
+    )
+    exe._parse()
+    exe.qedges = state["qedges"]
+    exe.firstMulti = state["firstMulti"]
+    exe.stitchPlan = state["stitchPlan"]
+    exe.yarns = {q: Yarn(bits) for (q, bits) in state["yarns"].items()}
+    stitchers = _stitchers(exe)
+    _workerSearch = (key, stitchers)
+    return stitchers
+
+
+def _stitchShard(job):
+    (key, statePath, shard, remap) = job
+    if not os.path.exists(statePath):
+        return None
+    (deliver, delivered, firstYarn) = _workerStitchers(key, statePath)
+    if remap is None:
+        return delivered(firstYarn=shard)
+    return list(deliver(remap=remap, firstYarn=shard))
+
+
+def _flattened(shards):
+    # closing the results closes the shards as well
+
+    try:
+        for shardResults in shards:
+            yield from shardResults
+    finally:
+        shards.close()
+
+
+def _stitchParallel(searchExe, pool, firstYarn, remap=None):
+    # remap is None for shallow results: then each shard yields a set
+
+    workers = pool.workers
+    nodes = _rankSorted(searchExe, firstYarn)
+    nShards = min((workers * SHARDS_PER_WORKER, len(nodes)))
+    size = -(-len(nodes) // nShards)
+
+    state = dict(
+        template=searchExe.searchTemplate,
+        sets=searchExe.sets,
+        shallow=searchExe.shallow,
+        perfParams=searchExe.perfParams,
+        qedges=searchExe.qedges,
+        firstMulti=searchExe.firstMulti,
+        stitchPlan=searchExe.stitchPlan,
+        yarns={q: yarn.bits for (q, yarn) in searchExe.yarns.items()},
+    )
+    (fd, statePath) = tempfile.mkstemp(prefix="tf-stitch-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(state, fh, protocol=PICKLE_PROTOCOL)
+        key = (os.getpid(), next(_stitchKeys))
+        jobs = [
+            (key, statePath, nodes[i : i + size], remap)
+            for i in range(0, len(nodes), size)
+        ]
+        for shardResults in pool.pool.imap(_stitchShard, jobs):
+            yield shardResults
+    finally:
+        # the shards that have not started yet, see that the file is gone,
+        # and are skipped
+        os.unlink(statePath)